@@ -1 +1,2 @@
 from piasi_reader.iasi_l1c_native_file import IasiL1cNativeFile
+from piasi_reader.stream_reader import IasiL1cStreamReader
@@ -0,0 +1,192 @@
+"""
+Piasi-reader: a library to read and convert the native IASI L1C files
+Copyright (C) 2015  Stefano Piani
+
+This library is free software; you can redistribute it and/or
+modify it under the terms of the GNU Lesser General Public
+License as published by the Free Software Foundation; either
+version 3.0 of the License, or (at your option) any later version.
+
+This library is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with this library; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+import argparse
+import sys
+
+from piasi_reader.iasi_l1c_native_file import IasiL1cNativeFile, FBF_FILE_NAMES
+from piasi_reader.validation import validate_files
+from piasi_reader import server
+from piasi_reader.watcher import DirectoryWatcher, convert_handler
+
+
+def _data_type(value):
+    if '=' not in value:
+        raise argparse.ArgumentTypeError(
+            'Data types must be written as FIELD=TYPE, not ' + value)
+    field, data_type = value.split('=', 1)
+    return field.strip(), data_type.strip()
+
+
+def convert(args):
+    fields = args.fields.split(',') if args.fields else list(FBF_FILE_NAMES)
+    data_types = dict(args.dtype)
+    for input_file in args.input_files:
+        iasi_file = IasiL1cNativeFile(input_file, readahead=args.readahead)
+        paths = iasi_file.save_all(args.output_dir,
+                                   fields,
+                                   data_types,
+                                   lines_per_chunk=args.lines_per_chunk)
+        for field, path in paths.items():
+            print(field + ': ' + path)
+
+
+def validate(args):
+    n_of_invalid = 0
+    for report in validate_files(args.input_files, args.jobs):
+        if not report.valid:
+            n_of_invalid += 1
+        if not args.quiet or not report.valid:
+            print(report)
+    return 1 if n_of_invalid > 0 else 0
+
+
+def serve(args):
+    print('Serving on http://{}:{}'.format(args.host, args.port))
+    server.serve(args.host, args.port, int(args.memory * 1024**2), args.root,
+                 args.verbose)
+
+
+def watch(args):
+    fields = args.fields.split(',') if args.fields else list(FBF_FILE_NAMES)
+    handler = convert_handler(args.output_dir, fields,
+                              dict(args.dtype),
+                              args.lines_per_chunk)
+    watcher = DirectoryWatcher(args.directory, handler,
+                               patterns=args.pattern or ('*.nat',),
+                               state_file=args.state,
+                               n_workers=args.jobs,
+                               poll_interval=args.poll_interval)
+    print('Watching ' + args.directory)
+    watcher.run()
+
+
+def argument_parser():
+    parser = argparse.ArgumentParser(
+        prog='python -m piasi_reader',
+        description='Read and convert the native IASI L1C files')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    convert_parser = subparsers.add_parser(
+        'convert',
+        help='save the fields of a native file on flat binary files')
+    convert_parser.add_argument('input_files', nargs='+',
+                                help='the native files to convert')
+    convert_parser.add_argument('-o', '--output-dir', default='.',
+                                help='the directory of the output files')
+    convert_parser.add_argument('-f', '--fields', default=None,
+                                help='a comma separated list of the fields '
+                                     'to save (default: ' +
+                                     ','.join(FBF_FILE_NAMES) + ')')
+    convert_parser.add_argument('-t', '--dtype', action='append', default=[],
+                                type=_data_type,
+                                help='the data type of a field, like '
+                                     'radiances=float32 (can be repeated)')
+    convert_parser.add_argument('-l', '--lines-per-chunk', type=int,
+                                default=1,
+                                help='the number of scan lines read at a time')
+    convert_parser.add_argument('-r', '--readahead', type=int, default=0,
+                                help='the number of blocks of scan lines '
+                                     'read in advance (default: 0)')
+    convert_parser.set_defaults(function=convert)
+
+    validate_parser = subparsers.add_parser(
+        'validate',
+        help='check the structure of many native files reading only the '
+             'headers of their records')
+    validate_parser.add_argument('input_files', nargs='+',
+                                 help='the native files to check')
+    validate_parser.add_argument('-j', '--jobs', type=int, default=None,
+                                 help='the number of parallel processes '
+                                      '(default: one for each processor)')
+    validate_parser.add_argument('-q', '--quiet', action='store_true',
+                                 help='report only the invalid files')
+    validate_parser.set_defaults(function=validate)
+
+    serve_parser = subparsers.add_parser(
+        'serve',
+        help='start a local server that keeps the files open and answers '
+             'to queries on their fields')
+    serve_parser.add_argument('--host', default=server.DEFAULT_HOST,
+                              help='the address where the server listens '
+                                   '(default: %(default)s)')
+    serve_parser.add_argument('-p', '--port', type=int,
+                              default=server.DEFAULT_PORT,
+                              help='the port where the server listens '
+                                   '(default: %(default)s)')
+    serve_parser.add_argument('-m', '--memory', type=float,
+                              default=server.DEFAULT_MEMORY_BUDGET / 1024**2,
+                              help='the memory budget of the open files, in '
+                                   'MiB (default: %(default)s)')
+    serve_parser.add_argument('-r', '--root', default='.',
+                              help='serve only the files inside this '
+                                   'directory (default: the current '
+                                   'directory)')
+    serve_parser.add_argument('-v', '--verbose', action='store_true',
+                              help='log every request')
+    serve_parser.set_defaults(function=serve)
+
+    watch_parser = subparsers.add_parser(
+        'watch',
+        help='convert every native file that appears inside a directory')
+    watch_parser.add_argument('directory', help='the directory to watch')
+    watch_parser.add_argument('-o', '--output-dir', default='.',
+                              help='the directory where a subdirectory with '
+                                   'the output files of every native file is '
+                                   'created')
+    watch_parser.add_argument('-f', '--fields', default=None,
+                              help='a comma separated list of the fields '
+                                   'to save (default: ' +
+                                   ','.join(FBF_FILE_NAMES) + ')')
+    watch_parser.add_argument('-t', '--dtype', action='append', default=[],
+                              type=_data_type,
+                              help='the data type of a field, like '
+                                   'radiances=float32 (can be repeated)')
+    watch_parser.add_argument('-l', '--lines-per-chunk', type=int,
+                              default=1,
+                              help='the number of scan lines read at a time')
+    watch_parser.add_argument('-p', '--pattern', action='append',
+                              default=[],
+                              help='the pattern of the names of the files to '
+                                   'convert (default: *.nat; can be '
+                                   'repeated)')
+    watch_parser.add_argument('-s', '--state', default=None,
+                              help='a JSON file where the converted files '
+                                   'are saved, so that they are not '
+                                   'converted again after a restart')
+    watch_parser.add_argument('-j', '--jobs', type=int, default=2,
+                              help='the number of files converted at the '
+                                   'same time (default: %(default)s)')
+    watch_parser.add_argument('-i', '--poll-interval', type=float,
+                              default=1.,
+                              help='the number of seconds between two scans '
+                                   'of the directory (default: %(default)s)')
+    watch_parser.set_defaults(function=watch)
+
+    return parser
+
+
+def main(argv=None):
+    args = argument_parser().parse_args(argv)
+    return args.function(args) or 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
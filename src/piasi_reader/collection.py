@@ -0,0 +1,194 @@
+"""
+Piasi-reader: a library to read and convert the native IASI L1C files
+Copyright (C) 2015  Stefano Piani
+
+This library is free software; you can redistribute it and/or
+modify it under the terms of the GNU Lesser General Public
+License as published by the Free Software Foundation; either
+version 3.0 of the License, or (at your option) any later version.
+
+This library is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with this library; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+from __future__ import division
+
+from concurrent.futures import ProcessPoolExecutor
+from os.path import join
+
+import numpy as np
+
+from piasi_reader.iasi_l1c_native_file import IasiL1cNativeFile, FBF_FILE_NAMES
+from piasi_reader.records.grh import read_record_directory
+from piasi_reader.sources import open_native_file
+from piasi_reader.utilities import fbf_file_name
+
+
+def count_mdrs(filename):
+    """
+    Return the number of mdr records (i.e. of scan lines) of a native file,
+    reading only the grhs of its records.
+
+    Args:
+        - *filename*: the path of the file
+
+    Returns:
+        An integer
+    """
+    with open_native_file(filename) as f:
+        directory = read_record_directory(f)
+    return len([grh for _, grh in directory if grh.record_class == 'MDR'])
+
+
+def _fill_slice(filename, first_line, outputs, lines_per_chunk):
+    """
+    Write the fields of a file inside the memory mapped outputs, starting
+    from the line first_line. outputs is a list of tuples (field, path,
+    data type, shape of the whole output, rows for each scan line).
+    """
+    iasi_file = IasiL1cNativeFile(filename)
+    memmaps = [(field, np.memmap(path, dtype=data_type, mode='r+',
+                                 shape=shape), rows_per_line)
+               for field, path, data_type, shape, rows_per_line in outputs]
+
+    fields = [field for field, _, _ in memmaps]
+    for chunk in iasi_file.iter_chunks(fields, lines_per_chunk):
+        lines = chunk['lines']
+        for field, output, rows_per_line in memmaps:
+            start = (first_line + lines.start) * rows_per_line
+            end = (first_line + lines.stop) * rows_per_line
+            values = np.asarray(chunk[field])
+            expected_shape = (end - start,) + output.shape[1:]
+            # A different shape could be broadcast on the output without
+            # errors: the files of a collection must agree on the shapes
+            if values.shape != expected_shape:
+                raise ValueError(
+                    'The field {} of the file {} has shape {} for {} scan '
+                    'lines, while the output of the collection expects '
+                    '{}'.format(field, filename, values.shape,
+                                lines.stop - lines.start, expected_shape))
+            output[start:end] = values
+
+    for _, output, _ in memmaps:
+        output.flush()
+    return iasi_file.n_of_lines
+
+
+class IasiL1cCollection(object):
+    """
+    A sequence of native files that must be read as if they were a single
+    file, for example all the granules of a day.
+
+    Args:
+        - *filenames*: a list with the paths of the files
+    """
+    def __init__(self, filenames):
+        self.__filenames = list(filenames)
+        self.__lines_per_file = None
+
+    @property
+    def filenames(self):
+        """
+        The list of the paths of the files of the collection
+        """
+        return list(self.__filenames)
+
+    @property
+    def lines_per_file(self):
+        """
+        A list with the number of scan lines of each file; the value is
+        computed reading only the grhs of the records of the files
+        """
+        if self.__lines_per_file is None:
+            self.__lines_per_file = [count_mdrs(f) for f in self.__filenames]
+        return list(self.__lines_per_file)
+
+    @property
+    def n_of_lines(self):
+        """
+        The total number of scan lines of the files of the collection
+        """
+        return sum(self.lines_per_file)
+
+    def export(self, output_dir='.', fields=tuple(FBF_FILE_NAMES),
+               data_types=None, file_names=None, n_workers=1,
+               lines_per_chunk=10):
+        """
+        Save some fields of all the files of the collection on flat binary
+        files (one for each field), concatenating the data of the files.
+
+        The output files are allocated in advance and every file of the
+        collection writes its data directly on its slice of the outputs
+        through a memory map, a few scan lines at a time; therefore, the
+        memory used does not depend on the number of files. Since the
+        slices are disjoint, the files can be processed in parallel.
+
+        Args:
+            - *output_dir*: the directory where the files will be saved
+            - *fields*: the names of the fields to save (like "latitudes"
+              or "radiances")
+            - *data_types*: a dictionary that associates to some fields the
+              data type used to save them
+            - *file_names*: a dictionary that associates to some fields the
+              name of their output file (without the suffixes with the data
+              type and the shape)
+            - *n_workers*: the number of processes that fill the outputs
+            - *lines_per_chunk*: the number of scan lines read at a time
+
+        Returns:
+            A dictionary that associates to each field the path of its file
+        """
+        if data_types is None:
+            data_types = {}
+        if file_names is None:
+            file_names = {}
+
+        lines_per_file = self.lines_per_file
+        n_of_lines = sum(lines_per_file)
+        if n_of_lines == 0:
+            raise ValueError('The files of the collection have no scan lines')
+
+        # Read the first scan line to know the shape of the fields
+        first_file = [f for f, n in zip(self.__filenames, lines_per_file)
+                      if n > 0][0]
+        sample_file = IasiL1cNativeFile(first_file)
+
+        outputs = []
+        paths = {}
+        for field in fields:
+            sample = np.asarray(getattr(sample_file, 'get_' + field)(lines=[0]))
+            data_type = np.dtype(data_types.get(field, sample.dtype))
+            rows_per_line = sample.shape[0]
+            shape = (n_of_lines * rows_per_line,) + sample.shape[1:]
+
+            file_name = file_names.get(field, FBF_FILE_NAMES.get(field, field))
+            path = join(output_dir, fbf_file_name(file_name, data_type, shape))
+            output = np.memmap(path, dtype=data_type, mode='w+', shape=shape)
+            del output
+
+            outputs.append((field, path, data_type, shape, rows_per_line))
+            paths[field] = path
+        del sample_file
+
+        first_lines = np.cumsum([0] + lines_per_file[:-1])
+        jobs = [(f, int(first_line), outputs, lines_per_chunk)
+                for f, first_line, n in zip(self.__filenames, first_lines,
+                                            lines_per_file)
+                if n > 0]
+
+        if n_workers > 1:
+            with ProcessPoolExecutor(n_workers) as executor:
+                futures = [executor.submit(_fill_slice, *job) for job in jobs]
+                for future in futures:
+                    future.result()
+        else:
+            for job in jobs:
+                _fill_slice(*job)
+
+        return paths
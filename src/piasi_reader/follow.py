@@ -0,0 +1,131 @@
+"""
+Piasi-reader: a library to read and convert the native IASI L1C files
+Copyright (C) 2015  Stefano Piani
+
+This library is free software; you can redistribute it and/or
+modify it under the terms of the GNU Lesser General Public
+License as published by the Free Software Foundation; either
+version 3.0 of the License, or (at your option) any later version.
+
+This library is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with this library; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+import time
+
+import numpy as np
+
+from piasi_reader.iasi_l1c_native_file import IasiL1cNativeFile
+
+
+class FollowedFields(object):
+    """
+    The arrays of some fields of a file that is still being written: every
+    time update is called, the new scan lines of the file are read (and
+    only them) and their values are appended to the arrays.
+
+    Args:
+        - *iasi_file*: a IasiL1cNativeFile opened in follow mode
+        - *fields*: the names of the fields (like "radiances")
+    """
+    def __init__(self, iasi_file, fields):
+        self.__file = iasi_file
+        self.__fields = tuple(fields)
+        self.__parts = dict((field, []) for field in self.__fields)
+        self.__n_of_lines = 0
+        self.update()
+
+    @property
+    def file(self):
+        return self.__file
+
+    @property
+    def n_of_lines(self):
+        """
+        The number of scan lines whose values are in the arrays
+        """
+        return self.__n_of_lines
+
+    def update(self):
+        """
+        Read the new scan lines of the file and append their values to the
+        arrays
+
+        Returns:
+            A slice with the indices of the new scan lines
+        """
+        self.__file.refresh()
+        new_lines = slice(self.__n_of_lines, self.__file.n_of_lines)
+        if new_lines.start == new_lines.stop:
+            return new_lines
+        for chunk in self.__file.iter_chunks(self.__fields,
+                                             new_lines.stop - new_lines.start,
+                                             lines=new_lines):
+            for field in self.__fields:
+                self.__parts[field].append(chunk[field])
+        self.__n_of_lines = new_lines.stop
+        return new_lines
+
+    def __getitem__(self, field):
+        parts = self.__parts[field]
+        if len(parts) == 0:
+            raise ValueError('No scan line has been read yet')
+        if len(parts) > 1:
+            # Join the parts only once, when the array is requested
+            parts[:] = [np.concatenate(parts)]
+        return parts[0]
+
+    def __contains__(self, field):
+        return field in self.__parts
+
+    def __iter__(self):
+        return iter(self.__fields)
+
+
+def follow(filename, fields, lines_per_chunk=1, poll_interval=1.,
+           timeout=None):
+    """
+    Read a file while it is being written, yielding the values of some
+    fields for the new scan lines as soon as they have been written; the
+    file is checked every poll_interval seconds. The generator ends when
+    the file is complete (see IasiL1cNativeFile.complete) or when no new
+    data have been written for timeout seconds.
+
+    Args:
+        - *filename*: the path of the file
+        - *fields*: the names of the fields (like "radiances")
+        - *lines_per_chunk*: the maximum number of scan lines of each
+          dictionary
+        - *poll_interval*: the number of seconds between two checks of the
+          file
+        - *timeout*: None or the maximum number of seconds to wait for new
+          data
+
+    Returns:
+        A generator of dictionaries like the ones of
+        IasiL1cNativeFile.iter_chunks
+    """
+    iasi_file = IasiL1cNativeFile(filename, follow=True)
+    new_lines = slice(0, iasi_file.n_of_lines)
+    last_change = time.time()
+    while True:
+        if new_lines.start != new_lines.stop:
+            last_change = time.time()
+            for chunk in iasi_file.iter_chunks(fields, lines_per_chunk,
+                                               lines=new_lines):
+                yield chunk
+        if iasi_file.complete:
+            return
+        if timeout is not None and time.time() - last_change > timeout:
+            return
+        time.sleep(poll_interval)
+        size = iasi_file.size
+        new_lines = iasi_file.refresh()
+        if iasi_file.size != size:
+            last_change = time.time()
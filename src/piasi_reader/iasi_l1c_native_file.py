@@ -20,16 +20,72 @@ Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
 from __future__ import print_function, division
 
 import numpy as np
-from os.path import getsize, join
-from os import rename
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from io import BytesIO
+from struct import error as struct_error
+from os.path import abspath, join
+from os import getpid, rename
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock, RLock, local
 
 from piasi_reader.records.record_content import uninterpreted_content
-from piasi_reader.records.grh import GRH
-from piasi_reader.records.mdr import MDR
+from piasi_reader.records.grh import GRH, InvalidRecordException
+from piasi_reader.records.mdr import (MDR, read_mdr_field, mdr_record_size,
+                                      mdr_layout)
 from piasi_reader.records.mphr import MPHR
 from piasi_reader.records.giadr import GIADR_quality, GIADR_scale_factors
 
-from piasi_reader.parameters import PN, SNOT
+from piasi_reader.utilities import (decode_vint, fbf_file_name, grh_time,
+                                    copy_file_ranges, where_greater)
+from piasi_reader.thinning import (grid_boxes, best_in_boxes,
+                                   SuperObservations)
+from piasi_reader.iis import footprint_masks, footprint_statistics
+from piasi_reader.lazy import FieldMapping
+from piasi_reader.sources import (compression_type, open_native_file,
+                                  SequentialReader)
+from piasi_reader.storage import (LocalFileStorage, ReadaheadScheduler,
+                                  HttpRangeStorage, StorageReader, is_url)
+from piasi_reader.shared import share, empty_shared_array, release
+from piasi_reader.spectral import SpectralOperator
+from piasi_reader.parameters import IMCO, IMLI, NBK, NCL, PN, SGI, SNOT, SS
+
+
+# The fields that can be saved on flat binary files, with the default name
+# of the file (the same used by the save_* methods)
+FBF_FILE_NAMES = OrderedDict([('latitudes', 'iasi_latitude'),
+                              ('longitudes', 'iasi_longitude'),
+                              ('radiances', 'iasi_radiance'),
+                              ('zenith_angles', 'iasi_zenith'),
+                              ('solar_zenith_angles', 'solar_zenith'),
+                              ('solar_azimuth_angles', 'solar_azimuth'),
+                              ('avhrr_cloud_fractions', 'avhrr_cloud_fraction'),
+                              ('land_fractions', 'land_fraction'),
+                              ('date_day', 'observation_date_day'),
+                              ('date_msec', 'observation_date_msec')])
+
+# The fields with a value for each pixel that can be read directly from the
+# file, without interpreting the mdr records: the name of the field on the
+# file, its data type, the index along its last axis and its scale factor
+_RAW_PIXEL_FIELDS = {
+    'longitudes': ('GGeoSondLoc', '>i4', 0, 1e06),
+    'latitudes': ('GGeoSondLoc', '>i4', 1, 1e06),
+    'zenith_angles': ('GGeoSondAnglesMETOP', '>i4', 0, 1e06),
+    'solar_zenith_angles': ('GGeoSondAnglesSUN', '>i4', 0, 1e06),
+    'solar_azimuth_angles': ('GGeoSondAnglesSUN', '>i4', 1, 1e06),
+    'avhrr_cloud_fractions': ('GEUMAvhrr1BCldFrac', 'u1', None, None),
+    'land_fractions': ('GEUMAvhrr1BLandFrac', 'u1', None, None)}
+
+
+# The default columns of the table returned by get_observations
+OBSERVATION_FIELDS = ('latitudes', 'longitudes', 'zenith_angles',
+                      'solar_zenith_angles', 'solar_azimuth_angles',
+                      'avhrr_cloud_fractions', 'land_fractions', 'obs_times',
+                      'quality_flags')
+
+# How many grhs of the following mdr records are requested together when
+# the headers are read from a remote storage
+_PREFETCHED_GRHS = 64
 
 
 class MphrNotFoundException(Exception):
@@ -138,43 +194,469 @@ class Record(object):
             -*f*: A file descriptor
 
         Returns:
-            A Record object
+            A Record object, or None if the file is already at its end
+
+        Raises:
+            InvalidRecordException if the record is truncated or if it can
+            not be interpreted
         """
         grh = GRH.read_grh(f)
-        if grh.record_class == 'MPHR':
-            content = MPHR.read_mphr(f, grh)
-        elif grh.record_class == 'GIADR':
-            if grh.record_subclass == 0:
-                content = GIADR_quality.read(f, grh)
-            elif grh.record_subclass == 1:
-                content = GIADR_scale_factors.read(f, grh)
+        if grh is None:
+            return None
+        return Record.read_content(f, grh)
+
+    @staticmethod
+    def read_content(f, grh):
+        """
+        Create a Record object reading its content from a file descriptor,
+        when its grh has already been read.
+
+        Args:
+            -*f*: A file descriptor
+            -*grh*: the GRH of the record
+
+        Returns:
+            A Record object
+
+        Raises:
+            InvalidRecordException if the record is truncated or if it can
+            not be interpreted
+        """
+        data_size = grh.record_size - GRH.size
+        data = f.read(data_size)
+        if len(data) < data_size:
+            raise InvalidRecordException(
+                'Truncated {} record: {} bytes read instead of {}'.format(
+                    grh.record_class, len(data), data_size))
+
+        try:
+            if grh.record_class == 'MPHR':
+                content = MPHR.read_mphr(BytesIO(data), grh)
+            elif grh.record_class == 'GIADR' and grh.record_subclass == 0:
+                content = GIADR_quality.read(BytesIO(data), grh)
+            elif grh.record_class == 'GIADR' and grh.record_subclass == 1:
+                content = GIADR_scale_factors.read(BytesIO(data), grh)
             else:
-                data = f.read(grh.record_size - GRH.size)
                 content = uninterpreted_content(data)
-        else:
-            data = f.read(grh.record_size - GRH.size)
-            content = uninterpreted_content(data)
+        except (ValueError, IndexError, AssertionError, struct_error) as e:
+            raise InvalidRecordException(
+                'Invalid {} record: {}'.format(grh.record_class, e))
         return Record(grh, content)
 
 
+class LazyRecord(Record):
+    """
+    A record whose content is not kept in memory: every time it is needed,
+    it is read again from the storage of the file (a LocalFileStorage or a
+    HttpRangeStorage).
+
+    Args:
+        - *grh*: a GRH object
+        - *storage*: the object that gives access to the file
+        - *offset*: the position of the record (of its grh) in the file
+    """
+    def __init__(self, grh, storage, offset):
+        Record.__init__(self, grh, None)
+        self.__storage = storage
+        self.__offset = offset
+
+    @property
+    def content(self):
+        data = self.__storage.pread(self.__offset + GRH.size,
+                                    self.size - GRH.size)
+        return uninterpreted_content(data)
+
+    @property
+    def interpreted(self):
+        return False
+
+
 class IasiL1cNativeFile(object):
-    def __init__(self, filename):
+    """
+    A IASI L1C file in native format.
+
+    The methods whose name starts with "get_" and that return a value for
+    each observation accept an optional argument *lines* to read only some
+    of the scan lines (i.e. of the mdr records) of the file: it can be a
+    slice, a list of indices or a boolean mask over the scan lines.
+
+    The file can also be compressed (gzip, bz2 or xz) or stored inside an
+    archive (zip or tar): in this case, it is decompressed in memory while
+    it is read, without writing anything on the disk.
+
+    The file can also be read from a web server, passing its URL (http or
+    https): only the headers of the records are downloaded when the object
+    is created, and the getters download only the parts of the scan lines
+    they need (see storage.HttpRangeStorage). To choose how the file is
+    downloaded, or to read it from another kind of storage, pass a storage
+    object instead of the path: any object with a size property and a
+    pread(offset, size) method.
+
+    Instead of a path, it is also possible to pass a binary file object
+    (like a pipe or a socket): the records are read from it until the end of
+    the stream. See also the IasiL1cStreamReader class, that processes the
+    scan lines while they are received.
+
+    If *tolerant* is True, the records that are truncated or corrupted
+    (including the mdr records whose size is not the expected one) are
+    skipped instead of raising an exception; if a grh is corrupted, the
+    reading stops there, since it is not possible to find where the next
+    record begins. The property skipped_records reports what has been
+    skipped.
+
+    When the file is not compressed, only the headers are read when the
+    object is created: the content of the mdr records is read from the
+    disk (with positional reads or through a memory map of the file) only
+    when it is needed.
+
+    The same object can be used by several threads at the same time. If
+    *thread_safe* is True, the content of each mdr record is interpreted
+    only once (under a lock that involves only that record) and the result
+    is kept in memory and shared by all the threads; the arrays returned by
+    the getters are always new arrays, while the interpreted mdr records
+    (the ones returned by get_mdrs) are shared and must not be modified.
+    If *thread_safe* is False, the records are interpreted again by every
+    call of the getters that read only some of the scan lines, and nothing
+    is kept in memory until read_mdrs is called.
+
+    On storage with a high latency, *readahead* can be used to read the
+    mdr records in large blocks on a pool of background threads: while a
+    scan line is interpreted, the next *readahead* blocks are already being
+    read (see storage.ReadaheadScheduler).
+
+    If *follow* is True, the file can be still being written: its last
+    record can be incomplete (and it is ignored), and the method refresh
+    reads the records that have been completed since the last time it has
+    been called.
+
+    The object can be pickled (for example, to send it to the processes of
+    a multiprocessing pool) without copying the content of the file: only
+    the path of the file, the grh of every record and the headers are
+    saved, and the file is opened again when the object is unpickled. The
+    scan lines interpreted by read_mdrs (or kept in thread safe mode) are
+    not transferred. If the file is compressed or it has been read from a
+    stream, all its records must be saved instead.
+
+    Args:
+        - *filename*: the path of the file, its URL, a storage object or a
+          binary file object
+        - *member*: if the file is an archive that contains more than one
+          file, the name of the file that must be read
+        - *tolerant*: a boolean; if True, skip the records that can not be
+          read
+        - *thread_safe*: a boolean; if True, keep in memory the mdr records
+          interpreted by the getters, so that every record is interpreted
+          only once even if it is read by several threads
+        - *readahead*: the number of blocks of mdr records read in advance
+          while the scan lines are interpreted; 0 disables the readahead
+        - *follow*: a boolean; if True, the file can still be being written
+          (see refresh)
+    """
+    def __init__(self, filename, member=None, tolerant=False,
+                 thread_safe=False, readahead=0, follow=False):
+        self.__reset(tolerant, thread_safe, readahead, follow)
+
+        storage = None
+        if is_url(filename):
+            storage = HttpRangeStorage(filename)
+        elif hasattr(filename, 'pread'):
+            storage = filename
+
+        on_disk = storage is None and not hasattr(filename, 'read') and \
+            compression_type(filename) is None
+        if follow and not on_disk:
+            raise ValueError('The follow mode can be used only with files '
+                             'on the disk that are not compressed')
+
+        if storage is not None:
+            # Only the headers of the records are read from the storage
+            self.__filename = None
+            self.__storage = storage
+            reading = self.__read_records(StorageReader(storage),
+                                          storage.size)
+        elif hasattr(filename, 'read'):
+            self.__filename = None
+            reading = self.__read_records(SequentialReader(filename), None)
+        elif on_disk:
+            # The content of the mdr records is read from the disk only
+            # when it is needed
+            self.__filename = filename
+            self.__storage = LocalFileStorage(filename)
+            with open(filename, 'rb') as iasi_file:
+                reading = self.__read_records(iasi_file, self.__storage.size)
+        else:
+            self.__filename = None
+            with open_native_file(filename, member) as iasi_file:
+                reading = self.__read_records(iasi_file, None)
+
+        self.__record_list, self.__record_offsets, self.__size = reading
+        self.__index_mdrs()
+
+    def __reset(self, tolerant, thread_safe, readahead, follow):
+        """
+        Initialize the state of an object whose records have not been read
+        """
         self.__record_list = []
-        self.__size = getsize(filename)
+        self.__record_offsets = []
+        self.__skipped_records = []
+        self.__mdr_positions = []
+        self.__line_locks = []
+        self.__mdr_cache = []
+        self.__tolerant = tolerant
+        self.__thread_safe = thread_safe
+        self.__readahead = readahead
+        self.__follow = follow
+        self.__io_executor = None
+        self.__io_executor_pid = None
         self.__data_read = False
+        self.__raw_mdr_contents = None
+        self.__storage = None
+        self.__lock = RLock()
+        self.__local = local()
 
-        # Read content from the file
-        bytes_read = 0
-        with open(filename, 'rb') as iasi_file:
-            while bytes_read < self.__size:
-                rcd = Record.read(iasi_file)
-                self.__record_list.append(rcd)
-                bytes_read += rcd.size
+    def __index_mdrs(self):
+        """
+        Find the mdr records, after the records have been read (or after
+        some new records have been added)
+        """
+        positions = [i for i, r in enumerate(self.__record_list)
+                     if r.type == 'MDR']
+        n_of_new_lines = len(positions) - len(self.__line_locks)
+        self.__line_locks = self.__line_locks + \
+            [Lock() for _ in range(n_of_new_lines)]
+        self.__mdr_cache = self.__mdr_cache + [None] * n_of_new_lines
+        self.__mdr_positions = positions
+
+    def __getstate__(self):
+        # For every record, save its grh and, if the content can not be read
+        # again from the file, its content (both as raw bytes)
+        records = []
+        mdr_indices = {p: i for i, p in enumerate(self.__mdr_positions)}
+        for position, rcd in enumerate(self.__record_list):
+            if rcd.type == 'MDR' and self.__storage is not None:
+                records.append((rcd.grh.raw, None))
+            elif position in mdr_indices:
+                content = self.__raw_mdr_content(mdr_indices[position])
+                records.append((rcd.grh.raw, bytes(content)))
+            else:
+                records.append((rcd.grh.raw, bytes(rcd.content.raw)))
+        filename = None
+        storage = None
+        if self.__filename is not None:
+            filename = abspath(self.__filename)
+        elif self.__storage is not None:
+            storage = self.__storage
+        return {'filename': filename,
+                'storage': storage,
+                'size': self.__size,
+                'records': records,
+                'record_offsets': self.__record_offsets,
+                'skipped_records': self.__skipped_records,
+                'tolerant': self.__tolerant,
+                'thread_safe': self.__thread_safe,
+                'readahead': self.__readahead,
+                'follow': self.__follow}
+
+    def __setstate__(self, state):
+        self.__reset(state['tolerant'], state['thread_safe'],
+                     state['readahead'], state.get('follow', False))
+        self.__filename = state['filename']
+        self.__size = state['size']
+        self.__record_offsets = list(state['record_offsets'])
+        self.__skipped_records = list(state['skipped_records'])
+
+        if self.__filename is not None:
+            self.__storage = LocalFileStorage(self.__filename)
+            if self.__storage.size != self.__size and not self.__follow:
+                raise ValueError('The file {} has changed since it has been '
+                                 'opened'.format(self.__filename))
+        elif state.get('storage') is not None:
+            self.__storage = state['storage']
+
+        for (grh_raw, content), offset in zip(state['records'],
+                                              self.__record_offsets):
+            grh = GRH.read_grh(BytesIO(grh_raw))
+            if content is None:
+                self.__record_list.append(
+                    LazyRecord(grh, self.__storage, offset))
+            else:
+                self.__record_list.append(
+                    Record.read_content(BytesIO(content), grh))
+        self.__index_mdrs()
+
+    @classmethod
+    def from_stream(cls, stream):
+        """
+        Create a IasiL1cNativeFile reading all the records from a binary
+        stream (it does not need to be seekable) until its end.
+
+        Args:
+            - *stream*: a binary file object
+
+        Returns:
+            A IasiL1cNativeFile object
+        """
+        return cls(stream)
+
+    def __read_records(self, iasi_file, file_size, start=0):
+        """
+        Read the records from a file object, whose current position is the
+        offset start; if file_size is None, read until the end of the file.
+        Return the records, their offsets and the offset where the reading
+        has stopped.
+        """
+        records = []
+        offsets = []
+        bytes_read = start
+        prefetched_until = start
+        while file_size is None or bytes_read < file_size:
+            # In follow mode, the last record can still be incomplete
+            if self.__follow and file_size - bytes_read < GRH.size:
+                break
+            try:
+                grh = GRH.read_grh(iasi_file)
+            except InvalidRecordException as e:
+                if not self.__tolerant:
+                    raise
+                self.__skipped_records.append((bytes_read, str(e)))
+                break
+            if grh is None:
+                break
+            if self.__follow and bytes_read + grh.record_size > file_size:
+                break
+            try:
+                rcd = self.__read_content(iasi_file, grh, bytes_read,
+                                          file_size)
+            except InvalidRecordException as e:
+                if not self.__tolerant:
+                    raise
+                self.__skipped_records.append((bytes_read, str(e)))
+                bytes_read += grh.record_size
+                continue
+            records.append(rcd)
+            offsets.append(bytes_read)
+            bytes_read += rcd.size
+            if rcd.type == 'MDR' and bytes_read >= prefetched_until and \
+                    hasattr(iasi_file, 'prefetch'):
+                # The mdr records have all the same size, so the position
+                # of the next grhs is known: download them together
+                prefetched_until = min(
+                    file_size, bytes_read + rcd.size * _PREFETCHED_GRHS)
+                iasi_file.prefetch([(offset, GRH.size) for offset in
+                                    range(bytes_read, prefetched_until,
+                                          rcd.size)])
+        if file_size is not None and not self.__follow:
+            bytes_read = file_size
+        return records, offsets, bytes_read
+
+    def __read_content(self, iasi_file, grh, offset, file_size):
+        """
+        Read the content of a record whose grh has just been read; if the
+        file is on the disk, the content of the mdr records is skipped and
+        a LazyRecord is returned
+        """
+        if grh.record_class == 'MDR' and self.__tolerant:
+            expected_size = mdr_record_size(grh.record_subclass_version)
+            if grh.record_size != expected_size:
+                iasi_file.read(grh.record_size - GRH.size)
+                raise InvalidRecordException(
+                    'Invalid size for a MDR record (subclass version '
+                    '{}): {}'.format(grh.record_subclass_version,
+                                     grh.record_size))
+
+        if grh.record_class != 'MDR' or self.__storage is None:
+            return Record.read_content(iasi_file, grh)
+
+        data_size = grh.record_size - GRH.size
+        available = min(file_size - offset - GRH.size, data_size)
+        if available < data_size:
+            raise InvalidRecordException(
+                'Truncated MDR record: {} bytes read instead of {}'.format(
+                    available, data_size))
+        iasi_file.seek(data_size, 1)
+        return LazyRecord(grh, self.__storage, offset)
+
+    def close(self):
+        """
+        Release the file on the disk (or the connection to the server) used
+        to read the scan lines and the threads used for the readahead. The
+        scan lines that have not been read yet can not be read anymore.
+        """
+        with self.__lock:
+            if self.__io_executor is not None:
+                self.__io_executor.shutdown(wait=False)
+                self.__io_executor = None
+            if self.__storage is not None:
+                self.__storage.close()
+
+    def refresh(self):
+        """
+        In follow mode, read the records that have been added to the file
+        since it has been opened (or since the last call of this method);
+        only the complete records are read. The new scan lines are
+        interpreted only if read_mdrs has already been called.
+
+        Returns:
+            A slice with the indices of the new scan lines
+        """
+        if not self.__follow:
+            raise ValueError('refresh can be used only in follow mode')
+
+        with self.__lock:
+            n_of_old_lines = len(self.__mdr_positions)
+            storage = LocalFileStorage(self.__filename)
+            if storage.size < self.__size:
+                raise ValueError('The file {} has been truncated'.format(
+                    self.__filename))
+            if storage.size == self.__size:
+                storage.close()
+                return slice(n_of_old_lines, n_of_old_lines)
+
+            # The old records keep on reading from the old storage; the new
+            # one also contains the new records
+            self.__storage = storage
+            with open(self.__filename, 'rb') as iasi_file:
+                iasi_file.seek(self.__size)
+                records, offsets, size = self.__read_records(
+                    iasi_file, storage.size, self.__size)
+
+            if self.__data_read:
+                giadr = self.get_giadr_scalefactors()
+                records = [Record(r.grh, MDR.read(r.content.raw, r.grh, giadr))
+                           if r.type == 'MDR' else r for r in records]
+
+            self.__record_offsets = self.__record_offsets + offsets
+            self.__record_list = self.__record_list + records
+            self.__size = size
+            self.__index_mdrs()
+            return slice(n_of_old_lines, len(self.__mdr_positions))
+
+    @property
+    def complete(self):
+        """
+        True if the file contains all the data declared in its MPHR (i.e.
+        if its size is the one reported by the MPHR)
+        """
+        mphr_records = [rcd for rcd in self.__record_list
+                        if rcd.type == 'MPHR']
+        if len(mphr_records) == 0:
+            return False
+        return mphr_records[0].content.actual_product_size == self.__size
+
+    @property
+    def skipped_records(self):
+        """
+        A list of tuples (offset, reason) with the position inside the file
+        of the records that have been skipped while reading the file in
+        tolerant mode, and the reason why they have been skipped
+        """
+        return list(self.__skipped_records)
 
     @property
     def size(self):
         """
-        An integer which is the size of the file in bytes
+        An integer which is the size of the file in bytes (if the file is
+        compressed, the size of its uncompressed content)
         """
         return self.__size
 
@@ -250,196 +732,1384 @@ class IasiL1cNativeFile(object):
         """
         return [r.content for r in self.__record_list if r.type == "MDR"]
 
-    def read_mdrs(self):
-        mdr_record_positions = [i for i in range(self.n_of_records)
-                                  if self.__record_list[i].type == 'MDR']
+    def __mdr_version(self):
+        """
+        Return the subclass version of the mdr records of the file (or None
+        if there are no mdr records)
+        """
+        versions = set(self.__record_list[p].grh.record_subclass_version
+                       for p in self.__mdr_positions)
+        if len(versions) > 1:
+            raise ValueError('MDR records with different subclass versions '
+                             'can not be read together')
+        return versions.pop() if versions else None
+
+    def __raw_mdr_content(self, i, offset=0, size=None):
+        """
+        Return the raw content (without the grh) of the i-th mdr record, or
+        only *size* bytes of it starting from *offset*. The bytes are read
+        again from the storage of the file if the record has been
+        interpreted (or if its content is not kept in memory).
+        """
+        position = self.__mdr_positions[i]
+        rcd = self.__record_list[position]
+        if size is None:
+            size = rcd.size - GRH.size - offset
+        if self.__storage is not None and \
+                (rcd.interpreted or isinstance(rcd, LazyRecord)):
+            return self.__storage.pread(
+                self.__record_offsets[position] + GRH.size + offset, size)
+        if rcd.interpreted:
+            data = self.__raw_mdr_contents[i]
+        else:
+            data = rcd.content.raw
+        if offset == 0 and size == len(data):
+            return data
+        return data[offset:offset + size]
+
+    def __mdr_map(self):
+        """
+        If all the mdr records have the same size and they are stored one
+        after the other in a file that can be mapped in memory, return a 2D
+        array of uint8 where every row is the content (without the grh) of
+        one of the mdr records: it is a view on the memory map of the file
+        and no data is copied. Otherwise, return None.
+        """
+        if self.__storage is None or \
+                not hasattr(self.__storage, 'buffer') or \
+                len(self.__mdr_positions) == 0:
+            return None
+
+        mdr_records = [(self.__record_offsets[p], self.__record_list[p])
+                       for p in self.__mdr_positions]
+        first_offset = mdr_records[0][0]
+        record_size = mdr_records[0][1].size
+        contiguous = all(offset == first_offset + k * record_size and
+                         r.size == record_size
+                         for k, (offset, r) in enumerate(mdr_records))
+        if not contiguous:
+            return None
+
+        block = np.frombuffer(self.__storage.buffer, dtype=np.uint8,
+                              count=len(mdr_records) * record_size,
+                              offset=first_offset)
+        block = block.reshape(len(mdr_records), record_size)
+        return block[:, GRH.size:]
+
+    def __read_field_bytes(self, name, version, lines=None):
+        """
+        Read the bytes of a field from the selected mdr records, without
+        reading the rest of the records (with a single request to the
+        storage, if the records are not in memory). Return a 2D array of
+        uint8 with a row for each selected record.
+        """
+        offset, size = mdr_layout(version)[name]
+        selected = np.arange(self.n_of_lines)
+        if lines is not None:
+            selected = selected[lines]
+
+        preadv = getattr(self.__storage, 'preadv', None)
+        if self.__storage is None or preadv is None:
+            raw_data = b''.join(self.__raw_mdr_content(i, offset, size)
+                                for i in selected)
+        else:
+            ranges = [(self.__record_offsets[self.__mdr_positions[i]] +
+                       GRH.size + offset, size) for i in selected]
+            raw_data = b''.join(preadv(ranges))
+        return np.frombuffer(raw_data, dtype=np.uint8).reshape(-1, size)
+
+    def __read_field(self, name, data_type, shape, lines=None):
+        """
+        Read the raw values of a field from the selected mdr records of the
+        file at once; return an array of shape (n_of_lines,) + shape
+        """
+        if self.n_of_lines == 0:
+            # Without mdr records, the layout of the fields is not known
+            return np.empty((0,) + tuple(shape), dtype=np.dtype(data_type))
+        version = self.__mdr_version()
+        block = self.__mdr_map()
+        if block is None:
+            block = self.__read_field_bytes(name, version, lines)
+            return block.view(np.dtype(data_type)).reshape(
+                (block.shape[0],) + tuple(shape))
+        values = read_mdr_field(block, version, name, np.dtype(data_type),
+                                shape)
+        if lines is not None:
+            values = values[lines]
+        return values
+
+    def __read_vint_field(self, name, shape, lines=None):
+        """
+        Decode a field made of VInt values from the selected mdr records of
+        the file at once; return an array of shape (n_of_lines,) + shape
+        """
+        raw_values = self.__read_field(name, np.uint8, tuple(shape) + (5,),
+                                       lines)
+        return decode_vint(raw_values)
+
+    @property
+    def n_of_lines(self):
+        """
+        An integer which is the number of scan lines (i.e. of mdr records)
+        saved in the file
+        """
+        return len(self.__mdr_positions)
+
+    @property
+    def n_of_decoded_lines(self):
+        """
+        An integer which is the number of scan lines whose interpreted
+        content is kept in memory (by read_mdrs or, in thread safe mode, by
+        the getters)
+        """
+        if self.__data_read:
+            return self.n_of_lines
+        return sum(1 for mdr in self.__mdr_cache if mdr is not None)
+
+    @property
+    def fields(self):
+        """
+        A read-only dictionary that associates to the name of each field
+        (like "latitudes" or "radiances") a LazyField: an array-like object
+        that reads only the scan lines needed when it is indexed. For
+        example, fields["radiances"][1000:1010] reads only one scan line.
+        """
+        return FieldMapping(self)
+
+    def __decoded_mdrs(self, lines=None):
+        """
+        Return a list with the interpreted content of the selected mdr
+        records. If all the records are requested, they are read (and kept
+        in memory) calling read_mdrs; otherwise, only the selected records
+        are interpreted and they are not saved inside the object.
+        """
+        if lines is None or self.__data_read:
+            if not self.__data_read:
+                self.read_mdrs()
+            mdrs = self.get_mdrs()
+            if lines is None:
+                return mdrs
+            return [mdrs[i] for i in np.arange(len(mdrs))[lines]]
+
+        indices = np.arange(len(self.__mdr_positions))[lines]
+        if self.__thread_safe:
+            missing = [i for i in indices if self.__mdr_cache[i] is None]
+            for i, data in self.__mdr_contents(missing):
+                self.__decode_line(i, data)
+            return [self.__decode_line(i) for i in indices]
+
+        # Inside iter_chunks, the records of the current chunk are
+        # interpreted only once and shared by all the getters (every thread
+        # has its own current chunk)
+        chunk = getattr(self.__local, 'chunk', None)
+        if chunk is not None and lines is chunk[0] and chunk[1] is not None:
+            return chunk[1]
+
+        if chunk is not None and lines is chunk[0]:
+            contents = self.__chunk_contents(indices)
+        else:
+            contents = self.__mdr_contents(indices)
         giadr = self.get_giadr_scalefactors()
-        for i in mdr_record_positions:
-            mdr_record = self.__record_list[i]
-            new_content = MDR.read(mdr_record.content, mdr_record.grh, giadr)
-            self.__record_list[i] = Record(mdr_record.grh, new_content)
-        self.__data_read = True
-
-    def split(self, threshold, split_files_names = 'split_$F',
-              output_dir = '.', temp_name = 'temp'):
-        # Get the size of the non-mdr part of the file
-        non_mdr_list = [r for r in self if r.type != 'MDR']
-        non_mdr_size = sum([r.size for r in non_mdr_list])
-
-        # Get the size of the biggest mdr record
-        mdr_list = [r for r in self if r.type == 'MDR']
-        msr_max_size = max([r.size for r in mdr_list])
-
-        if threshold < non_mdr_size + msr_max_size:
-            raise TooSmallThresholdException('The file can not be splitted in the '
-                                             'desidered size')
-        split_file_index = 0
-        file_times = []
-
-        # Prepare the first file
-        file_size = 0
-        current_file = open(join(output_dir, temp_name), 'w')
-        for r in non_mdr_list:
-            current_file.write(r.raw)
-            file_size += r.size
-
-        for mdr_record in mdr_list:
-            if file_size + mdr_record.size > threshold:
-                current_file.close()
-                file_start_time = min(file_times)
-                file_end_time = max(file_times)
-
-                file_name = split_files_names.replace('$F', str(split_file_index))
-                file_name = file_name.replace('$SD', file_start_time.strftime('%Y%m%d%H%M%S') + 'Z')
-                file_name = file_name.replace('$ED', file_end_time.strftime('%Y%m%d%H%M%S') + 'Z')
-                rename(join(output_dir, temp_name), join(output_dir, file_name))
-                file_size = 0
-                file_times = []
-                split_file_index += 1
-                current_file = open(join(output_dir, temp_name), 'w')
-                for r in non_mdr_list:
-                    current_file.write(r.raw)
-                    file_size += r.size
-
-            interpreted_mdr = MDR.read(mdr_record.content.raw,
-                                       mdr_record.grh,
-                                       self.get_giadr_scalefactors())
-            file_times.extend(interpreted_mdr.get_times())
-            current_file.write(mdr_record.raw)
-            file_size += mdr_record.size
-
-        current_file.close()
-        file_start_time = min(file_times)
-        file_end_time = max(file_times)
-        file_name = split_files_names.replace('$F', str(split_file_index))
-        file_name = file_name.replace('$SD', file_start_time.strftime('%Y%m%d%H%M%S') + 'Z')
-        file_name = file_name.replace('$ED', file_end_time.strftime('%Y%m%d%H%M%S') + 'Z')
-        rename(join(output_dir, temp_name), join(output_dir, file_name))
+        mdrs = [MDR.read(data, self.__record_list[self.__mdr_positions[i]].grh,
+                         giadr)
+                for i, data in contents]
+        if chunk is not None and lines is chunk[0]:
+            self.__local.chunk = (lines, mdrs)
+        return mdrs
+
+    def __mdr_contents(self, indices):
+        """
+        Yield a couple (index, raw content) for each of the selected mdr
+        records, in the same order of indices; if the readahead is enabled,
+        the following records are read in background while the current one
+        is used
+        """
+        mdr_records = [self.__record_list[self.__mdr_positions[i]]
+                       for i in indices]
+        if self.__readahead <= 0 or self.__storage is None or \
+                any(r.interpreted for r in mdr_records):
+            for i in indices:
+                yield i, self.__raw_mdr_content(i)
+            return
+
+        ranges = [(self.__record_offsets[self.__mdr_positions[i]] + GRH.size,
+                   r.size - GRH.size) for i, r in zip(indices, mdr_records)]
+        with ReadaheadScheduler(self.__storage, ranges, self.__readahead,
+                                executor=self.__executor()) as scheduler:
+            for k, i in enumerate(indices):
+                yield i, scheduler.read(k)
+
+    def __executor(self):
+        """
+        Return the pool of threads used for the readahead
+        """
+        with self.__lock:
+            # The threads of the pool do not survive a fork
+            if self.__io_executor is None or self.__io_executor_pid != getpid():
+                self.__io_executor = ThreadPoolExecutor(self.__readahead)
+                self.__io_executor_pid = getpid()
+            return self.__io_executor
+
+    def __chunk_contents(self, indices):
+        """
+        Yield the raw content of the mdr records of the current chunk of
+        iter_chunks; the readahead goes on from one chunk to the next one
+        """
+        if len(indices) == 0:
+            return
+        prefetch = getattr(self.__local, 'prefetch', None)
+        if prefetch is None:
+            prefetch = self.__mdr_contents(range(indices[0],
+                                                 len(self.__mdr_positions)))
+            self.__local.prefetch = prefetch
+        for i, data in prefetch:
+            if i < indices[0]:
+                continue
+            yield i, data
+            if i >= indices[-1]:
+                return
+
+    def __decode_line(self, i, data=None):
+        """
+        Return the interpreted content of the i-th mdr record, interpreting
+        it only if nobody else has already done it; only the threads that
+        need the same record wait for each other. If data is not None, it
+        is the raw content of the record, already read from the file.
+        """
+        mdr = self.__mdr_cache[i]
+        if mdr is not None:
+            return mdr
+        with self.__line_locks[i]:
+            mdr = self.__mdr_cache[i]
+            if mdr is None:
+                mdr_record = self.__record_list[self.__mdr_positions[i]]
+                if data is None:
+                    data = self.__raw_mdr_content(i)
+                mdr = MDR.read(data, mdr_record.grh,
+                               self.get_giadr_scalefactors())
+                self.__mdr_cache[i] = mdr
+        return mdr
+
+    def iter_chunks(self, fields, lines_per_chunk=10, shared=False,
+                    lines=None):
+        """
+        Iterate over the scan lines of the file, a group of lines at a time,
+        reading only the data of the current group. For every group, yield a
+        dictionary that associates to the name of each field the value
+        returned by the corresponding getter (i.e. "latitudes" for the
+        method get_latitudes) for the lines of the group; the key "lines"
+        contains the slice of the lines of the group.
+
+        If *shared* is True, the arrays are copied in blocks of shared
+        memory and the dictionary contains SharedArray objects (see the
+        shared module); they must be released calling their unlink method.
+
+        Args:
+            - *fields*: a list with the names of the fields
+            - *lines_per_chunk*: the number of scan lines of each group
+            - *shared*: if True, return the values in shared memory
+            - *lines*: None or a slice (with step 1) with the scan lines to
+              read; if None, all the scan lines are read
+
+        Returns:
+            A generator of dictionaries
+        """
+        getters = [(field, getattr(self, 'get_' + field)) for field in fields]
+        selected = slice(None) if lines is None else lines
+        first_line, end_line, _ = selected.indices(self.n_of_lines)
+        try:
+            for start in range(first_line, end_line, lines_per_chunk):
+                lines = slice(start, min(start + lines_per_chunk, end_line))
+                chunk = {'lines': lines}
+                self.__local.chunk = (lines, None)
+                try:
+                    for field, getter in getters:
+                        chunk[field] = getter(lines=lines)
+                finally:
+                    self.__local.chunk = None
+                yield share(chunk) if shared else chunk
+        finally:
+            prefetch = getattr(self.__local, 'prefetch', None)
+            self.__local.prefetch = None
+            if prefetch is not None:
+                prefetch.close()
+
+    def share(self, field, lines=None, **kwargs):
+        """
+        Read a field inside a block of shared memory, so that other
+        processes can use it without copying it: send them the descriptor
+        of the result and call shared.attach on it. The block must be
+        released calling the unlink method of the result. The block is
+        allocated before reading the field, that is written inside it one
+        scan line at a time.
+
+        Args:
+            - *field*: the name of the field (like "radiances")
+            - *lines*: the scan lines to read (see the class description)
+            - *kwargs*: the other arguments of the getter
+
+        Returns:
+            A SharedArray (or a dictionary of SharedArray, if the getter
+            returns a dictionary)
+        """
+        getter = getattr(self, 'get_' + field)
+        line_indices = np.arange(self.n_of_lines)
+        if lines is not None:
+            line_indices = np.atleast_1d(line_indices[lines])
+        if line_indices.size == 0:
+            return share(getter(lines=line_indices, **kwargs))
+
+        # The first scan line gives the shape of the outputs
+        sample = getter(lines=line_indices[:1], **kwargs)
+        samples = sample if isinstance(sample, dict) else {None: sample}
+        outputs = type(samples)()
+        try:
+            for key, value in samples.items():
+                value = np.asarray(value)
+                rows_per_line = value.shape[0]
+                outputs[key] = empty_shared_array(
+                    (line_indices.size * rows_per_line,) + value.shape[1:],
+                    value.dtype)
+                outputs[key].array[:rows_per_line] = value
+            del sample, samples
+
+            for k in range(1, line_indices.size):
+                values = getter(lines=line_indices[k:k + 1], **kwargs)
+                if not isinstance(values, dict):
+                    values = {None: values}
+                for key, output in outputs.items():
+                    rows_per_line = output.array.shape[0] // line_indices.size
+                    output.array[k * rows_per_line:
+                                 (k + 1) * rows_per_line] = values[key]
+        except BaseException:
+            release(outputs)
+            raise
+        return outputs[None] if None in outputs else outputs
+
+    def save_all(self, output_dir='.', fields=tuple(FBF_FILE_NAMES),
+                 data_types=None, file_names=None, lines_per_chunk=1):
+        """
+        Save several fields on flat binary files (one for each field) with a
+        single pass over the scan lines of the file: every group of scan
+        lines is interpreted only once and its data are appended to all the
+        output files, so the memory used does not depend on the size of the
+        file. The names of the files are the same used by the save_*
+        methods.
+
+        Args:
+            - *output_dir*: the directory where the files will be saved
+            - *fields*: the names of the fields to save (like "latitudes" or
+              "radiances"); "channels" saves the wavenumbers
+            - *data_types*: a dictionary that associates to some fields the
+              data type used to save them
+            - *file_names*: a dictionary that associates to some fields the
+              name of their output file (without the suffixes with the data
+              type and the shape)
+            - *lines_per_chunk*: the number of scan lines read at a time
+
+        Returns:
+            A dictionary that associates to each field the path of its file
+        """
+        if data_types is None:
+            data_types = {}
+        if file_names is None:
+            file_names = {}
+
+        paths = {}
+        line_fields = [f for f in fields if f != 'channels']
+        if 'channels' in fields:
+            file_name = file_names.get('channels', 'wavenumber')
+            data_type = np.dtype(data_types.get('channels', np.float64))
+            self.save_channels(output_dir, file_name, data_type)
+            paths['channels'] = join(output_dir,
+                                     fbf_file_name(file_name, data_type,
+                                                   (1, 8461)))
+
+        output_files = {}
+        try:
+            for chunk in self.iter_chunks(line_fields, lines_per_chunk):
+                for field in line_fields:
+                    data = np.asarray(chunk[field])
+                    if field in data_types:
+                        data = data.astype(data_types[field])
+                    if field not in output_files:
+                        file_name = file_names.get(
+                            field, FBF_FILE_NAMES.get(field, field))
+                        paths[field] = join(output_dir,
+                                            fbf_file_name(file_name,
+                                                          data.dtype,
+                                                          data.shape))
+                        output_files[field] = open(paths[field], 'wb')
+                    data.tofile(output_files[field])
+        finally:
+            for output_file in output_files.values():
+                output_file.close()
+
+        return paths
+
+    def __raw_pixel_field(self, name, lines=None):
+        """
+        Read a field with a value for each pixel directly from the file;
+        return an array of shape (n_of_lines, SNOT, PN)
+        """
+        field_name, data_type, index, scale_factor = _RAW_PIXEL_FIELDS[name]
+        if index is None:
+            return self.__read_field(field_name, data_type, (SNOT, PN), lines)
+        values = self.__read_field(field_name, data_type, (SNOT, PN, 2),
+                                   lines)[..., index]
+        return values / scale_factor
+
+    def __remote_storage(self):
+        """
+        True if the mdr records are read from a storage that can not be
+        mapped in memory (like a remote file): in this case, the fields
+        that can be read without interpreting the records are read directly,
+        so that only their bytes are downloaded
+        """
+        return self.__storage is not None and \
+            not hasattr(self.__storage, 'buffer') and \
+            not self.__data_read
+
+    def __raw_pixel_getter(self, name, lines, keep_shape):
+        """
+        Return the same values of the getter of a field in _RAW_PIXEL_FIELDS
+        """
+        values = self.__raw_pixel_field(name, lines)
+        if keep_shape:
+            return values
+        return values.reshape(-1)
+
+    def __pixel_radiances(self, pixels):
+        """
+        Return the radiances of the selected pixels (an array with a row for
+        each pixel), reading from the file only their spectra
+        """
+        pixels_per_line = SNOT * PN
+        read_lines, positions = np.unique(pixels // pixels_per_line,
+                                          return_inverse=True)
+        first_channels = self.__read_field('IDefNsFirst1b', '>i4', (),
+                                           read_lines)
+        last_channels = self.__read_field('IDefNsLast1b', '>i4', (),
+                                          read_lines)
+        if len(set(first_channels)) > 1 or len(set(last_channels)) > 1:
+            # The scan lines have different channels: every line must be
+            # interpreted on its own
+            return self.fields['radiances'][pixels]
+
+        first_channel = first_channels[0] if read_lines.size > 0 else 0
+        num_ch = last_channels[0] - first_channel + 1 \
+            if read_lines.size > 0 else len(self.get_channels())
+        giadr_sf = self.get_giadr_scalefactors()
+        pos = where_greater(giadr_sf.IDefScaleSondNslast,
+                            np.arange(num_ch) + first_channel)
+        rad_sfs = giadr_sf.IDefScaleSondScaleFactor[pos]
+
+        spectra = self.__read_field('GS1cSpect', '>i2', (pixels_per_line, SS),
+                                    read_lines)
+        values = spectra[positions, pixels % pixels_per_line, :num_ch]
+        return values / 10.**rad_sfs
+
+    def get_pixels(self, fields, pixels):
+        """
+        Read some fields only for some pixels. The radiances, the
+        geolocation, the angles and the avhrr fractions are read directly
+        from the file only for the selected pixels, without interpreting
+        the mdr records; the other fields are read interpreting only the
+        scan lines that contain the selected pixels.
+
+        Args:
+            - *fields*: the names of the fields (like "radiances"); they must
+              have a value for each pixel
+            - *pixels*: the indices of the pixels (the position of each pixel
+              in the arrays returned by the getters)
+
+        Returns:
+            An OrderedDict that associates to each field an array with a row
+            for each selected pixel
+        """
+        pixels = np.asarray(pixels, dtype=np.int64).reshape(-1)
+        pixels_per_line = SNOT * PN
+        lines = pixels // pixels_per_line
+        result = OrderedDict()
+        for field in fields:
+            if field == 'radiances':
+                result[field] = self.__pixel_radiances(pixels)
+            elif field in _RAW_PIXEL_FIELDS:
+                read_lines, positions = np.unique(lines, return_inverse=True)
+                values = self.__raw_pixel_field(field, read_lines)
+                result[field] = values.reshape(-1, pixels_per_line)[
+                    positions, pixels % pixels_per_line]
+            else:
+                lazy_field = self.fields[field]
+                if lazy_field.shape[0] != self.n_of_lines * pixels_per_line:
+                    raise ValueError('The field {} does not have a value for '
+                                     'each pixel'.format(field))
+                result[field] = lazy_field[pixels]
+        return result
+
+    def apply_spectral_operator(self, operator, lines=None, keep_shape=False,
+                                lines_per_chunk=10):
+        """
+        Compute some linear combinations of the channels of the radiances
+        (band averages, superchannels, projections on principal components,
+        convolutions with the spectral response of another instrument...)
+        without building the array with all the radiances: the spectra are
+        read directly from the file a group of scan lines at a time and
+        multiplied by the operator, so only the results are kept in memory.
+        The scale factors of the radiances are applied to the coefficients
+        of the operator instead of to the spectra.
+
+        Args:
+            - *operator*: a SpectralOperator or a matrix of shape
+              (n_of_outputs, n_of_channels), dense or sparse (see
+              spectral.SpectralOperator)
+            - *lines*: the scan lines to read (see the class description)
+            - *keep_shape*: if True, the result has shape
+              (n_of_lines, SNOT, PN, n_of_outputs); otherwise, it has a row
+              for each pixel
+            - *lines_per_chunk*: the number of scan lines read at a time
+
+        Returns:
+            A numpy array
+        """
+        if not isinstance(operator, SpectralOperator):
+            operator = SpectralOperator(operator)
+
+        pixels_per_line = SNOT * PN
+        line_indices = np.arange(self.n_of_lines)
+        if lines is not None:
+            line_indices = line_indices[lines]
+        result = np.zeros((line_indices.size, pixels_per_line) +
+                          operator.output_shape)
+
+        if line_indices.size > 0:
+            first_channels = self.__read_field('IDefNsFirst1b', '>i4', (),
+                                               line_indices)
+            last_channels = self.__read_field('IDefNsLast1b', '>i4', (),
+                                              line_indices)
+            giadr_sf = self.get_giadr_scalefactors()
+
+        # The operator with the scale factors of each range of channels
+        scaled_operators = {}
+        for start in range(0, line_indices.size, lines_per_chunk):
+            end = min(start + lines_per_chunk, line_indices.size)
+            spectra = self.__read_field('GS1cSpect', '>i2',
+                                        (pixels_per_line, SS),
+                                        line_indices[start:end])
+            channel_ranges = zip(first_channels[start:end],
+                                 last_channels[start:end])
+            for first_channel, last_channel in set(channel_ranges):
+                num_ch = last_channel - first_channel + 1
+                key = (first_channel, last_channel)
+                if key not in scaled_operators:
+                    pos = where_greater(giadr_sf.IDefScaleSondNslast,
+                                        np.arange(num_ch) + first_channel)
+                    rad_sfs = giadr_sf.IDefScaleSondScaleFactor[pos]
+                    scaled_operators[key] = operator.scale_channels(
+                        10.**-rad_sfs)
+                selected = np.flatnonzero(
+                    (first_channels[start:end] == first_channel) &
+                    (last_channels[start:end] == last_channel)) + start
+                raw_spectra = spectra[selected - start, :, :num_ch]
+                values = scaled_operators[key].apply(
+                    raw_spectra.reshape(-1, num_ch))
+                result[selected] = values.reshape(
+                    (selected.size, pixels_per_line) + operator.output_shape)
+
+        if keep_shape:
+            return result.reshape((line_indices.size, SNOT, PN) +
+                                  operator.output_shape)
+        return result.reshape((-1,) + operator.output_shape)
+
+    def get_observations(self, fields=OBSERVATION_FIELDS, lines=None,
+                         structured=True):
+        """
+        Return a table with a row for each pixel of the selected scan lines
+        and a column for each field, plus the columns "line", "snot" and
+        "pn" with the position of the pixel in the scan. The table is built
+        with a single pass over the scan lines; the default fields are read
+        directly from the file, without interpreting the mdr records.
+
+        Args:
+            - *fields*: the names of the fields; they must have a value for
+              each pixel (for example "radiances" or "quality_flags")
+            - *lines*: the scan lines to read (see the class description)
+            - *structured*: if True, return a numpy structured array;
+              otherwise an OrderedDict with an array for each column
+
+        Returns:
+            A numpy structured array or an OrderedDict
+        """
+        pixels_per_line = SNOT * PN
+        line_indices = np.arange(self.n_of_lines)
+        if lines is not None:
+            line_indices = line_indices[lines]
+        n_of_lines = line_indices.size
+        pixels = (line_indices[:, np.newaxis] * pixels_per_line +
+                  np.arange(pixels_per_line)).reshape(-1)
+
+        columns = OrderedDict()
+        columns['line'] = np.repeat(line_indices.astype(np.int32),
+                                    pixels_per_line)
+        columns['snot'] = np.tile(np.repeat(np.arange(SNOT, dtype=np.uint8),
+                                            PN), n_of_lines)
+        columns['pn'] = np.tile(np.arange(PN, dtype=np.uint8),
+                                n_of_lines * SNOT)
+
+        block_fields = ('obs_times', 'quality_flags',
+                        'detailed_quality_flags')
+        values = self.get_pixels([f for f in fields if f not in block_fields],
+                                 pixels)
+        for field in fields:
+            if field == 'obs_times':
+                efov_times = self.get_efov_times(lines=line_indices)
+                columns[field] = np.repeat(efov_times.reshape(-1), PN)
+            elif field in block_fields:
+                columns[field] = getattr(self, 'get_' + field)(
+                    lines=line_indices)
+            else:
+                columns[field] = values[field]
+
+        if not structured:
+            return columns
+        table_dtype = np.dtype([(name, column.dtype, column.shape[1:])
+                                for name, column in columns.items()])
+        table = np.empty(pixels.size, dtype=table_dtype)
+        for name, column in columns.items():
+            table[name] = column
+        return table
+
+    def thinned_pixels(self, line_step=1, efov_step=1, box_size=None,
+                       score=None):
+        """
+        Choose a subset of the pixels of the file: first, only one scan line
+        every line_step and one EFOV every efov_step are kept; then, if
+        box_size is not None, only one of the remaining pixels is kept for
+        every box of a grid (see thinning.grid_boxes): the one with the
+        lowest score. The choice is made reading only the geolocation of
+        the pixels (and the score), without interpreting the mdr records.
+
+        Args:
+            - *line_step*: keep one scan line every line_step
+            - *efov_step*: keep one EFOV every efov_step
+            - *box_size*: the size of the boxes of the grid (km); if None,
+              keep all the pixels of the selected EFOVs
+            - *score*: None (to keep the first pixel of each box), the name
+              of a field (like "avhrr_cloud_fractions") or an array with a
+              value for each pixel of the file
+
+        Returns:
+            A sorted array with the indices of the selected pixels
+        """
+        pixels_per_line = SNOT * PN
+        lines = np.arange(0, self.n_of_lines, line_step)
+        efovs = np.arange(0, SNOT, efov_step)
+        pixels = (lines[:, np.newaxis, np.newaxis] * pixels_per_line +
+                  efovs[np.newaxis, :, np.newaxis] * PN +
+                  np.arange(PN)[np.newaxis, np.newaxis, :]).reshape(-1)
+        if box_size is None or pixels.size == 0:
+            return pixels
+
+        latitudes = self.__raw_pixel_field('latitudes', lines)[:, efovs]
+        longitudes = self.__raw_pixel_field('longitudes', lines)[:, efovs]
+        boxes = grid_boxes(latitudes.reshape(-1), longitudes.reshape(-1),
+                           box_size)
+
+        if score is None:
+            values = None
+        elif isinstance(score, str):
+            if score in _RAW_PIXEL_FIELDS:
+                values = self.__raw_pixel_field(score, lines)[:, efovs]
+            else:
+                values = getattr(self, 'get_' + score)(lines=lines,
+                                                       keep_shape=True)
+                values = values[:, efovs]
+            values = np.asarray(values, dtype=np.float64).reshape(-1)
+        else:
+            values = np.asarray(score, dtype=np.float64).reshape(-1)[pixels]
+
+        return pixels[best_in_boxes(boxes, values)]
+
+    def thin(self, fields, line_step=1, efov_step=1, box_size=None,
+             score=None):
+        """
+        Read some fields only for a subset of the pixels, chosen as
+        described in thinned_pixels; only the data of the selected pixels
+        are read (see get_pixels).
+
+        Args:
+            - *fields*: the names of the fields (like "radiances")
+            - *line_step*, *efov_step*, *box_size*, *score*: see
+              thinned_pixels
+
+        Returns:
+            An OrderedDict with the indices of the selected pixels
+            ("pixels") and an array for each field
+        """
+        pixels = self.thinned_pixels(line_step, efov_step, box_size, score)
+        result = OrderedDict([('pixels', pixels)])
+        result.update(self.get_pixels(fields, pixels))
+        return result
+
+    def superob(self, fields, box_size, lines_per_chunk=10):
+        """
+        Compute the mean value of some fields over the boxes of a grid (see
+        thinning.grid_boxes), reading the file a group of scan lines at a
+        time. The mean latitude and longitude of the pixels of each box are
+        always computed.
+
+        Args:
+            - *fields*: the names of the fields (like "radiances"); they must
+              have a value for each pixel
+            - *box_size*: the size of the boxes of the grid (km)
+            - *lines_per_chunk*: the number of scan lines read at a time
+
+        Returns:
+            An OrderedDict with the identifiers of the boxes ("boxes"), the
+            number of pixels of each box ("counts") and the mean value of
+            each field
+        """
+        fields = ['latitudes', 'longitudes'] + \
+            [f for f in fields if f not in ('latitudes', 'longitudes')]
+        pixels_per_line = SNOT * PN
+        super_observations = SuperObservations()
+        n_of_lines = self.n_of_lines
+        for start in range(0, n_of_lines, lines_per_chunk):
+            end = min(start + lines_per_chunk, n_of_lines)
+            pixels = np.arange(start * pixels_per_line, end * pixels_per_line)
+            values = self.get_pixels(fields, pixels)
+            boxes = grid_boxes(values['latitudes'], values['longitudes'],
+                               box_size)
+            super_observations.add(boxes, values)
+        return super_observations.result()
+
+    def read_mdrs(self):
+        """
+        Interpret all the mdr records of the file and keep them in memory,
+        so that the getters do not need to read them again. It can be called
+        by several threads at the same time: the records are interpreted
+        only once.
+        """
+        with self.__lock:
+            if self.__data_read:
+                return
+            giadr = self.get_giadr_scalefactors()
+            new_record_list = list(self.__record_list)
+            if self.__storage is None:
+                # The raw bytes can not be read again from a file: keep
+                # them for the fields read without interpreting the records
+                self.__raw_mdr_contents = [
+                    self.__raw_mdr_content(i)
+                    for i in range(len(self.__mdr_positions))]
+            indices = range(len(self.__mdr_positions))
+            if self.__thread_safe:
+                indices = [i for i in indices if self.__mdr_cache[i] is None]
+            for line, data in self.__mdr_contents(indices):
+                if self.__thread_safe:
+                    self.__decode_line(line, data)
+                else:
+                    mdr_record = self.__record_list[self.__mdr_positions[line]]
+                    new_content = MDR.read(data, mdr_record.grh, giadr)
+                    new_record_list[self.__mdr_positions[line]] = \
+                        Record(mdr_record.grh, new_content)
+            if self.__thread_safe:
+                for line, position in enumerate(self.__mdr_positions):
+                    new_record_list[position] = Record(
+                        self.__record_list[position].grh,
+                        self.__decode_line(line))
+            self.__record_list = new_record_list
+            self.__data_read = True
+
+    def split(self, threshold=None, split_files_names='split_$F',
+              output_dir='.', temp_name='temp', time_interval=None,
+              lines_per_file=None, n_workers=1):
+        """
+        Split the file in several smaller native files. Every new file
+        contains all the records of this file that are not mdr records and
+        a group of consecutive scan lines; its MPHR is updated as in
+        write_subset. The scan lines can be grouped:
+          - by size: every file is not bigger than *threshold* bytes
+          - by time: every file contains the scan lines that begin inside
+            the same interval of *time_interval* (the intervals are aligned
+            to the beginning of the day)
+          - by number: every file contains *lines_per_file* scan lines
+        Exactly one of these arguments must be specified.
+
+        The records are copied byte by byte from this file, without
+        interpreting them; the times are read from the grhs and from the
+        field GEPSDatIasi of all the scan lines at once. Every file is
+        written with a temporary name and then renamed, so a file with its
+        final name is always complete.
+
+        The names of the files are built from split_files_names, replacing
+        $F with the index of the file, $SD and $ED with the first and the
+        last observation time of its scan lines (like 20150101103000Z).
+
+        Args:
+            - *threshold*: the maximum size of a file (in bytes)
+            - *split_files_names*: the template of the names of the files
+            - *output_dir*: the directory where the files are written
+            - *temp_name*: the prefix of the temporary names of the files
+            - *time_interval*: the time covered by a file, as a
+              datetime.timedelta or in seconds
+            - *lines_per_file*: the number of scan lines of a file
+            - *n_workers*: the number of files written at the same time
+
+        Returns:
+            A list with the paths of the new files
+        """
+        criteria = [c for c in (threshold, time_interval, lines_per_file)
+                    if c is not None]
+        if len(criteria) != 1:
+            raise ValueError('Exactly one between threshold, time_interval '
+                             'and lines_per_file must be specified')
+
+        mdr_records = [self.__record_list[p] for p in self.__mdr_positions]
+        if len(mdr_records) == 0:
+            return []
+
+        if threshold is not None:
+            non_mdr_size = sum(r.size for r in self.__record_list
+                               if r.type != 'MDR')
+            if threshold < non_mdr_size + max(r.size for r in mdr_records):
+                raise TooSmallThresholdException('The file can not be '
+                                                 'splitted in the desidered '
+                                                 'size')
+            groups = [[]]
+            file_size = non_mdr_size
+            for k, mdr_record in enumerate(mdr_records):
+                if file_size + mdr_record.size > threshold:
+                    groups.append([])
+                    file_size = non_mdr_size
+                groups[-1].append(k)
+                file_size += mdr_record.size
+        elif time_interval is not None:
+            if isinstance(time_interval, timedelta):
+                time_interval = time_interval.total_seconds()
+            interval_msec = int(round(time_interval * 1000))
+            if interval_msec <= 0:
+                raise ValueError('The time interval must be positive')
+            # The index of the interval of the beginning of each scan line,
+            # counting the intervals from the beginning of the day
+            interval_index = np.array(
+                [(r.grh.record_start_time_day,
+                  r.grh.record_start_time_msec // interval_msec)
+                 for r in mdr_records], dtype=np.int64).reshape(-1, 2)
+            changes = np.flatnonzero(np.any(np.diff(interval_index, axis=0)
+                                            != 0, axis=1)) + 1
+            groups = [g.tolist() for g in
+                      np.split(np.arange(len(mdr_records)), changes)]
+        else:
+            if lines_per_file <= 0:
+                raise ValueError('The number of lines of a file must be '
+                                 'positive')
+            groups = [list(range(k, min(k + lines_per_file,
+                                        len(mdr_records))))
+                      for k in range(0, len(mdr_records), lines_per_file)]
+
+        efov_times = self.get_efov_times()
+        first_times = efov_times.min(axis=1)
+        last_times = efov_times.max(axis=1)
+
+        def time_label(value):
+            return value.astype('datetime64[s]').astype(datetime).strftime(
+                '%Y%m%d%H%M%S') + 'Z'
+
+        def write_group(index):
+            group = groups[index]
+            file_name = split_files_names.replace('$F', str(index))
+            file_name = file_name.replace(
+                '$SD', time_label(first_times[group].min()))
+            file_name = file_name.replace(
+                '$ED', time_label(last_times[group].max()))
+            temp_path = join(output_dir, '{}.{}'.format(temp_name, index))
+            path = join(output_dir, file_name)
+            self.__write_lines(temp_path, group)
+            rename(temp_path, path)
+            return path
+
+        if n_workers > 1 and len(groups) > 1:
+            with ThreadPoolExecutor(n_workers) as executor:
+                return list(executor.map(write_group, range(len(groups))))
+        return [write_group(index) for index in range(len(groups))]
+
+    def write_subset(self, path, mdr_selector):
+        """
+        Write a new native file with all the records of this file that are
+        not mdr records and only some of the mdr records. The records are
+        copied byte by byte from the original file (without interpreting
+        them) and the MPHR is updated with the new sensing times and the new
+        number of records.
+
+        Args:
+            - *path*: the path of the new file
+            - *mdr_selector*: the scan lines to keep; it can be a list of
+              indices, a boolean mask over the scan lines, or a function
+              that receives the index of a scan line and the grh of its
+              record and returns True if the scan line must be kept
+
+        Returns:
+            The number of scan lines written
+        """
+        mdr_positions = self.__mdr_positions
+        if callable(mdr_selector):
+            selected = [k for k, i in enumerate(mdr_positions)
+                        if mdr_selector(k, self.__record_list[i].grh)]
+        else:
+            selected = np.arange(len(mdr_positions))[mdr_selector]
+            selected = sorted(set(int(k) for k in np.atleast_1d(selected)))
+        return self.__write_lines(path, selected)
+
+    def __write_lines(self, path, selected):
+        """
+        Write a new native file with the records that are not mdr records
+        and the selected scan lines (a sorted list of indices); see
+        write_subset
+        """
+        selected_positions = [self.__mdr_positions[k] for k in selected]
+
+        non_mdr_positions = [i for i in range(self.n_of_records)
+                             if self.__record_list[i].type != 'MDR']
+        positions = non_mdr_positions + selected_positions
+        new_size = sum(self.__record_list[i].size for i in positions)
+
+        mphr_record = [r for r in self.__record_list if r.type == 'MPHR']
+        if len(mphr_record) == 0:
+            raise MphrNotFoundException
+        mphr_record = mphr_record[0]
+
+        new_values = {'TOTAL_RECORDS': len(positions),
+                      'TOTAL_MDR': len(selected_positions),
+                      'ACTUAL_PRODUCT_SIZE': new_size}
+        if len(selected_positions) > 0:
+            first_grh = self.__record_list[selected_positions[0]].grh
+            last_grh = self.__record_list[selected_positions[-1]].grh
+            start_time = grh_time(first_grh.record_start_time_day,
+                                  first_grh.record_start_time_msec)
+            end_time = grh_time(last_grh.record_stop_time_day,
+                                last_grh.record_stop_time_msec)
+            new_values['SENSING_START'] = start_time.strftime('%Y%m%d%H%M%SZ')
+            new_values['SENSING_END'] = end_time.strftime('%Y%m%d%H%M%SZ')
+        mphr_raw = mphr_record.grh.raw + \
+            mphr_record.content.raw_with_values(new_values)
+
+        with open(path, 'wb') as output_file:
+            if self.__filename is None:
+                # The grh and the content are written one after the other,
+                # without joining them
+                for i in non_mdr_positions:
+                    rcd = self.__record_list[i]
+                    if rcd is mphr_record:
+                        output_file.write(mphr_raw)
+                    else:
+                        output_file.write(rcd.grh.raw)
+                        output_file.write(rcd.content.raw)
+                for k in selected:
+                    rcd = self.__record_list[self.__mdr_positions[k]]
+                    output_file.write(rcd.grh.raw)
+                    output_file.write(self.__raw_mdr_content(k))
+                return len(selected_positions)
+
+            ranges = []
+            with open(self.__filename, 'rb') as input_file:
+                for i in positions:
+                    rcd = self.__record_list[i]
+                    if rcd is mphr_record:
+                        copy_file_ranges(input_file, output_file, ranges)
+                        ranges = []
+                        output_file.write(mphr_raw)
+                    else:
+                        ranges.append((self.__record_offsets[i], rcd.size))
+                copy_file_ranges(input_file, output_file, ranges)
+
+        return len(selected_positions)
 
     def __iter__(self):
         return self.__record_list.__iter__()
 
-    def get_latitudes(self):
+    @staticmethod
+    def __pixel_field(per_line_values, keep_shape, trailing_shape=(),
+                      data_type=np.float64):
+        """
+        Stack the values of the scan lines (arrays of shape
+        (SNOT, PN) + trailing_shape) in a single array, that is returned
+        with shape (n_of_lines, SNOT, PN) + trailing_shape if keep_shape is
+        True or with one row for each pixel otherwise; data_type is the
+        type of the array when there are no scan lines
+        """
+        if len(per_line_values) == 0:
+            values = np.empty((0, SNOT, PN) + tuple(trailing_shape),
+                              dtype=data_type)
+        else:
+            values = np.stack(per_line_values)
+        if keep_shape:
+            return values
+        return values.reshape((-1,) + tuple(trailing_shape))
+
+    @staticmethod
+    def __efov_field(per_line_values, keep_shape, data_type=np.int32):
+        """
+        Expand the values of each EFOV (an array of shape (SNOT,) for each
+        scan line) to all its pixels. If keep_shape is True, the result is
+        a read-only view of shape (n_of_lines, SNOT, PN) where the values
+        are not repeated in memory. data_type is the type of the array
+        when there are no scan lines.
+        """
+        if len(per_line_values) == 0:
+            values = np.empty((0, SNOT), dtype=data_type)
+        else:
+            values = np.stack(per_line_values)
+        if keep_shape:
+            return np.broadcast_to(values[:, :, np.newaxis],
+                                   values.shape + (PN,))
+        return np.repeat(values.reshape(-1), PN)
+
+    def get_latitudes(self, lines=None, keep_shape=False):
         """
         Return a numpy array with all the latitudes read from all the records
-        of the file.
+        of the file. If keep_shape is True, the array has shape
+        (n_of_lines, SNOT, PN); otherwise, it has a value for each pixel.
         """
-        if not self.__data_read:
-            self.read_mdrs()
-        mdrs = self.get_mdrs()
+        if self.__remote_storage():
+            return self.__raw_pixel_getter('latitudes', lines, keep_shape)
+        mdrs = self.__decoded_mdrs(lines)
         latitudes_list = [mdr.GGeoSondLoc[1,:].T for mdr in mdrs]
-        return np.concatenate(latitudes_list).flatten()
+        return self.__pixel_field(latitudes_list, keep_shape)
 
-    def get_longitudes(self):
+    def get_longitudes(self, lines=None, keep_shape=False):
         """
         Return a numpy array with all the longitudes read from all the records
-        of the file.
+        of the file. If keep_shape is True, the array has shape
+        (n_of_lines, SNOT, PN); otherwise, it has a value for each pixel.
         """
-        if not self.__data_read:
-            self.read_mdrs()
-        mdrs = self.get_mdrs()
+        if self.__remote_storage():
+            return self.__raw_pixel_getter('longitudes', lines, keep_shape)
+        mdrs = self.__decoded_mdrs(lines)
         longitudes_list = [mdr.GGeoSondLoc[0,:].T for mdr in mdrs]
-        return np.concatenate(longitudes_list).flatten()
+        return self.__pixel_field(longitudes_list, keep_shape)
 
-    def get_radiances(self):
+    def get_radiances(self, lines=None, keep_shape=False):
         """
         Return a numpy array with all the radiances read from all the records
-        of the file.
+        of the file. If keep_shape is True, the array has shape
+        (n_of_lines, SNOT, PN, n_of_channels); otherwise, it has a row for
+        each pixel.
         """
-        if not self.__data_read:
-            self.read_mdrs()
-        mdrs = self.get_mdrs()
+        mdrs = self.__decoded_mdrs(lines)
         radiances_list = [mdr.GS1cSpect.T for mdr in mdrs]
-        all_radiances =  np.concatenate(radiances_list)
-        rad_size = all_radiances.size
-        num_ch = all_radiances.shape[-1]
-        new_shape = (rad_size // num_ch, num_ch)
-        return all_radiances.reshape(new_shape)
+        num_ch = radiances_list[0].shape[-1] if radiances_list \
+            else len(self.get_channels())
+        return self.__pixel_field(radiances_list, keep_shape, (num_ch,))
 
-    def get_zenith_angles(self):
+    def get_zenith_angles(self, lines=None, keep_shape=False):
         """
         Return an array with all the zenith angles read from all the records
-        of the file.
+        of the file. If keep_shape is True, the array has shape
+        (n_of_lines, SNOT, PN); otherwise, it has a value for each pixel.
         """
-        if not self.__data_read:
-            self.read_mdrs()
-        mdrs = self.get_mdrs()
+        if self.__remote_storage():
+            return self.__raw_pixel_getter('zenith_angles', lines, keep_shape)
+        mdrs = self.__decoded_mdrs(lines)
         zenith_angles_list = [mdr.GGeoSondAnglesMETOP[0,:].T for mdr in mdrs]
-        return np.concatenate(zenith_angles_list).flatten()
+        return self.__pixel_field(zenith_angles_list, keep_shape)
 
-    def get_solar_zenith_angles(self):
+    def get_solar_zenith_angles(self, lines=None, keep_shape=False):
         """
         Return an array with all the solar zenith angles read from all the records
-        of the file.
+        of the file. If keep_shape is True, the array has shape
+        (n_of_lines, SNOT, PN); otherwise, it has a value for each pixel.
         """
-        if not self.__data_read:
-            self.read_mdrs()
-        mdrs = self.get_mdrs()
+        if self.__remote_storage():
+            return self.__raw_pixel_getter('solar_zenith_angles', lines, keep_shape)
+        mdrs = self.__decoded_mdrs(lines)
         solar_zenith_angles_list = [mdr.GGeoSondAnglesSUN[0,:].T for mdr in mdrs]
-        return np.concatenate(solar_zenith_angles_list).flatten()
+        return self.__pixel_field(solar_zenith_angles_list, keep_shape)
 
-    def get_solar_azimuth_angles(self):
+    def get_solar_azimuth_angles(self, lines=None, keep_shape=False):
         """
         Return an array with all the solar azimuth angles read from all the records
-        of the file.
+        of the file. If keep_shape is True, the array has shape
+        (n_of_lines, SNOT, PN); otherwise, it has a value for each pixel.
         """
-        if not self.__data_read:
-            self.read_mdrs()
-        mdrs = self.get_mdrs()
+        if self.__remote_storage():
+            return self.__raw_pixel_getter('solar_azimuth_angles', lines, keep_shape)
+        mdrs = self.__decoded_mdrs(lines)
         solar_azimuth_angles_list = [mdr.GGeoSondAnglesSUN[1,:].T for mdr in mdrs]
-        return np.concatenate(solar_azimuth_angles_list).flatten()
+        return self.__pixel_field(solar_azimuth_angles_list, keep_shape)
 
-    def get_avhrr_cloud_fractions(self):
+    def get_avhrr_cloud_fractions(self, lines=None, keep_shape=False):
         """
         Return an array with all the avhrr cloud fractions read from all the records
-        of the file.
+        of the file. If keep_shape is True, the array has shape
+        (n_of_lines, SNOT, PN); otherwise, it has a value for each pixel.
         """
-        if not self.__data_read:
-            self.read_mdrs()
-        mdrs = self.get_mdrs()
-        avhrr_cloud_fraction_list = [mdr.GEUMAvhrr1BCldFrac.T for mdr in mdrs]
-        return np.concatenate(avhrr_cloud_fraction_list).flatten()
-
-    def get_land_fractions(self):
+        if self.__remote_storage():
+            return self.__raw_pixel_getter('avhrr_cloud_fractions', lines, keep_shape)
+        mdrs = self.__decoded_mdrs(lines)
+        avhrr_cloud_fraction_list = [mdr.GEUMAvhrr1BCldFrac.reshape(SNOT, PN)
+                                     for mdr in mdrs]
+        return self.__pixel_field(avhrr_cloud_fraction_list, keep_shape,
+                                  data_type=np.uint8)
+
+    def get_land_fractions(self, lines=None, keep_shape=False):
         """
         Return an array with all the land fractions read from all the records
-        of the file.
+        of the file. If keep_shape is True, the array has shape
+        (n_of_lines, SNOT, PN); otherwise, it has a value for each pixel.
         """
-        if not self.__data_read:
-            self.read_mdrs()
-        mdrs = self.get_mdrs()
-        avhrr_cloud_fraction_list = [mdr.GEUMAvhrr1BLandFrac.T for mdr in mdrs]
-        return np.concatenate(avhrr_cloud_fraction_list).flatten()
-
-    def get_date_day(self):
-        if not self.__data_read:
-            self.read_mdrs()
-        mdrs = self.get_mdrs()
+        if self.__remote_storage():
+            return self.__raw_pixel_getter('land_fractions', lines, keep_shape)
+        mdrs = self.__decoded_mdrs(lines)
+        land_fraction_list = [mdr.GEUMAvhrr1BLandFrac.reshape(SNOT, PN)
+                              for mdr in mdrs]
+        return self.__pixel_field(land_fraction_list, keep_shape,
+                                  data_type=np.uint8)
+
+    def get_date_day(self, lines=None, keep_shape=False):
+        """
+        Return the day of the observation of each pixel (days since
+        2000-01-01). If keep_shape is True, the array is a read-only view
+        of shape (n_of_lines, SNOT, PN), since all the pixels of an EFOV
+        share the same value.
+        """
+        mdrs = self.__decoded_mdrs(lines)
         date_day_list = [mdr.GEPSDatIasi[:,0] for mdr in mdrs]
-        return np.repeat(np.concatenate(date_day_list), 4)
+        return self.__efov_field(date_day_list, keep_shape)
 
-    def get_date_msec(self):
-        if not self.__data_read:
-            self.read_mdrs()
-        mdrs = self.get_mdrs()
+    def get_date_msec(self, lines=None, keep_shape=False):
+        """
+        Return the milliseconds of the day of the observation of each pixel.
+        If keep_shape is True, the array is a read-only view of shape
+        (n_of_lines, SNOT, PN), since all the pixels of an EFOV share the
+        same value.
+        """
+        mdrs = self.__decoded_mdrs(lines)
         date_msec_list = [mdr.GEPSDatIasi[:,1] for mdr in mdrs]
-        return np.repeat(np.concatenate(date_msec_list), 4)
+        return self.__efov_field(date_msec_list, keep_shape)
 
-    def get_obs_times(self):
+    def get_obs_times(self, lines=None, keep_shape=False):
         """
         Combine together the date_msec and the date_day array and return
         an array of datetime64 objects that represent the time when the
-        observations have been collected
+        observations have been collected. If keep_shape is True, the array
+        is a read-only view of shape (n_of_lines, SNOT, PN).
         """
-        msec = self.get_date_msec().astype(np.int64)
-        days = self.get_date_day().astype(np.int64)
+        mdrs = self.__decoded_mdrs(lines)
+        dates = [mdr.GEPSDatIasi for mdr in mdrs]
+        if len(dates) == 0:
+            dates = np.empty((0, SNOT, 2), dtype=np.int32)
+        else:
+            dates = np.stack(dates)
+        msec = dates[:, :, 1].astype(np.int64)
+        days = dates[:, :, 0].astype(np.int64)
 
         msec.dtype = 'timedelta64[ms]'
         days.dtype = 'timedelta64[D]'
 
         start_time = np.datetime64('2000-01-01T00:00:00Z')
 
-        return start_time + days + msec
+        return self.__efov_field(start_time + days + msec, keep_shape,
+                                 'datetime64[ms]')
+
+    def get_efov_times(self, lines=None):
+        """
+        Return an array of datetime64 objects of shape (n_of_lines, SNOT)
+        with the time of each EFOV (the field GEPSDatIasi); the values are
+        read directly from the file, without interpreting the mdr records.
+        """
+        cds_time = np.dtype([('day', '>u2'), ('msec', '>u4')])
+        dates = self.__read_field('GEPSDatIasi', cds_time, (SNOT,), lines)
+
+        days = dates['day'].astype(np.int64).astype('timedelta64[D]')
+        msec = dates['msec'].astype(np.int64).astype('timedelta64[ms]')
+        return np.datetime64('2000-01-01T00:00:00') + days + msec
+
+    def get_quality_flags(self, lines=None, keep_shape=False):
+        """
+        Return an array of bool with a value for each pixel which is True if
+        the spectrum of the pixel is flagged as not valid (for the records
+        with subclass version 5, if it is flagged in at least one of the
+        three bands); the values are read directly from the file. If
+        keep_shape is True, the array has shape (n_of_lines, SNOT, PN).
+        """
+        version = self.__mdr_version()
+        if version == 4:
+            flags = self.__read_field('GQisFlagQual', np.uint8, (SNOT, PN),
+                                      lines) != 0
+        else:
+            flags = self.__read_field('GQisFlagQual_SCV5', np.uint8,
+                                      (SNOT, PN, 3), lines).any(axis=-1)
+        return flags if keep_shape else flags.reshape(-1)
+
+    def get_detailed_quality_flags(self, lines=None, keep_shape=False):
+        """
+        Return an array of uint16 with the detailed quality flags (a bit
+        field) of each pixel; they are available only in the records with
+        subclass version 5. If keep_shape is True, the array has shape
+        (n_of_lines, SNOT, PN).
+        """
+        flags = self.__read_field('GQisFlagQualDetailed', '>u2', (SNOT, PN),
+                                  lines).astype(np.uint16)
+        return flags if keep_shape else flags.reshape(-1)
+
+    def get_iis_images(self, calibrated=False, lines=None):
+        """
+        Return the images of the IASI Integrated Imaging Subsystem (the
+        field GIrcImage of the mdr records) as an array of shape
+        (n_of_mdrs, SNOT, IMLI, IMCO).
+
+        If *calibrated* is False, the array contains the raw counts saved
+        on the file and it is a read-only view on the content of the file
+        (no data is copied, and the mdrs do not need to be read in advance).
+        Otherwise, the scale factor of the GIADR scalefactor record is
+        applied and the radiances are returned as float32.
+
+        Args:
+            - *calibrated*: a boolean; if True, return the radiances
+
+        Returns:
+            A numpy array
+        """
+        images = self.__read_field('GIrcImage', '>u2', (SNOT, IMLI, IMCO),
+                                   lines)
+        if not calibrated:
+            return images
+
+        scale_factor = self.get_giadr_scalefactors().IDefScaleIISScaleFactor
+        return images * np.float32(10. ** -scale_factor)
+
+    def get_iis_geolocation(self, lines=None):
+        """
+        Return the geolocation of the IIS sub-grid (the field GGeoIISLoc of
+        the mdr records) as an array of shape (n_of_mdrs, SNOT, SGI, 2); the
+        last axis contains the longitude and the latitude (in this order)
+        of each point, in degrees.
+        """
+        geolocation = self.__read_field('GGeoIISLoc', '>i4', (SNOT, SGI, 2),
+                                        lines)
+        return geolocation / 1e6
+
+    def get_iis_footprint_statistics(self, masks=None, lines=None):
+        """
+        Compute some statistics of the calibrated IIS radiances inside the
+        footprint of each sounder pixel; the dead pixels of the IIS (as
+        reported by the GIADR quality record) are ignored.
+
+        Args:
+            - *masks*: a boolean array of shape (PN, IMLI, IMCO) with the
+              footprint of each sounder pixel on the IIS image; if None,
+              the masks returned by iis.footprint_masks() are used
+            - *lines*: the scan lines to read
+
+        Returns:
+            A dictionary with the keys "mean", "std", "min" and "max"; every
+            value is an array with one element for each pixel
+        """
+        if masks is None:
+            masks = footprint_masks()
+        try:
+            dead_pixels = self.get_giadr_quality().IDefDptIISDeadPix
+            masks = masks & ~dead_pixels[np.newaxis, :, :]
+        except GiadrQualityNotFoundException:
+            pass
+
+        images = self.get_iis_images(calibrated=True, lines=lines)
+        statistics = footprint_statistics(images, masks)
+        return dict((k, v.reshape(-1)) for k, v in statistics.items())
+
+    def get_avhrr_cluster_numbers(self, lines=None):
+        """
+        Return an array with the number of classes found by the cluster
+        analysis of the AVHRR radiances (GCcsRadAnalNbClass) for each pixel
+        of the file.
+        """
+        nb_class = self.__read_field('GCcsRadAnalNbClass', '>i4', (SNOT, PN),
+                                     lines)
+        return nb_class.reshape(-1)
+
+    def get_avhrr_cluster_weights(self, lines=None):
+        """
+        Return an array of shape (n_of_pixels, NCL) with the weight of each
+        class of the AVHRR cluster analysis (GCcsRadAnalWgt)
+        """
+        weights = self.__read_vint_field('GCcsRadAnalWgt', (SNOT, PN, NCL),
+                                         lines)
+        return weights.reshape(-1, NCL)
+
+    def get_avhrr_cluster_y_positions(self, lines=None):
+        """
+        Return an array of shape (n_of_pixels, NCL) with the Y angular
+        position of the centre of gravity of each class of the AVHRR cluster
+        analysis (GCcsRadAnalY)
+        """
+        y = self.__read_field('GCcsRadAnalY', '>i4', (SNOT, PN, NCL), lines)
+        return y.reshape(-1, NCL) / 1e6
+
+    def get_avhrr_cluster_z_positions(self, lines=None):
+        """
+        Return an array of shape (n_of_pixels, NCL) with the Z angular
+        position of the centre of gravity of each class of the AVHRR cluster
+        analysis (GCcsRadAnalZ)
+        """
+        z = self.__read_field('GCcsRadAnalZ', '>i4', (SNOT, PN, NCL), lines)
+        return z.reshape(-1, NCL) / 1e6
+
+    def get_avhrr_cluster_means(self, lines=None):
+        """
+        Return an array of shape (n_of_pixels, NCL, NBK) with the mean AVHRR
+        radiance of each class in each AVHRR channel (GCcsRadAnalMean)
+        """
+        means = self.__read_vint_field('GCcsRadAnalMean',
+                                       (SNOT, PN, NCL, NBK), lines)
+        return means.reshape(-1, NCL, NBK)
+
+    def get_avhrr_cluster_stds(self, lines=None):
+        """
+        Return an array of shape (n_of_pixels, NCL, NBK) with the standard
+        deviation of the AVHRR radiance of each class in each AVHRR channel
+        (GCcsRadAnalStd)
+        """
+        stds = self.__read_vint_field('GCcsRadAnalStd',
+                                      (SNOT, PN, NCL, NBK), lines)
+        return stds.reshape(-1, NCL, NBK)
+
+    def __valid_cluster_weights(self, lines):
+        """
+        The weights of the AVHRR classes where the weights of the classes
+        that do not exist (the ones after GCcsRadAnalNbClass) are set to 0
+        """
+        weights = self.get_avhrr_cluster_weights(lines)
+        nb_class = self.get_avhrr_cluster_numbers(lines)
+        valid = np.arange(NCL)[np.newaxis, :] < nb_class[:, np.newaxis]
+        return np.where(valid, weights, 0.)
+
+    def get_avhrr_dominant_class_fractions(self, lines=None):
+        """
+        Return an array with the fraction of each pixel covered by the
+        dominant class of the AVHRR cluster analysis (the weight of the
+        heaviest class divided by the sum of the weights). Pixels without
+        any class are set to nan.
+        """
+        weights = self.__valid_cluster_weights(lines)
+        total = weights.sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(total > 0, weights.max(axis=1) / total, np.nan)
+
+    def get_avhrr_weighted_means(self, lines=None):
+        """
+        Return an array of shape (n_of_pixels, NBK) with the mean AVHRR
+        radiance of each pixel in each AVHRR channel, i.e. the average of
+        the means of the classes weighted by the weights of the classes.
+        Pixels without any class are set to nan.
+        """
+        weights = self.__valid_cluster_weights(lines)
+        means = self.get_avhrr_cluster_means(lines)
+        total = weights.sum(axis=1)
+        weighted_sum = np.einsum('pc,pcb->pb', weights, means)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(total[:, np.newaxis] > 0,
+                            weighted_sum / total[:, np.newaxis],
+                            np.nan)
 
     def get_channels(self):
         return np.linspace(645, 2760, 8461)
@@ -459,17 +2129,7 @@ class IasiL1cNativeFile(object):
         else:
             shape = to_save.shape
 
-        data_size = str(data_type.itemsize)
-        i = 0
-        while not data_type.name[i:].isdigit():
-            i+=1
-        data_name = data_type.name[:i].replace('float', 'real')
-
-        complete_file_name = file_name + '.' + data_name + data_size
-
-        if len(shape)>1:
-            for i in range(1,len(shape)):
-                complete_file_name += '.' + str(shape[i])
+        complete_file_name = fbf_file_name(file_name, data_type, shape)
 
         file_path = join(output_dir, complete_file_name)
         with open(file_path, 'wb') as fbf_file:
@@ -0,0 +1,122 @@
+"""
+Piasi-reader: a library to read and convert the native IASI L1C files
+Copyright (C) 2015  Stefano Piani
+
+This library is free software; you can redistribute it and/or
+modify it under the terms of the GNU Lesser General Public
+License as published by the Free Software Foundation; either
+version 3.0 of the License, or (at your option) any later version.
+
+This library is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with this library; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+from __future__ import division
+
+import numpy as np
+
+from piasi_reader.parameters import IMCO, IMLI, PN
+
+
+# Nominal geometry of the instrument (in mrad): the IIS image covers the
+# whole EFOV, while the four circular IFOVs of the sounder are centred on
+# the four quadrants of the EFOV
+IIS_FIELD_OF_VIEW = 59.63
+EFOV_SIZE = 57.6
+IFOV_DIAMETER = 14.65
+
+# The position of the centre of each IFOV inside the EFOV, expressed as
+# (line, column) signs with respect to the centre of the IIS image
+IFOV_QUADRANTS = ((1, 1), (1, -1), (-1, -1), (-1, 1))
+
+_masks_cache = {}
+
+
+def footprint_masks(quadrants=IFOV_QUADRANTS, ifov_diameter=IFOV_DIAMETER,
+                    efov_size=EFOV_SIZE, iis_field_of_view=IIS_FIELD_OF_VIEW):
+    """
+    Return a boolean array of shape (PN, IMLI, IMCO) which is True on the
+    IIS pixels that fall inside the footprint of each sounder pixel. The
+    footprints are computed from the nominal angular geometry of the
+    instrument, so they are the same for every EFOV and every scan line;
+    for this reason, they are computed only once for each set of arguments.
+
+    Args:
+        - *quadrants*: a sequence of PN couples with the signs of the line
+          and column offsets of the centre of each IFOV
+        - *ifov_diameter*: the angular diameter of an IFOV (mrad)
+        - *efov_size*: the angular size of the EFOV (mrad)
+        - *iis_field_of_view*: the angular size of the IIS image (mrad)
+
+    Returns:
+        A numpy array of bool (read-only)
+    """
+    key = (tuple(tuple(q) for q in quadrants), ifov_diameter, efov_size,
+           iis_field_of_view)
+    if key in _masks_cache:
+        return _masks_cache[key]
+
+    pixel_size = iis_field_of_view / IMLI
+    centre_offset = efov_size / 4. / pixel_size
+    radius = ifov_diameter / 2. / pixel_size
+
+    image_lines = np.arange(IMLI) - (IMLI - 1) / 2.
+    image_columns = np.arange(IMCO) - (IMCO - 1) / 2.
+
+    masks = np.zeros((PN, IMLI, IMCO), dtype=bool)
+    for p, (line_sign, column_sign) in enumerate(quadrants):
+        d_line = image_lines[:, np.newaxis] - line_sign * centre_offset
+        d_column = image_columns[np.newaxis, :] - column_sign * centre_offset
+        masks[p] = d_line**2 + d_column**2 <= radius**2
+
+    masks.flags.writeable = False
+    _masks_cache[key] = masks
+    return masks
+
+
+def footprint_statistics(images, masks=None):
+    """
+    Compute the mean, the standard deviation, the minimum and the maximum of
+    the IIS images inside the footprint of each sounder pixel, for all the
+    EFOVs at the same time.
+
+    Args:
+        - *images*: an array of shape (..., IMLI, IMCO), like the one
+          returned by the get_iis_images method of a IasiL1cNativeFile
+        - *masks*: a boolean array of shape (PN, IMLI, IMCO), like the one
+          returned by footprint_masks (which is used if masks is None)
+
+    Returns:
+        A dictionary with the keys "mean", "std", "min" and "max"; every
+        value is an array of shape (..., PN)
+    """
+    if masks is None:
+        masks = footprint_masks()
+
+    images = np.asarray(images)
+    outer_shape = images.shape[:-2]
+    flat_images = images.reshape(-1, IMLI * IMCO)
+    flat_masks = np.asarray(masks).reshape(PN, IMLI * IMCO)
+
+    statistics = dict((k, np.empty((flat_images.shape[0], PN)))
+                      for k in ('mean', 'std', 'min', 'max'))
+    for p in range(PN):
+        pixels = flat_images[:, np.flatnonzero(flat_masks[p])]
+        if pixels.shape[1] == 0:
+            for k in statistics:
+                statistics[k][:, p] = np.nan
+            continue
+        pixels = pixels.astype(np.float64)
+        statistics['mean'][:, p] = pixels.mean(axis=1)
+        statistics['std'][:, p] = pixels.std(axis=1)
+        statistics['min'][:, p] = pixels.min(axis=1)
+        statistics['max'][:, p] = pixels.max(axis=1)
+
+    return dict((k, v.reshape(outer_shape + (PN,)))
+                for k, v in statistics.items())
@@ -0,0 +1,183 @@
+"""
+Piasi-reader: a library to read and convert the native IASI L1C files
+Copyright (C) 2015  Stefano Piani
+
+This library is free software; you can redistribute it and/or
+modify it under the terms of the GNU Lesser General Public
+License as published by the Free Software Foundation; either
+version 3.0 of the License, or (at your option) any later version.
+
+This library is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with this library; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+from __future__ import division
+
+from collections.abc import Mapping
+from inspect import signature
+
+import numpy as np
+
+
+# The getters that return a dictionary of arrays instead of an array: every
+# entry of the dictionary is a field on its own, named "<field>.<key>"
+DICT_FIELDS = {'iis_footprint_statistics': ('mean', 'std', 'min', 'max')}
+
+
+class LazyField(object):
+    """
+    An array-like object that represents a field of a file (for example,
+    its radiances) without reading it. When it is indexed, only the scan
+    lines that contain the requested elements are read.
+
+    The first axis of the array runs over the elements returned by the
+    getter of the field (usually the pixels of the file); the object can be
+    indexed along it with integers, slices, lists of indices or boolean
+    masks, followed by any index for the other axes.
+
+    Args:
+        - *source*: an object with a n_of_lines property and a getter
+          "get_" + name that accepts a lines argument (like a
+          IasiL1cNativeFile)
+        - *name*: the name of the field (like "radiances"); for the getters
+          in DICT_FIELDS, the name is "<field>.<key>" (like
+          "iis_footprint_statistics.mean")
+    """
+    def __init__(self, source, name):
+        self.__source = source
+        self.__name = name
+        field, _, key = name.partition('.')
+        getter = getattr(source, 'get_' + field)
+        if key:
+            def getter(lines=None, _getter=getter):
+                return _getter(lines=lines)[key]
+        self.__getter = getter
+        self.__rows_per_line = None
+        self.__line_shape = None
+        self.__dtype = None
+
+    def __probe(self):
+        """
+        Read the first scan line to know the shape and the type of the data
+        """
+        if self.__dtype is not None:
+            return
+        if self.__source.n_of_lines == 0:
+            raise ValueError('The file has no scan lines')
+        sample = self.__getter(lines=[0])
+        if not isinstance(sample, np.ndarray):
+            raise TypeError('The field {} is not an array'.format(self.__name))
+        self.__rows_per_line = sample.shape[0]
+        self.__line_shape = sample.shape[1:]
+        self.__dtype = sample.dtype
+
+    @property
+    def name(self):
+        return self.__name
+
+    @property
+    def shape(self):
+        self.__probe()
+        return ((self.__source.n_of_lines * self.__rows_per_line,) +
+                self.__line_shape)
+
+    @property
+    def dtype(self):
+        self.__probe()
+        return self.__dtype
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape))
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __repr__(self):
+        return 'LazyField({}, shape={}, dtype={})'.format(self.__name,
+                                                          self.shape,
+                                                          self.dtype)
+
+    def __array__(self, dtype=None, copy=None):
+        data = self.__getter()
+        if dtype is not None:
+            data = data.astype(dtype)
+        return data
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        if len(key) > 0 and key[0] is Ellipsis:
+            key = (slice(None),) * (self.ndim - len(key) + 1) + key[1:]
+        first, rest = (key[0], key[1:]) if len(key) > 0 else (slice(None), ())
+
+        n_of_rows = self.shape[0]
+        scalar = isinstance(first, (int, np.integer))
+        rows = np.arange(n_of_rows)[first]
+        rows = np.atleast_1d(rows)
+
+        # Read only the scan lines that contain the requested rows
+        line_of_rows = rows // self.__rows_per_line
+        lines, position = np.unique(line_of_rows, return_inverse=True)
+        if lines.size == 0:
+            data = np.zeros((0,) + self.__line_shape, dtype=self.__dtype)
+            return data[(slice(None),) + rest]
+        data = self.__getter(lines=lines)
+        local_rows = (position * self.__rows_per_line +
+                      rows % self.__rows_per_line)
+
+        if scalar:
+            return data[(local_rows[0],) + rest]
+        return data[(local_rows,) + rest]
+
+
+class FieldMapping(Mapping):
+    """
+    A read-only dictionary that associates to the name of every field of a
+    file a LazyField object. The fields are the ones that have a getter
+    that accepts the lines argument; the getters that return a dictionary
+    (see DICT_FIELDS) give a field for each entry.
+
+    Args:
+        - *source*: a IasiL1cNativeFile (or an object with the same getters)
+        - *prototype*: the class whose getters define the available fields;
+          if None, the class of source
+    """
+    def __init__(self, source, prototype=None):
+        self.__source = source
+        if prototype is None:
+            prototype = type(source)
+        names = []
+        for attribute in dir(prototype):
+            if not attribute.startswith('get_'):
+                continue
+            method = getattr(prototype, attribute)
+            if callable(method) and 'lines' in signature(method).parameters:
+                name = attribute[len('get_'):]
+                if name in DICT_FIELDS:
+                    names.extend(name + '.' + key
+                                 for key in DICT_FIELDS[name])
+                else:
+                    names.append(name)
+        self.__names = tuple(sorted(names))
+
+    def __getitem__(self, name):
+        if name not in self.__names:
+            raise KeyError(name)
+        return LazyField(self.__source, name)
+
+    def __iter__(self):
+        return iter(self.__names)
+
+    def __len__(self):
+        return len(self.__names)
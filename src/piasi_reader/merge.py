@@ -0,0 +1,210 @@
+"""
+Piasi-reader: a library to read and convert the native IASI L1C files
+Copyright (C) 2015  Stefano Piani
+
+This library is free software; you can redistribute it and/or
+modify it under the terms of the GNU Lesser General Public
+License as published by the Free Software Foundation; either
+version 3.0 of the License, or (at your option) any later version.
+
+This library is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with this library; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+from inspect import signature
+
+import numpy as np
+
+from piasi_reader.iasi_l1c_native_file import IasiL1cNativeFile
+from piasi_reader.lazy import FieldMapping
+
+
+def _grh_line_times(iasi_file):
+    """
+    The start time of every scan line of a file (in milliseconds since
+    2000-01-01), read from the grhs of the mdr records
+    """
+    grhs = [r.grh for r in iasi_file if r.type == 'MDR']
+    return np.array([g.record_start_time_day * 86400000 +
+                     g.record_start_time_msec for g in grhs], dtype=np.int64)
+
+
+def _efov_line_times(iasi_file):
+    """
+    The time of the first EFOV of every scan line of a file (in
+    milliseconds since 2000-01-01), read from the field GEPSDatIasi
+    """
+    times = iasi_file.get_efov_times()[:, 0]
+    return (times - np.datetime64('2000-01-01T00:00:00')).astype(np.int64)
+
+
+def _renumber_lines(values, file_lines, merged_lines):
+    """
+    If values (the result of a getter called on some scan lines of a file)
+    has a "line" column (like the tables of get_observations), replace the
+    indices of the lines inside the file with their indices in the merged
+    files
+    """
+    if isinstance(values, dict):
+        has_line = 'line' in values
+    else:
+        has_line = values.dtype.names is not None and \
+            'line' in values.dtype.names
+    if not has_line:
+        return values
+    lookup = np.zeros(np.max(file_lines) + 1, dtype=values['line'].dtype)
+    lookup[file_lines] = merged_lines
+    values['line'] = lookup[values['line']]
+    return values
+
+
+class IasiL1cMergedFiles(object):
+    """
+    A virtual file made by the scan lines of several native files, sorted by
+    time; the scan lines that appear in more than one file (because
+    consecutive granules overlap) are kept only once.
+
+    The object exposes the same getters of a IasiL1cNativeFile that return
+    a value for each observation (get_latitudes, get_radiances, ...): every
+    getter reads from each file only the scan lines that have been kept, so
+    the duplicated lines are never decoded.
+
+    Args:
+        - *files*: a non empty list of IasiL1cNativeFile objects or of paths
+        - *time_source*: "grh" to sort the scan lines using the start time
+          saved in the grhs of the records (no data must be read), or "efov"
+          to use the time of the first EFOV of each line (GEPSDatIasi)
+    """
+    def __init__(self, files, time_source='grh'):
+        self.__files = [f if isinstance(f, IasiL1cNativeFile)
+                        else IasiL1cNativeFile(f) for f in files]
+        if len(self.__files) == 0:
+            raise ValueError('At least one file is required')
+
+        if time_source == 'grh':
+            time_reader = _grh_line_times
+        elif time_source == 'efov':
+            time_reader = _efov_line_times
+        else:
+            raise ValueError('Invalid time source: ' + str(time_source))
+
+        times = []
+        file_indices = []
+        line_indices = []
+        for i, iasi_file in enumerate(self.__files):
+            file_times = time_reader(iasi_file)
+            times.append(file_times)
+            file_indices.append(np.full(file_times.shape, i, dtype=np.int64))
+            line_indices.append(np.arange(file_times.shape[0]))
+        times = np.concatenate(times) if times else np.zeros(0, np.int64)
+        file_indices = np.concatenate(file_indices) if times.size else times
+        line_indices = np.concatenate(line_indices) if times.size else times
+
+        # Sort by time; when two lines have the same time, the one of the
+        # first file comes first and it is the one that is kept
+        order = np.lexsort((line_indices, file_indices, times))
+        unique = np.ones(order.shape, dtype=bool)
+        unique[1:] = np.diff(times[order]) != 0
+        order = order[unique]
+
+        self.__times = times[order]
+        self.__file_indices = file_indices[order]
+        self.__line_indices = line_indices[order]
+
+    @property
+    def files(self):
+        """
+        The list of the IasiL1cNativeFile objects that are merged
+        """
+        return list(self.__files)
+
+    @property
+    def n_of_lines(self):
+        """
+        The number of (unique) scan lines of the merged files
+        """
+        return self.__times.shape[0]
+
+    @property
+    def line_origins(self):
+        """
+        An array of shape (n_of_lines, 2) with, for each scan line, the
+        index of the file it comes from and its index inside that file
+        """
+        return np.stack([self.__file_indices, self.__line_indices], axis=1)
+
+    def __runs(self, lines):
+        """
+        Split the selected scan lines into runs of consecutive lines that
+        come from the same file; yield the index of the file, the indices
+        of the lines inside that file and their indices in the merged files
+        """
+        selected = np.arange(self.n_of_lines)[slice(None) if lines is None
+                                              else lines]
+        selected = np.atleast_1d(selected)
+        if selected.size == 0:
+            return
+        file_indices = self.__file_indices[selected]
+        boundaries = np.flatnonzero(np.diff(file_indices)) + 1
+        for run in np.split(selected, boundaries):
+            yield self.__file_indices[run[0]], self.__line_indices[run], run
+
+    def __merged_getter(self, name):
+        def getter(*args, **kwargs):
+            lines = kwargs.pop('lines', None)
+            parts = []
+            for i, file_lines, merged_lines in self.__runs(lines):
+                part = getattr(self.__files[i], name)(*args, lines=file_lines,
+                                                      **kwargs)
+                parts.append(_renumber_lines(part, file_lines, merged_lines))
+            if len(parts) == 0:
+                # Let the first file build an empty result of the right type
+                part = getattr(self.__files[0], name)(*args, lines=[],
+                                                      **kwargs)
+                parts.append(part)
+            if isinstance(parts[0], dict):
+                return parts[0].__class__(
+                    (k, np.concatenate([p[k] for p in parts]))
+                    for k in parts[0])
+            return np.concatenate(parts)
+        getter.__name__ = name
+        getter.__doc__ = getattr(IasiL1cNativeFile, name).__doc__
+        return getter
+
+    def __getattr__(self, name):
+        if name.startswith('get_') and hasattr(IasiL1cNativeFile, name):
+            method = getattr(IasiL1cNativeFile, name)
+            if 'lines' in signature(method).parameters:
+                return self.__merged_getter(name)
+        raise AttributeError(name)
+
+    @property
+    def fields(self):
+        """
+        A read-only dictionary with a LazyField for each field of the merged
+        files; see IasiL1cNativeFile.fields
+        """
+        return FieldMapping(self, IasiL1cNativeFile)
+
+    def get_channels(self):
+        return self.__files[0].get_channels()
+
+    def iter_chunks(self, fields, lines_per_chunk=10):
+        """
+        Iterate over the scan lines of the merged files, a group of lines
+        at a time; see IasiL1cNativeFile.iter_chunks
+        """
+        getters = [(field, getattr(self, 'get_' + field)) for field in fields]
+        n_of_lines = self.n_of_lines
+        for start in range(0, n_of_lines, lines_per_chunk):
+            lines = slice(start, min(start + lines_per_chunk, n_of_lines))
+            chunk = {'lines': lines}
+            for field, getter in getters:
+                chunk[field] = getter(lines=lines)
+            yield chunk
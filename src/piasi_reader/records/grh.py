@@ -28,6 +28,14 @@ grh_type_dict = { 1 : 'MPHR',
                   7 : 'VIADR',
                   8 : 'MDR'}
 
+class InvalidRecordException(ValueError):
+    """
+    This error is raised when a record can not be read because the file is
+    truncated or corrupted
+    """
+    pass
+
+
 class GRH(object):
 
     size = 20 # This is the dimension (in bytes) of the grh
@@ -45,8 +53,24 @@ class GRH(object):
     
     @staticmethod
     def read_grh(f):
+        """
+        Read a grh from a file descriptor. Return None if the file is
+        already at its end; raise an InvalidRecordException if the grh is
+        truncated or if its content is not valid.
+        """
         raw_data = f.read(GRH.size)
+        if len(raw_data) == 0:
+            return None
+        if len(raw_data) < GRH.size:
+            raise InvalidRecordException('Truncated grh: only {} bytes '
+                                         'read'.format(len(raw_data)))
         grh_data = unpack('>BBBBIHIHI',raw_data)
+        if grh_data[0] not in grh_type_dict:
+            raise InvalidRecordException('Invalid record class: ' +
+                                         str(grh_data[0]))
+        if grh_data[4] < GRH.size:
+            raise InvalidRecordException('Invalid record size: ' +
+                                         str(grh_data[4]))
         grh = GRH()
         grh.__record_class = grh_data[0]
         grh.instrument_group = grh_data[1]
@@ -87,3 +111,27 @@ class GRH(object):
                                   self.record_stop_time_day,
                                   self.record_stop_time_msec
                                  )
+
+
+def read_record_directory(f):
+    """
+    Read only the grhs of all the records of a file, skipping the content of
+    the records. The file must support the seek method.
+
+    Args:
+        - *f*: A file descriptor
+
+    Returns:
+        A list of tuples (offset, grh), where offset is the position of the
+        record inside the file
+    """
+    directory = []
+    offset = f.tell()
+    while True:
+        grh = GRH.read_grh(f)
+        if grh is None:
+            break
+        directory.append((offset, grh))
+        offset += grh.record_size
+        f.seek(offset)
+    return directory
@@ -18,6 +18,7 @@ Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
 """
 
 from struct import unpack
+from collections import OrderedDict
 from numpy import fromstring, dtype, int8, int16, int32, uint8, uint16, uint32, bool_, arange, newaxis, zeros, float64
 
 from piasi_reader.utilities import read_vint, read_short_date, where_greater
@@ -25,6 +26,133 @@ from piasi_reader.records.record_content import interpreted_content
 from piasi_reader.records.grh import GRH
 from piasi_reader.parameters import AMCO, AMLI, CCD, IMLI, IMCO, NBK, NCL, PN, SB, SGI, SNOT, SS
 
+_layouts = {}
+
+def mdr_layout(record_subclass_version):
+    """
+    Return the layout of the content of a MDR record, i.e. an OrderedDict
+    that associates to the name of every field a tuple (offset, size) with
+    the position (in bytes) of the field inside the record (without the
+    grh). The layout depends on the subclass version of the record.
+
+    Args:
+        - *record_subclass_version*: the subclass version of the record
+          (4 or 5)
+
+    Returns:
+        An OrderedDict
+    """
+    if record_subclass_version in _layouts:
+        return _layouts[record_subclass_version]
+
+    fields = [('degraded_inst_mdr', 1),
+              ('degraded_proc_mdr', 1),
+              ('GEPSIasiMode', 4),
+              ('GEPSOPSPROCMode', 4),
+              ('GEPSIdConf', 32),
+              ('GEPSLocIasiAvhrr_IASI', 2 * PN * SNOT * 5),
+              ('GEPSLocIasiAvhrr_IIS', 2 * SGI * SNOT * 5),
+              ('OBT', 6 * SNOT),
+              ('ONBoardUTC', SNOT * 6),
+              ('GEPSDatIasi', SNOT * 6),
+              ('GIsfLinOrigin', CCD * 4),
+              ('GIsfColOrigin', CCD * 4),
+              ('GIsfPds1', CCD * 4),
+              ('GIsfPds2', CCD * 4),
+              ('GIsfPds3', CCD * 4),
+              ('GIsfPds4', CCD * 4),
+              ('GEPS_CCD', SNOT),
+              ('GEPS_SP', SNOT * 4),
+              ('GIrcImage', IMCO * IMLI * SNOT * 2)]
+    if record_subclass_version == 4:
+        fields += [('GQisFlagQual', PN * SNOT)]
+    elif record_subclass_version == 5:
+        fields += [('GQisFlagQual_SCV5', SB * PN * SNOT),
+                   ('GQisFlagQualDetailed', PN * SNOT * 2)]
+    fields += [('GQisQualIndex', 5),
+               ('GQisQualIndexIIS', 5),
+               ('GQisQualIndexLoc', 5),
+               ('GQisQualIndexRad', 5),
+               ('GQisQualIndexSpect', 5),
+               ('GQisSysTecIISQual', 4),
+               ('GQisSysTecSondQual', 4),
+               ('GGeoSondLoc', 2 * PN * SNOT * 4),
+               ('GGeoSondAnglesMETOP', 2 * PN * SNOT * 4),
+               ('GGeoIISAnglesMETOP', 2 * SGI * SNOT * 4),
+               ('GGeoSondAnglesSUN', 2 * PN * SNOT * 4),
+               ('GGeoIISAnglesSUN', 2 * SGI * SNOT * 4),
+               ('GGeoIISLoc', 2 * SGI * SNOT * 4),
+               ('earth_satellite_distance', 4),
+               ('IDefSpectDWn1b', 5),
+               ('IDefNsFirst1b', 4),
+               ('IDefNsLast1b', 4),
+               ('GS1cSpect', SS * PN * SNOT * 2),
+               ('IDefCovarMatEigenVal1c', CCD * 100 * 5),
+               ('IDefCcsChannelId', NBK * 4),
+               ('GCcsRadAnalNbClass', PN * SNOT * 4),
+               ('GCcsRadAnalWgt', NCL * PN * SNOT * 5),
+               ('GCcsRadAnalY', NCL * PN * SNOT * 4),
+               ('GCcsRadAnalZ', NCL * PN * SNOT * 4),
+               ('GCcsRadAnalMean', NBK * NCL * PN * SNOT * 5),
+               ('GCcsRadAnalStd', NBK * NCL * PN * SNOT * 5),
+               ('GCcsImageClassified', AMCO * AMLI * SNOT),
+               ('IDefCcsMode', 4),
+               ('GCcsImageClassifiedNbLin', SNOT * 2),
+               ('GCcsImageClassifiedNbCol', SNOT * 2),
+               ('GCcsImageClassifiedFirstLin', SNOT * 5),
+               ('GCcsImageClassifiedFirstCol', SNOT * 5),
+               ('GCcsRadAnalType', NCL * SNOT)]
+    if record_subclass_version == 5:
+        fields += [('GIacVarImagIIS', SNOT * 5),
+                   ('GIacAvgImagIIS', SNOT * 5),
+                   ('GEUMAvhrr1BCldFrac', PN * SNOT),
+                   ('GEUMAvhrr1BLandFrac', PN * SNOT),
+                   ('GEUMAvhrr1BQual', PN * SNOT)]
+
+    layout = OrderedDict()
+    offset = 0
+    for name, size in fields:
+        layout[name] = (offset, size)
+        offset += size
+
+    _layouts[record_subclass_version] = layout
+    return layout
+
+
+def mdr_record_size(record_subclass_version):
+    """
+    Return the size in bytes (grh included) of a MDR record with the given
+    subclass version, or None if the version is not supported
+    """
+    if record_subclass_version not in (4, 5):
+        return None
+    return GRH.size + sum(size for _, size in
+                          mdr_layout(record_subclass_version).values())
+
+
+def read_mdr_field(block, record_subclass_version, name, data_type, shape):
+    """
+    Read a field from several MDR records at the same time without copying
+    the data. *block* must be a 2D array of uint8 where every row is the
+    content of a MDR record (without the grh); the result is an array of
+    shape (n_of_records,) + shape whose values are the ones saved on the
+    file (i.e. without any scale factor applied).
+
+    Args:
+        - *block*: a 2D numpy array of uint8
+        - *record_subclass_version*: the subclass version of the records
+        - *name*: the name of the field
+        - *data_type*: the numpy dtype of the field on the file
+        - *shape*: the shape of the field inside a single record
+
+    Returns:
+        A numpy array (a view on *block*)
+    """
+    offset, size = mdr_layout(record_subclass_version)[name]
+    field_bytes = block[:, offset : offset + size]
+    return field_bytes.view(data_type).reshape((block.shape[0],) + tuple(shape))
+
+
 class MDR(interpreted_content):
 
     @staticmethod
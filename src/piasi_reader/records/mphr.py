@@ -328,6 +328,57 @@ class MPHR(interpreted_content):
 
 
 
+    def raw_with_values(self, values):
+        """
+        Return the raw content of the record where the values of some
+        fields have been replaced. The size of the record does not change:
+        every new value must fit into the space of the old one (integers are
+        aligned to the right, strings to the left).
+
+        Args:
+            - *values*: a dictionary that associates to the name of a field
+              as written in the file (like "TOTAL_MDR") its new value
+
+        Returns:
+            The new content of the record (as bytes)
+        """
+        raw_data = self.__raw
+        if py_version > 2:
+            raw_data = raw_data.decode('ASCII')
+        lines = raw_data.split('\n')
+
+        values = dict(values)
+        for i, line in enumerate(lines):
+            if '=' not in line:
+                continue
+            key, old_value = line.split('=', 1)
+            key = key.strip()
+            if key not in values:
+                continue
+            new_value = values.pop(key)
+            width = len(old_value) - 1
+            if isinstance(new_value, int):
+                stripped = old_value.strip()
+                if len(stripped) > 1 and stripped.startswith('0'):
+                    # Zero padded values keep their padding
+                    new_value = str(new_value).zfill(len(stripped))
+                new_value = str(new_value).rjust(width)
+            else:
+                new_value = str(new_value).ljust(width)
+            if len(new_value) > width:
+                raise ValueError('The value {} is too long for the field '
+                                 '{}'.format(new_value, key))
+            lines[i] = line[:len(line) - width] + new_value
+
+        if len(values) > 0:
+            raise KeyError('Fields not found in the MPHR: ' +
+                           ', '.join(sorted(values)))
+
+        new_raw_data = '\n'.join(lines)
+        if py_version > 2:
+            new_raw_data = new_raw_data.encode('ASCII')
+        return new_raw_data
+
     def __str__(self):
         output  = 'Product name:                   ' + str(self.product_name) + '\n'
         output += 'Parent product name 1:          ' + str(self.parent_product_name1) + '\n'
@@ -0,0 +1,472 @@
+"""
+Piasi-reader: a library to read and convert the native IASI L1C files
+Copyright (C) 2015  Stefano Piani
+
+This library is free software; you can redistribute it and/or
+modify it under the terms of the GNU Lesser General Public
+License as published by the Free Software Foundation; either
+version 3.0 of the License, or (at your option) any later version.
+
+This library is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with this library; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+from __future__ import division
+
+import json
+import os
+from collections import OrderedDict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from io import BytesIO
+from socketserver import ThreadingMixIn
+from threading import Lock
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+import numpy as np
+
+from piasi_reader.iasi_l1c_native_file import IasiL1cNativeFile
+from piasi_reader.parameters import PN, SNOT
+from piasi_reader.utilities import grh_time
+
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+DEFAULT_MEMORY_BUDGET = 2 * 1024**3
+
+# An estimate of the memory used by the interpreted content of a scan line
+# (most of it are the radiances and the IIS images)
+DECODED_LINE_SIZE = 9 * 1024**2
+
+try:
+    from http.server import ThreadingHTTPServer
+except ImportError:
+    # Python < 3.7
+    class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+        daemon_threads = True
+
+
+class QueryServerException(Exception):
+    """
+    This error is raised by the client when the server can not answer to a
+    query; the message is the one sent by the server
+    """
+    pass
+
+
+class GranulePool(object):
+    """
+    A pool of open files shared by several threads. Every file is opened
+    only once (in thread safe mode, so the scan lines interpreted for a
+    query are reused by the following ones) and it is kept open until the
+    memory used by the pool exceeds its budget: then, the files that have
+    not been used for the longest time are closed. A file is opened again
+    if it has been modified since it has been opened. The files returned by
+    the open method are not closed until the end of the with block, even
+    if they are removed from the pool in the meantime.
+
+    The memory used by a file is estimated as its size plus
+    DECODED_LINE_SIZE bytes for every interpreted scan line.
+
+    Args:
+        - *memory_budget*: the maximum amount of memory (in bytes) used by
+          the files of the pool; the last file used is never closed
+        - *root*: only the files inside this directory can be opened and
+          relative paths are relative to it; if None, the current directory
+          is used
+    """
+    def __init__(self, memory_budget=DEFAULT_MEMORY_BUDGET, root=None):
+        self.__memory_budget = memory_budget
+        # Every path is checked against the root: otherwise, any client of
+        # the server could read all the files of the user of the server
+        self.__root = os.path.realpath(os.getcwd() if root is None else root)
+        self.__granules = OrderedDict()
+        # For every file in use, the number of the with blocks that use it
+        # and whether it must be closed at the end of the last one
+        self.__users = {}
+        self.__lock = Lock()
+        self.__hits = 0
+        self.__misses = 0
+
+    @staticmethod
+    def memory_usage_of(iasi_file):
+        """
+        Return the estimated memory (in bytes) used by an open file
+        """
+        return iasi_file.size + iasi_file.n_of_decoded_lines * DECODED_LINE_SIZE
+
+    @property
+    def memory_usage(self):
+        """
+        The estimated memory (in bytes) used by all the files of the pool
+        """
+        with self.__lock:
+            granules = [f for f, _ in self.__granules.values()]
+        return sum(self.memory_usage_of(f) for f in granules)
+
+    def __resolve(self, path):
+        resolved = os.path.realpath(os.path.join(self.__root, path))
+        if os.path.commonpath([self.__root, resolved]) != self.__root:
+            raise ValueError('The file {} is outside the directory {}'.format(
+                path, self.__root))
+        return resolved
+
+    def get(self, path):
+        """
+        Return the open file with the given path, opening it if it is not
+        in the pool yet. The file is closed when it is removed from the
+        pool: use the open method to read it while other threads use the
+        pool.
+
+        Args:
+            - *path*: the path of the file
+
+        Returns:
+            A IasiL1cNativeFile object
+        """
+        return self.__get(path, False)
+
+    @contextmanager
+    def open(self, path):
+        """
+        A context manager that returns the open file with the given path
+        (like get); the file is not closed before the end of the with block
+
+        Args:
+            - *path*: the path of the file
+        """
+        iasi_file = self.__get(path, True)
+        try:
+            yield iasi_file
+        finally:
+            with self.__lock:
+                users, to_close = self.__users.pop(id(iasi_file))
+                if users > 1:
+                    self.__users[id(iasi_file)] = (users - 1, to_close)
+                    to_close = False
+            if to_close:
+                iasi_file.close()
+
+    def __get(self, path, use):
+        path = self.__resolve(path)
+        stat = os.stat(path)
+        version = (stat.st_mtime_ns, stat.st_size)
+
+        with self.__lock:
+            entry = self.__granules.get(path)
+            if entry is not None and entry[1] == version:
+                self.__granules.move_to_end(path)
+                self.__hits += 1
+                if use:
+                    self.__use(entry[0])
+                return entry[0]
+
+        # The file is opened without holding the lock, so that the other
+        # files of the pool can still be used in the meantime
+        iasi_file = IasiL1cNativeFile(path, thread_safe=True)
+
+        to_close = []
+        with self.__lock:
+            entry = self.__granules.get(path)
+            if entry is not None and entry[1] == version:
+                to_close.append(iasi_file)
+                iasi_file = entry[0]
+            else:
+                if entry is not None:
+                    to_close.extend(self.__release(entry[0]))
+                self.__granules[path] = (iasi_file, version)
+            self.__granules.move_to_end(path)
+            self.__misses += 1
+            if use:
+                self.__use(iasi_file)
+        for f in to_close:
+            f.close()
+        self.trim()
+        return iasi_file
+
+    def __use(self, iasi_file):
+        users, to_close = self.__users.get(id(iasi_file), (0, False))
+        self.__users[id(iasi_file)] = (users + 1, to_close)
+
+    def __release(self, iasi_file):
+        """
+        Called (holding the lock) for a file removed from the pool; return
+        a list with the file if it can be closed immediately or an empty
+        list if it will be closed at the end of the with block that uses it
+        """
+        if id(iasi_file) in self.__users:
+            users, _ = self.__users[id(iasi_file)]
+            self.__users[id(iasi_file)] = (users, True)
+            return []
+        return [iasi_file]
+
+    def trim(self):
+        """
+        Close the files that have not been used for the longest time until
+        the memory used by the pool is inside its budget
+        """
+        to_close = []
+        with self.__lock:
+            usage = OrderedDict((path, self.memory_usage_of(f))
+                                for path, (f, _) in self.__granules.items())
+            total = sum(usage.values())
+            while len(self.__granules) > 1 and total > self.__memory_budget:
+                path, (iasi_file, _) = self.__granules.popitem(last=False)
+                total -= usage[path]
+                to_close.extend(self.__release(iasi_file))
+        for iasi_file in to_close:
+            iasi_file.close()
+
+    def status(self):
+        """
+        Return a dictionary with the files of the pool, the memory they use
+        and the number of requests that have found the file already open
+        (hits) or not (misses)
+        """
+        with self.__lock:
+            granules = [(path, f) for path, (f, _) in self.__granules.items()]
+            hits, misses = self.__hits, self.__misses
+        return {'granules': [{'path': path,
+                              'n_of_lines': f.n_of_lines,
+                              'n_of_decoded_lines': f.n_of_decoded_lines,
+                              'memory_usage': self.memory_usage_of(f)}
+                             for path, f in granules],
+                'memory_usage': sum(self.memory_usage_of(f)
+                                    for _, f in granules),
+                'memory_budget': self.__memory_budget,
+                'hits': hits,
+                'misses': misses}
+
+
+def query_granule(iasi_file, fields, time_window=None, bbox=None,
+                  channels=None):
+    """
+    Read some fields of a file only for the pixels inside a time window
+    and a geographic box. Only the scan lines that contain the selected
+    pixels are read; the scan lines outside the time window are discarded
+    looking only at the times of their grh.
+
+    The fields that have a value for each pixel (like latitudes or
+    radiances) are returned only for the selected pixels; the other ones
+    (like efov_times or iis_images) are returned for all the scan lines
+    that contain at least one selected pixel.
+
+    Args:
+        - *iasi_file*: a IasiL1cNativeFile
+        - *fields*: the names of the fields to read (like "radiances")
+        - *time_window*: None or a couple (start, end) of datetime64 objects
+          (or of strings in ISO format)
+        - *bbox*: None or a tuple (min longitude, min latitude, max
+          longitude, max latitude)
+        - *channels*: None or a list with the indices of the channels of
+          the radiances that must be returned
+
+    Returns:
+        An OrderedDict with the selected fields, the indices of the
+        selected pixels ("pixels") and of their scan lines ("lines")
+    """
+    pixels_per_line = SNOT * PN
+    lines = np.arange(iasi_file.n_of_lines)
+
+    if time_window is not None:
+        start, end = (np.datetime64(t, 'ms') for t in time_window)
+        grhs = [r.grh for r in iasi_file if r.type == 'MDR']
+        line_starts = np.array([grh_time(g.record_start_time_day,
+                                         g.record_start_time_msec)
+                                for g in grhs], dtype='datetime64[ms]')
+        line_ends = np.array([grh_time(g.record_stop_time_day,
+                                       g.record_stop_time_msec)
+                              for g in grhs], dtype='datetime64[ms]')
+        lines = lines[(line_ends >= start) & (line_starts <= end)]
+
+    pixels = (lines[:, np.newaxis] * pixels_per_line +
+              np.arange(pixels_per_line)).ravel()
+    if lines.size > 0 and (time_window is not None or bbox is not None):
+        mask = np.ones(pixels.size, dtype=bool)
+        if time_window is not None:
+            times = iasi_file.get_obs_times(lines=lines)
+            mask &= (times >= start) & (times <= end)
+        if bbox is not None:
+            lon_min, lat_min, lon_max, lat_max = bbox
+            longitudes = iasi_file.get_longitudes(lines=lines)
+            latitudes = iasi_file.get_latitudes(lines=lines)
+            mask &= ((longitudes >= lon_min) & (longitudes <= lon_max) &
+                     (latitudes >= lat_min) & (latitudes <= lat_max))
+        pixels = pixels[mask]
+        lines = np.unique(pixels // pixels_per_line)
+
+    result = OrderedDict([('pixels', pixels), ('lines', lines)])
+    all_fields = iasi_file.fields
+    for field in fields:
+        if field not in all_fields:
+            raise KeyError('Unknown field: {}'.format(field))
+        lazy_field = all_fields[field]
+        rows_per_line = lazy_field.shape[0] // iasi_file.n_of_lines
+        if rows_per_line == pixels_per_line:
+            rows = pixels
+        else:
+            rows = (lines[:, np.newaxis] * rows_per_line +
+                    np.arange(rows_per_line)).ravel()
+        if field == 'radiances' and channels is not None:
+            result[field] = lazy_field[rows][:, list(channels)]
+        else:
+            result[field] = lazy_field[rows]
+    return result
+
+
+def encode_arrays(arrays):
+    """
+    Save a dictionary of arrays in the npz format and return its bytes
+    """
+    output = BytesIO()
+    np.savez(output, **arrays)
+    return output.getvalue()
+
+
+def decode_arrays(data):
+    """
+    Read the bytes written by encode_arrays and return an OrderedDict of
+    arrays
+    """
+    with np.load(BytesIO(data), allow_pickle=False) as npz:
+        return OrderedDict((name, npz[name]) for name in npz.files)
+
+
+class _QueryHandler(BaseHTTPRequestHandler):
+    def __send(self, code, content_type, body):
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def __send_error(self, code, message):
+        self.__send(code, 'text/plain; charset=utf-8', message.encode('utf-8'))
+
+    def do_GET(self):
+        if self.path != '/status':
+            self.__send_error(404, 'Unknown path: ' + self.path)
+            return
+        body = json.dumps(self.server.pool.status()).encode('utf-8')
+        self.__send(200, 'application/json', body)
+
+    def do_POST(self):
+        if self.path != '/query':
+            self.__send_error(404, 'Unknown path: ' + self.path)
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length).decode('utf-8'))
+            with self.server.pool.open(request['path']) as iasi_file:
+                arrays = query_granule(iasi_file,
+                                       request.get('fields', []),
+                                       request.get('time_window'),
+                                       request.get('bbox'),
+                                       request.get('channels'))
+                self.server.pool.trim()
+                body = encode_arrays(arrays)
+        except (ValueError, KeyError, TypeError, IndexError, OSError) as e:
+            self.__send_error(400, '{}: {}'.format(type(e).__name__, e))
+            return
+        except Exception as e:
+            # The errors raised while reading a file (for example because
+            # it is corrupted) are sent to the client
+            self.__send_error(500, '{}: {}'.format(type(e).__name__, e))
+            return
+        self.__send(200, 'application/octet-stream', body)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+class QueryServer(ThreadingHTTPServer):
+    """
+    A HTTP server that answers to the queries on the files of a GranulePool;
+    every request is served by its own thread. The server understands two
+    requests:
+      - GET /status returns the status of the pool (as JSON)
+      - POST /query receives a JSON object with the keys "path", "fields"
+        and, optionally, "time_window", "bbox" and "channels" (the
+        arguments of query_granule) and returns the arrays in npz format
+
+    Args:
+        - *address*: a couple (host, port)
+        - *pool*: a GranulePool; if None, a new pool is created
+        - *verbose*: if True, log every request on the standard error
+    """
+    daemon_threads = True
+
+    def __init__(self, address=(DEFAULT_HOST, DEFAULT_PORT), pool=None,
+                 verbose=False):
+        ThreadingHTTPServer.__init__(self, address, _QueryHandler)
+        self.pool = GranulePool() if pool is None else pool
+        self.verbose = verbose
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return 'http://{}:{}'.format(host, port)
+
+
+def serve(host=DEFAULT_HOST, port=DEFAULT_PORT,
+          memory_budget=DEFAULT_MEMORY_BUDGET, root=None, verbose=False):
+    """
+    Start a QueryServer and serve the requests until the process is
+    interrupted
+
+    Args:
+        - *host*: the address where the server listens
+        - *port*: the port where the server listens
+        - *memory_budget*: the memory budget of the pool (in bytes)
+        - *root*: only the files inside this directory can be read; if
+          None, the current directory is used
+        - *verbose*: if True, log every request on the standard error
+    """
+    pool = GranulePool(memory_budget, root)
+    server = QueryServer((host, port), pool, verbose)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def query(path, fields, time_window=None, bbox=None, channels=None,
+          url='http://{}:{}'.format(DEFAULT_HOST, DEFAULT_PORT)):
+    """
+    Send a query to a QueryServer and return its answer. The arguments are
+    the same of query_granule, but path is the path of the file as seen by
+    the server.
+
+    Returns:
+        An OrderedDict of arrays
+
+    Raises:
+        QueryServerException if the server can not answer to the query
+    """
+    request = {'path': path, 'fields': list(fields)}
+    if time_window is not None:
+        request['time_window'] = [str(np.datetime64(t, 'ms'))
+                                  for t in time_window]
+    if bbox is not None:
+        request['bbox'] = [float(v) for v in bbox]
+    if channels is not None:
+        request['channels'] = [int(c) for c in channels]
+
+    http_request = Request(url.rstrip('/') + '/query',
+                           data=json.dumps(request).encode('utf-8'),
+                           headers={'Content-Type': 'application/json'})
+    try:
+        with urlopen(http_request) as response:
+            return decode_arrays(response.read())
+    except HTTPError as e:
+        raise QueryServerException(e.read().decode('utf-8', 'replace'))
@@ -0,0 +1,284 @@
+"""
+Piasi-reader: a library to read and convert the native IASI L1C files
+Copyright (C) 2015  Stefano Piani
+
+This library is free software; you can redistribute it and/or
+modify it under the terms of the GNU Lesser General Public
+License as published by the Free Software Foundation; either
+version 3.0 of the License, or (at your option) any later version.
+
+This library is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with this library; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+import mmap
+import os
+from collections import namedtuple
+
+import numpy as np
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    # Python < 3.8
+    shared_memory = None
+
+try:
+    import _posixshmem
+except ImportError:
+    _posixshmem = None
+
+
+class SharedMemoryNotAvailableException(RuntimeError):
+    """
+    This error is raised if the shared memory is used with a version of
+    Python that does not support it (before 3.8)
+    """
+    pass
+
+
+class SharedArrayDescriptor(namedtuple('SharedArrayDescriptor',
+                                       ('name', 'shape', 'dtype'))):
+    """
+    The information needed to attach to a SharedArray from another process:
+    the name of the shared memory block, the shape of the array and its
+    data type (as returned by numpy.lib.format.dtype_to_descr). It is a
+    small object that can be pickled and sent to other processes.
+    """
+    def attach(self, writeable=False):
+        """
+        Attach to the shared array; see the function attach
+        """
+        return attach(self, writeable)
+
+
+class SharedArray(object):
+    """
+    A numpy array whose data are stored in a block of shared memory, that
+    other processes can use without copying it (see attach).
+
+    The block is released by the operating system only when the process
+    that has created it calls unlink (and all the processes that use it
+    have called close): the lifetime of the data must be managed
+    explicitly. The object can also be used as a context manager, that
+    calls close (and unlink, if the object has created the block) at its
+    end.
+
+    Usually, the objects of this class are created by the functions
+    share_array and attach.
+
+    Args:
+        - *memory*: a multiprocessing.shared_memory.SharedMemory object
+        - *shape*: the shape of the array
+        - *dtype*: the data type of the array
+        - *owner*: True if this object has created the block of memory
+    """
+    def __init__(self, memory, shape, dtype, owner):
+        self.__memory = memory
+        self.__dtype = np.dtype(dtype)
+        self.__array = np.ndarray(shape, dtype=self.__dtype,
+                                  buffer=memory.buf)
+        self.__owner = owner
+
+    @property
+    def array(self):
+        """
+        The numpy array; it must not be used after close has been called
+        """
+        return self.__array
+
+    @property
+    def descriptor(self):
+        """
+        A SharedArrayDescriptor that can be sent to other processes
+        """
+        return SharedArrayDescriptor(
+            self.__memory.name,
+            self.__array.shape,
+            np.lib.format.dtype_to_descr(self.__dtype))
+
+    @property
+    def owner(self):
+        return self.__owner
+
+    def close(self):
+        """
+        Stop using the block of shared memory from this process; all the
+        references to the array (and to its views) must have been deleted
+        """
+        if self.__array is None:
+            return
+        self.__array = None
+        self.__memory.close()
+
+    def unlink(self):
+        """
+        Ask the operating system to release the block of shared memory as
+        soon as all the processes have closed it; it can be called only by
+        the process that has created the block
+        """
+        if not self.__owner:
+            raise ValueError('Only the process that has created a shared '
+                             'array can unlink it')
+        self.__memory.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        if self.__owner:
+            self.unlink()
+
+    def __repr__(self):
+        return 'SharedArray({}, shape={}, dtype={})'.format(
+            self.__memory.name, self.__array.shape if self.__array is not None
+            else None, self.__dtype)
+
+
+class _UntrackedMemory(object):
+    """
+    A block of POSIX shared memory opened without registering it in the
+    resource tracker of multiprocessing (which, before Python 3.13,
+    destroys every block used by a process when the process ends). It has
+    the attributes of a SharedMemory object used by SharedArray.
+
+    Args:
+        - *name*: the name of the block
+    """
+    def __init__(self, name):
+        fd = _posixshmem.shm_open('/' + name, os.O_RDWR, mode=0o600)
+        try:
+            self.__mmap = mmap.mmap(fd, os.fstat(fd).st_size)
+        finally:
+            os.close(fd)
+        self.name = name
+        self.buf = memoryview(self.__mmap)
+
+    def close(self):
+        self.buf.release()
+        self.__mmap.close()
+
+
+def _check_shared_memory():
+    if shared_memory is None:
+        raise SharedMemoryNotAvailableException(
+            'The shared memory requires Python 3.8 or newer')
+
+
+def empty_shared_array(shape, dtype):
+    """
+    Create a new block of shared memory for an array whose values are not
+    initialized
+
+    Args:
+        - *shape*: the shape of the array
+        - *dtype*: the data type of the array
+
+    Returns:
+        A SharedArray object
+    """
+    _check_shared_memory()
+    dtype = np.dtype(dtype)
+    n_of_bytes = int(np.prod(shape, dtype=np.int64)) * dtype.itemsize
+    memory = shared_memory.SharedMemory(create=True, size=max(n_of_bytes, 1))
+    return SharedArray(memory, tuple(shape), dtype, owner=True)
+
+
+def share_array(array):
+    """
+    Copy an array inside a new block of shared memory
+
+    Args:
+        - *array*: a numpy array (or an object that can be converted to it)
+
+    Returns:
+        A SharedArray object
+    """
+    array = np.asarray(array)
+    shared = empty_shared_array(array.shape, array.dtype)
+    shared.array[...] = array
+    return shared
+
+
+def release(values):
+    """
+    Close and unlink the SharedArray objects created by this process in
+    values (a SharedArray or a dictionary, like the result of share)
+    """
+    if isinstance(values, dict):
+        for value in values.values():
+            release(value)
+    elif isinstance(values, SharedArray) and values.owner:
+        values.close()
+        values.unlink()
+
+
+def share(values):
+    """
+    Copy the values returned by a getter inside blocks of shared memory: a
+    dictionary of arrays (like the ones returned by iter_chunks or by
+    get_iis_footprint_statistics) becomes a dictionary of SharedArray; the
+    values that are not arrays (like the slice of a chunk) are left as
+    they are.
+
+    Args:
+        - *values*: an array or a dictionary
+
+    Returns:
+        A SharedArray or a dictionary
+    """
+    if isinstance(values, dict):
+        shared = type(values)()
+        try:
+            for key, value in values.items():
+                shared[key] = share(value)
+        except BaseException:
+            # The blocks already created would never be released
+            release(shared)
+            raise
+        return shared
+    if isinstance(values, np.ndarray):
+        return share_array(values)
+    return values
+
+
+def attach(descriptor, writeable=False):
+    """
+    Attach to a shared array created by another process. The block of
+    memory is not released when this process ends: only the process that
+    has created it can release it.
+
+    Args:
+        - *descriptor*: a SharedArrayDescriptor (or a tuple with its three
+          fields)
+        - *writeable*: if False, the array is read-only
+
+    Returns:
+        A SharedArray object
+    """
+    _check_shared_memory()
+    name, shape, dtype = descriptor
+    try:
+        memory = shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Before Python 3.13, every process that attaches to a block also
+        # registers it, and the block is destroyed when the process ends;
+        # unregistering it does not help, because the processes started by
+        # multiprocessing share the tracker of the process that has
+        # created the block (and the tracker keeps only one registration
+        # for each block). On Windows, the blocks are never registered.
+        if _posixshmem is None:
+            memory = shared_memory.SharedMemory(name=name)
+        else:
+            memory = _UntrackedMemory(name)
+    shared = SharedArray(memory, tuple(shape),
+                         np.lib.format.descr_to_dtype(dtype), owner=False)
+    shared.array.flags.writeable = writeable
+    return shared
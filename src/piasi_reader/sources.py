@@ -0,0 +1,160 @@
+"""
+Piasi-reader: a library to read and convert the native IASI L1C files
+Copyright (C) 2015  Stefano Piani
+
+This library is free software; you can redistribute it and/or
+modify it under the terms of the GNU Lesser General Public
+License as published by the Free Software Foundation; either
+version 3.0 of the License, or (at your option) any later version.
+
+This library is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with this library; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+import bz2
+import gzip
+import io
+import lzma
+import tarfile
+import zipfile
+from contextlib import contextmanager, ExitStack
+
+
+# The size of the buffer used to read from a compressed stream. Records are
+# read one at a time, so this is the only data kept in memory beside the
+# record that is being read
+DEFAULT_BUFFER_SIZE = 4 * 1024 * 1024
+
+_magic_numbers = ((b'\x1f\x8b', 'gzip'),
+                  (b'BZh', 'bz2'),
+                  (b'\xfd7zXZ\x00', 'xz'),
+                  (b'PK\x03\x04', 'zip'))
+
+_decompressors = {'gzip': gzip.open,
+                  'bz2': bz2.open,
+                  'xz': lzma.open}
+
+
+class MemberNotFoundException(ValueError):
+    """
+    This error is raised if it is not possible to decide which file of an
+    archive (zip or tar) should be read
+    """
+    pass
+
+
+def compression_type(filename):
+    """
+    Return the kind of compression of a file, looking at its content (and
+    not at its extension). The result is one of the following strings:
+      - gzip
+      - bz2
+      - xz
+      - zip
+      - tar (also for compressed tar files, like .tar.gz)
+    or None if the file is not compressed.
+
+    Args:
+        - *filename*: the path of the file
+
+    Returns:
+        A string or None
+    """
+    with open(filename, 'rb') as f:
+        header = f.read(6)
+
+    for magic_number, compression in _magic_numbers:
+        if header.startswith(magic_number):
+            if compression != 'zip' and tarfile.is_tarfile(filename):
+                return 'tar'
+            return compression
+
+    if tarfile.is_tarfile(filename):
+        return 'tar'
+    return None
+
+
+class SequentialReader(object):
+    """
+    A wrapper around a binary stream (a pipe, a socket, the standard input,
+    ...) whose read method always returns the number of bytes that have been
+    requested, waiting for them if needed; less bytes are returned only when
+    the stream ends.
+
+    Args:
+        - *stream*: an object with a read method that returns bytes
+    """
+    def __init__(self, stream):
+        self.__stream = stream
+
+    def read(self, size):
+        chunks = []
+        missing = size
+        while missing > 0:
+            chunk = self.__stream.read(missing)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            missing -= len(chunk)
+        return b''.join(chunks)
+
+
+def _select_member(names, member, filename):
+    if member is not None:
+        if member not in names:
+            raise MemberNotFoundException(
+                'File {} not found inside {}'.format(member, filename))
+        return member
+    if len(names) != 1:
+        raise MemberNotFoundException(
+            'The archive {} contains {} files; please specify which one '
+            'should be read'.format(filename, len(names)))
+    return names[0]
+
+
+@contextmanager
+def open_native_file(filename, member=None, buffer_size=DEFAULT_BUFFER_SIZE):
+    """
+    Open a native file for reading, decompressing it on the fly if it is
+    compressed (gzip, bz2 or xz) or extracting it from an archive (zip or
+    tar). The data are never written on the disk: the returned object is a
+    binary stream that can only be read sequentially.
+
+    Args:
+        - *filename*: the path of the file
+        - *member*: the name of the file to read inside an archive; it can
+          be omitted if the archive contains only one file
+        - *buffer_size*: the size of the buffer used to read the
+          decompressed stream
+
+    Returns:
+        A context manager that yields a binary file object
+    """
+    compression = compression_type(filename)
+
+    with ExitStack() as stack:
+        if compression is None:
+            stream = stack.enter_context(open(filename, 'rb'))
+        elif compression in _decompressors:
+            raw_stream = stack.enter_context(
+                _decompressors[compression](filename, 'rb'))
+            stream = io.BufferedReader(raw_stream, buffer_size)
+        elif compression == 'zip':
+            archive = stack.enter_context(zipfile.ZipFile(filename))
+            names = [n for n in archive.namelist() if not n.endswith('/')]
+            name = _select_member(names, member, filename)
+            raw_stream = stack.enter_context(archive.open(name))
+            stream = io.BufferedReader(raw_stream, buffer_size)
+        else:
+            archive = stack.enter_context(tarfile.open(filename, 'r:*'))
+            names = [m.name for m in archive.getmembers() if m.isfile()]
+            name = _select_member(names, member, filename)
+            raw_stream = stack.enter_context(archive.extractfile(name))
+            stream = io.BufferedReader(raw_stream, buffer_size)
+        yield stream
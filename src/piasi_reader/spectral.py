@@ -0,0 +1,556 @@
+"""
+Piasi-reader: a library to read and convert the native IASI L1C files
+Copyright (C) 2015  Stefano Piani
+
+This library is free software; you can redistribute it and/or
+modify it under the terms of the GNU Lesser General Public
+License as published by the Free Software Foundation; either
+version 3.0 of the License, or (at your option) any later version.
+
+This library is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with this library; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+from __future__ import division
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+# The spectral grid of the IASI L1C spectra (in cm^-1) and the maximum
+# optical path difference of the interferometer (in cm)
+IASI_FIRST_WAVENUMBER = 645.
+IASI_SPECTRAL_SAMPLING = 0.25
+IASI_N_OF_CHANNELS = 8461
+IASI_MAX_OPD = 2.
+
+# The L1C spectra are apodised with a Gaussian function whose spectral
+# response has a full width at half maximum of 0.5 cm^-1
+IASI_APODISATION = ('gaussian', 0.5)
+
+# The number of channels added at the edges of the spectra before the
+# Fourier transform, to make them periodic without a discontinuity
+DEFAULT_PADDING = 256
+
+# The number of spectra transformed at the same time
+DEFAULT_BATCH_SIZE = 256
+
+_resamplers_cache = {}
+
+
+def iasi_wavenumbers():
+    """
+    Return the wavenumbers (in cm^-1) of the channels of the IASI L1C
+    spectra
+    """
+    return (IASI_FIRST_WAVENUMBER +
+            IASI_SPECTRAL_SAMPLING * np.arange(IASI_N_OF_CHANNELS))
+
+
+def apodisation_function(apodisation, opd, max_opd=IASI_MAX_OPD):
+    """
+    Evaluate an apodisation function on some optical path differences. The
+    function is zero outside [-max_opd, max_opd]. The apodisation can be:
+      - "boxcar" (no apodisation)
+      - "triangle"
+      - "hamming"
+      - "iasi", the Gaussian apodisation of the L1C spectra
+      - ("gaussian", fwhm), a Gaussian apodisation whose spectral response
+        has a full width at half maximum of fwhm cm^-1
+      - a function that receives the optical path differences and the
+        maximum optical path difference and returns the values of the
+        apodisation
+
+    Args:
+        - *apodisation*: the apodisation (see above)
+        - *opd*: an array with the optical path differences (in cm)
+        - *max_opd*: the maximum optical path difference (in cm)
+
+    Returns:
+        A numpy array with the same shape of opd
+    """
+    opd = np.abs(np.asarray(opd, dtype=np.float64))
+    if apodisation == 'iasi':
+        apodisation = IASI_APODISATION
+
+    if callable(apodisation):
+        values = np.asarray(apodisation(opd, max_opd), dtype=np.float64)
+    elif apodisation == 'boxcar':
+        values = np.ones_like(opd)
+    elif apodisation == 'triangle':
+        values = 1. - opd / max_opd
+    elif apodisation == 'hamming':
+        values = 0.54 + 0.46 * np.cos(np.pi * opd / max_opd)
+    elif isinstance(apodisation, tuple) and len(apodisation) == 2 and \
+            apodisation[0] == 'gaussian':
+        fwhm = apodisation[1]
+        values = np.exp(-(np.pi * fwhm * opd)**2 / (4. * np.log(2.)))
+    else:
+        raise ValueError('Unknown apodisation: {}'.format(apodisation))
+    return np.where(opd <= max_opd, values, 0.)
+
+
+def _fast_size(n):
+    """
+    Return the smallest integer greater or equal to n whose prime factors
+    are only 2, 3 and 5 (the Fourier transforms of these sizes are fast)
+    """
+    best = 2 ** int(np.ceil(np.log2(n)))
+    power_of_5 = 1
+    while power_of_5 < best:
+        power_of_3 = power_of_5
+        while power_of_3 < best:
+            size = power_of_3
+            while size < n:
+                size *= 2
+            best = min(best, size)
+            power_of_3 *= 3
+        power_of_5 *= 5
+    return best
+
+
+def _regular_grid(wavenumbers):
+    """
+    Return the first value, the step and the number of elements of a
+    regular grid, or None if the wavenumbers are not equally spaced
+    """
+    wavenumbers = np.asarray(wavenumbers, dtype=np.float64)
+    if wavenumbers.ndim != 1 or wavenumbers.size == 0:
+        raise ValueError('The wavenumbers must be a non empty 1D array')
+    if wavenumbers.size == 1:
+        return wavenumbers[0], 0., 1
+    steps = np.diff(wavenumbers)
+    step = (wavenumbers[-1] - wavenumbers[0]) / (wavenumbers.size - 1)
+    if step <= 0 or np.max(np.abs(steps - step)) > 1e-6 * step:
+        return None
+    return wavenumbers[0], step, wavenumbers.size
+
+
+class SpectralResampler(object):
+    """
+    Change the apodisation of many spectra and resample them on a new grid
+    of wavenumbers.
+
+    Every spectrum is extended to a periodic function and transformed into
+    an interferogram with a single Fourier transform; the interferogram is
+    divided by the source apodisation and multiplied by the target one,
+    and the spectrum is evaluated again on the target wavenumbers. The
+    evaluation is exact (i.e. it is the Fourier interpolation of the
+    spectrum) and it is made with:
+      - an inverse Fourier transform, if the target grid is the source one
+      - a chirp-z transform (two Fourier transforms), if the target grid is
+        regular
+      - a matrix product, otherwise
+    All the factors that depend only on the grids and on the apodisations
+    are computed when the object is created, so the same object should be
+    used for all the spectra with the same target (see the resampler
+    function). The spectra are transformed in batches of many spectra at a
+    time.
+
+    The channels near the edges of the spectra are less accurate, because
+    the spectra are not really periodic.
+
+    Args:
+        - *target_wavenumbers*: the wavenumbers (in cm^-1) where the
+          resampled spectra are evaluated; if None, the source ones
+        - *target_apodisation*: the apodisation of the resampled spectra
+          (see apodisation_function)
+        - *source_apodisation*: the apodisation of the input spectra
+        - *wavenumbers*: the wavenumbers of the input spectra; they must be
+          equally spaced. If None, the channels of IASI
+        - *max_opd*: the maximum optical path difference (in cm) of the
+          input spectra
+        - *target_max_opd*: the maximum optical path difference of the
+          target apodisation; if None, max_opd
+        - *padding*: the number of channels added at each edge of the
+          spectra to make them periodic
+    """
+    def __init__(self, target_wavenumbers=None,
+                 target_apodisation=IASI_APODISATION,
+                 source_apodisation=IASI_APODISATION, wavenumbers=None,
+                 max_opd=IASI_MAX_OPD, target_max_opd=None,
+                 padding=DEFAULT_PADDING):
+        if wavenumbers is None:
+            wavenumbers = iasi_wavenumbers()
+        source_grid = _regular_grid(wavenumbers)
+        if source_grid is None or source_grid[2] < 2:
+            raise ValueError('The wavenumbers of the input spectra must be '
+                             'equally spaced')
+        first, step, n_of_channels = source_grid
+        if target_max_opd is None:
+            target_max_opd = max_opd
+        if target_max_opd > max_opd:
+            raise ValueError('The maximum optical path difference of the '
+                             'target can not be greater than the source one')
+
+        self.__n_of_channels = n_of_channels
+        self.__size = _fast_size(n_of_channels + 2 * padding)
+        self.__period = self.__size * step
+
+        # The transition used to fill the padding, from the last channel
+        # back to the first one
+        n_of_fill = self.__size - n_of_channels
+        t = np.arange(1, n_of_fill + 1) / (n_of_fill + 1)
+        self.__fill = (1. - np.cos(np.pi * t)) / 2.
+
+        # Divide by the source apodisation and multiply by the target one;
+        # the coefficients beyond the target maximum opd are dropped
+        opd = np.arange(self.__size // 2 + 1) / self.__period
+        source = apodisation_function(source_apodisation, opd, max_opd)
+        target = apodisation_function(target_apodisation, opd,
+                                      target_max_opd)
+        n_of_coefficients = int(np.count_nonzero(
+            (opd <= target_max_opd) & (source > 0)))
+        n_of_coefficients = max(n_of_coefficients, 1)
+        kernel = target[:n_of_coefficients] / source[:n_of_coefficients]
+        # The coefficients where the target apodisation is negligible (for
+        # example, for a large Gaussian) are dropped as well
+        significant = np.flatnonzero(
+            np.abs(kernel) > 1e-12 * np.max(np.abs(kernel)))
+        n_of_coefficients = int(significant[-1]) + 1 if significant.size \
+            else 1
+        kernel = kernel[:n_of_coefficients]
+        self.__n_of_coefficients = n_of_coefficients
+
+        # The weights that rebuild a real signal from the positive
+        # frequencies of its transform
+        weights = np.full(n_of_coefficients, 2. / self.__size)
+        weights[0] = 1. / self.__size
+        if self.__size % 2 == 0 and n_of_coefficients == self.__size // 2 + 1:
+            weights[-1] = 1. / self.__size
+        k = np.arange(n_of_coefficients)
+
+        if target_wavenumbers is None:
+            self.__wavenumbers = np.asarray(wavenumbers, dtype=np.float64)
+            self.__mode = 'inverse'
+            self.__kernel = kernel
+            self.__outputs = n_of_channels
+            return
+
+        self.__wavenumbers = np.asarray(target_wavenumbers, dtype=np.float64)
+        target_grid = _regular_grid(self.__wavenumbers)
+        self.__outputs = self.__wavenumbers.size
+        shift = (self.__wavenumbers[0] - first) / self.__period
+
+        if target_grid is None:
+            # The value of the spectrum on every target wavenumber is a
+            # linear combination of the coefficients of the transform
+            self.__mode = 'matrix'
+            phases = np.exp(2j * np.pi * np.outer(
+                k, (self.__wavenumbers - first) / self.__period))
+            self.__matrix = (kernel * weights)[:, np.newaxis] * phases
+            return
+
+        # Chirp-z transform: sum_k y_k exp(i theta k j) is the convolution
+        # of y_k exp(i theta k^2 / 2) with the chirp exp(-i theta m^2 / 2)
+        self.__mode = 'chirp'
+        theta = 2. * np.pi * target_grid[1] / self.__period
+        self.__fft_size = _fast_size(n_of_coefficients + self.__outputs - 1)
+        self.__pre = (kernel * weights * np.exp(2j * np.pi * k * shift) *
+                      np.exp(0.5j * theta * k**2))
+        j = np.arange(self.__outputs)
+        self.__post = np.exp(0.5j * theta * j**2)
+        chirp = np.zeros(self.__fft_size, dtype=np.complex128)
+        chirp[:self.__outputs] = np.exp(-0.5j * theta * j**2)
+        m = np.arange(1, n_of_coefficients)
+        chirp[-m] = np.exp(-0.5j * theta * m**2)
+        self.__chirp = np.fft.fft(chirp)
+
+    @property
+    def wavenumbers(self):
+        """
+        The wavenumbers of the resampled spectra
+        """
+        return self.__wavenumbers
+
+    def __transform(self, spectra):
+        """
+        Return the positive frequencies of the transform of the periodic
+        extension of some spectra
+        """
+        periodic = np.empty((spectra.shape[0], self.__size))
+        periodic[:, :self.__n_of_channels] = spectra
+        fill = periodic[:, self.__n_of_channels:]
+        np.multiply(spectra[:, :1] - spectra[:, -1:], self.__fill, out=fill)
+        fill += spectra[:, -1:]
+        return np.fft.rfft(periodic, axis=1)[:, :self.__n_of_coefficients]
+
+    def __resample_batch(self, spectra):
+        coefficients = self.__transform(spectra)
+        if self.__mode == 'inverse':
+            coefficients *= self.__kernel
+            return np.fft.irfft(coefficients, self.__size,
+                                axis=1)[:, :self.__n_of_channels]
+        if self.__mode == 'matrix':
+            return np.dot(coefficients, self.__matrix).real
+        y = np.zeros((spectra.shape[0], self.__fft_size),
+                     dtype=np.complex128)
+        y[:, :self.__n_of_coefficients] = coefficients * self.__pre
+        convolution = np.fft.ifft(np.fft.fft(y, axis=1) * self.__chirp, axis=1)
+        return (convolution[:, :self.__outputs] * self.__post).real
+
+    def __call__(self, spectra, batch_size=DEFAULT_BATCH_SIZE, n_workers=1):
+        """
+        Resample some spectra
+
+        Args:
+            - *spectra*: an array of shape (..., n_of_channels), like the
+              radiances returned by a IasiL1cNativeFile
+            - *batch_size*: the number of spectra transformed at a time
+            - *n_workers*: the number of threads that transform the batches
+              (numpy releases the GIL during the Fourier transforms)
+
+        Returns:
+            A numpy array of shape (..., n_of_target_wavenumbers)
+        """
+        spectra = np.asarray(spectra)
+        if spectra.shape[-1] != self.__n_of_channels:
+            raise ValueError('The spectra have {} channels instead of '
+                             '{}'.format(spectra.shape[-1],
+                                         self.__n_of_channels))
+        outer_shape = spectra.shape[:-1]
+        flat_spectra = spectra.reshape(-1, self.__n_of_channels)
+        result = np.empty((flat_spectra.shape[0], self.__outputs),
+                          dtype=np.result_type(spectra.dtype, np.float32))
+
+        def resample_batch(start):
+            batch = flat_spectra[start:start + batch_size]
+            result[start:start + batch_size] = self.__resample_batch(batch)
+
+        starts = range(0, flat_spectra.shape[0], batch_size)
+        if n_workers > 1 and len(starts) > 1:
+            with ThreadPoolExecutor(n_workers) as executor:
+                for _ in executor.map(resample_batch, starts):
+                    pass
+        else:
+            for start in starts:
+                resample_batch(start)
+        return result.reshape(outer_shape + (self.__outputs,))
+
+
+def resampler(target_wavenumbers=None, target_apodisation=IASI_APODISATION,
+              source_apodisation=IASI_APODISATION, **kwargs):
+    """
+    Return a SpectralResampler with the given arguments; the resamplers are
+    kept in a cache, so that the factors that depend on the target grid are
+    computed only once.
+
+    Args:
+        - *target_wavenumbers*: the wavenumbers of the resampled spectra
+        - *target_apodisation*: the apodisation of the resampled spectra
+        - *source_apodisation*: the apodisation of the input spectra
+        - *kwargs*: the other arguments of SpectralResampler
+
+    Returns:
+        A SpectralResampler
+    """
+    def freeze(value):
+        if isinstance(value, np.ndarray) or isinstance(value, list):
+            value = np.asarray(value, dtype=np.float64)
+            return (value.shape, value.tobytes())
+        return value
+
+    key = (freeze(target_wavenumbers), target_apodisation,
+           source_apodisation) + tuple(sorted(
+               (k, freeze(v)) for k, v in kwargs.items()))
+    if key not in _resamplers_cache:
+        _resamplers_cache[key] = SpectralResampler(
+            target_wavenumbers, target_apodisation, source_apodisation,
+            **kwargs)
+    return _resamplers_cache[key]
+
+
+def change_apodisation(spectra, target_apodisation,
+                       source_apodisation=IASI_APODISATION, **kwargs):
+    """
+    Change the apodisation of some spectra, keeping their wavenumbers
+
+    Args:
+        - *spectra*: an array of shape (..., n_of_channels)
+        - *target_apodisation*: the new apodisation (see
+          apodisation_function)
+        - *source_apodisation*: the apodisation of the spectra
+        - *kwargs*: the other arguments of SpectralResampler (like
+          target_max_opd), batch_size and n_workers
+
+    Returns:
+        A numpy array with the same shape of spectra
+    """
+    batch_size = kwargs.pop('batch_size', DEFAULT_BATCH_SIZE)
+    n_workers = kwargs.pop('n_workers', 1)
+    return resampler(None, target_apodisation, source_apodisation,
+                     **kwargs)(spectra, batch_size, n_workers)
+
+
+def resample(spectra, target_wavenumbers,
+             target_apodisation=IASI_APODISATION,
+             source_apodisation=IASI_APODISATION, **kwargs):
+    """
+    Resample some spectra on new wavenumbers, changing their apodisation
+
+    Args:
+        - *spectra*: an array of shape (..., n_of_channels)
+        - *target_wavenumbers*: the wavenumbers of the resampled spectra
+        - *target_apodisation*: the apodisation of the resampled spectra
+        - *source_apodisation*: the apodisation of the spectra
+        - *kwargs*: the other arguments of SpectralResampler, batch_size
+          and n_workers
+
+    Returns:
+        A numpy array of shape (..., n_of_target_wavenumbers)
+    """
+    batch_size = kwargs.pop('batch_size', DEFAULT_BATCH_SIZE)
+    n_workers = kwargs.pop('n_workers', 1)
+    return resampler(target_wavenumbers, target_apodisation,
+                     source_apodisation, **kwargs)(spectra, batch_size,
+                                                   n_workers)
+
+
+class SpectralOperator(object):
+    """
+    A linear operator that computes some linear combinations of the
+    channels of a spectrum (band averages, superchannels, projections on
+    principal components, convolutions with the spectral response of
+    another instrument...).
+
+    The operator is a matrix of shape (n_of_outputs, n_of_channels), which
+    can be given as:
+      - a 2D numpy array
+      - a 1D numpy array, for a single output
+      - a tuple (data, indices, indptr) with the matrix in CSR format (the
+        row r has the values data[indptr[r]:indptr[r + 1]] on the channels
+        indices[indptr[r]:indptr[r + 1]])
+      - a sparse matrix of scipy (or any object with a tocsr method)
+    The sparse operators are applied reading only the channels they use.
+
+    Args:
+        - *operator*: the matrix of the operator (see above)
+    """
+    def __init__(self, operator):
+        self.__vector = False
+        self.__matrix = None
+        self.__csr = None
+
+        if hasattr(operator, 'tocsr'):
+            csr = operator.tocsr()
+            operator = (csr.data, csr.indices, csr.indptr)
+
+        if isinstance(operator, tuple):
+            if len(operator) != 3:
+                raise ValueError('A sparse operator must be a tuple (data, '
+                                 'indices, indptr)')
+            data, indices, indptr = operator
+            data = np.asarray(data, dtype=np.float64)
+            indices = np.asarray(indices, dtype=np.intp)
+            indptr = np.asarray(indptr, dtype=np.intp)
+            if data.ndim != 1 or data.shape != indices.shape or \
+                    indptr.ndim != 1 or indptr.size < 1 or \
+                    indptr[0] != 0 or indptr[-1] != data.size:
+                raise ValueError('Invalid sparse operator')
+            if np.any(np.diff(indptr) < 0):
+                raise ValueError('The indptr of a sparse operator must be '
+                                 'non decreasing')
+            if indices.size > 0 and indices.min() < 0:
+                raise ValueError('Invalid channel index in a sparse '
+                                 'operator: {}'.format(indices.min()))
+            self.__csr = (data, indices, indptr)
+            self.__n_of_outputs = indptr.size - 1
+            self.__n_of_channels = (int(indices.max()) + 1 if indices.size
+                                    else 0)
+            return
+
+        matrix = np.asarray(operator, dtype=np.float64)
+        if matrix.ndim == 1:
+            self.__vector = True
+            matrix = matrix[np.newaxis, :]
+        if matrix.ndim != 2:
+            raise ValueError('The operator must be a matrix of shape '
+                             '(n_of_outputs, n_of_channels)')
+        self.__matrix = matrix
+        self.__n_of_outputs, self.__n_of_channels = matrix.shape
+
+    @property
+    def n_of_outputs(self):
+        """
+        The number of linear combinations computed by the operator
+        """
+        return self.__n_of_outputs
+
+    @property
+    def n_of_channels(self):
+        """
+        The number of channels used by the operator (for a sparse operator,
+        the index of the last channel used plus one)
+        """
+        return self.__n_of_channels
+
+    @property
+    def output_shape(self):
+        """
+        The shape of the result for a single spectrum
+        """
+        return () if self.__vector else (self.__n_of_outputs,)
+
+    def scale_channels(self, factors):
+        """
+        Return a new operator whose coefficients of every channel are
+        multiplied by a factor; applying it to a spectrum is the same as
+        applying this operator to the spectrum multiplied by the factors
+
+        Args:
+            - *factors*: a 1D array with a factor for each channel
+
+        Returns:
+            A SpectralOperator
+        """
+        factors = np.asarray(factors, dtype=np.float64)
+        if factors.size < self.__n_of_channels:
+            raise ValueError('The operator uses {} channels, but the '
+                             'spectra have only {}'.format(
+                                 self.__n_of_channels, factors.size))
+        if self.__csr is not None:
+            data, indices, indptr = self.__csr
+            return SpectralOperator((data * factors[indices], indices,
+                                     indptr))
+        matrix = self.__matrix * factors[:self.__n_of_channels]
+        return SpectralOperator(matrix[0] if self.__vector else matrix)
+
+    def apply(self, spectra):
+        """
+        Apply the operator to some spectra
+
+        Args:
+            - *spectra*: an array of shape (n_of_spectra, n_of_channels); for
+              a sparse operator, it can also have more channels
+
+        Returns:
+            A numpy array of shape (n_of_spectra,) + output_shape
+        """
+        spectra = np.asarray(spectra)
+        if self.__csr is None:
+            if spectra.shape[-1] != self.__n_of_channels:
+                raise ValueError('The spectra have {} channels, but the '
+                                 'operator needs {}'.format(
+                                     spectra.shape[-1], self.__n_of_channels))
+            result = np.dot(spectra.astype(np.float64), self.__matrix.T)
+            return result[:, 0] if self.__vector else result
+
+        if spectra.shape[-1] < self.__n_of_channels:
+            raise ValueError('The spectra have {} channels, but the operator '
+                             'needs {}'.format(spectra.shape[-1],
+                                               self.__n_of_channels))
+        data, indices, indptr = self.__csr
+        result = np.zeros((spectra.shape[0], self.__n_of_outputs))
+        not_empty = np.flatnonzero(np.diff(indptr) > 0)
+        if not_empty.size > 0:
+            products = spectra[:, indices] * data
+            result[:, not_empty] = np.add.reduceat(products,
+                                                   indptr[not_empty], axis=1)
+        return result
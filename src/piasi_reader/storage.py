@@ -0,0 +1,668 @@
+"""
+Piasi-reader: a library to read and convert the native IASI L1C files
+Copyright (C) 2015  Stefano Piani
+
+This library is free software; you can redistribute it and/or
+modify it under the terms of the GNU Lesser General Public
+License as published by the Free Software Foundation; either
+version 3.0 of the License, or (at your option) any later version.
+
+This library is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with this library; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+import hashlib
+import http.client
+import mmap
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock, local
+from urllib.parse import urlsplit
+
+
+# The default size of the blocks read by a ReadaheadScheduler and the
+# boundary to which their beginning and their end are aligned
+DEFAULT_READAHEAD_BLOCK_SIZE = 16 * 1024 * 1024
+DEFAULT_ALIGNMENT = 1024 * 1024
+
+# The size of the blocks downloaded by a HttpRangeStorage, the memory used
+# to keep the last blocks, the number of requests made at the same time
+# and the largest gap between two ranges that are downloaded together
+DEFAULT_HTTP_BLOCK_SIZE = 64 * 1024
+DEFAULT_MEMORY_CACHE_SIZE = 64 * 1024 * 1024
+DEFAULT_MAX_CONNECTIONS = 4
+DEFAULT_MAX_GAP = 256 * 1024
+
+
+class StorageException(IOError):
+    """
+    This error is raised if a remote storage can not give the requested
+    data
+    """
+    pass
+
+
+def is_url(location):
+    """
+    True if location is a string with an http or https URL
+    """
+    return isinstance(location, str) and \
+        location.split('://', 1)[0].lower() in ('http', 'https')
+
+
+class LocalFileStorage(object):
+    """
+    Read-only access to a file on the local disk that can be shared by
+    several threads. The data are read with positional reads, which do not
+    move a shared file position, so no lock is needed to read from
+    different threads; the whole file is also available as a memory map,
+    created the first time it is requested.
+
+    Args:
+        - *path*: the path of the file
+    """
+    def __init__(self, path):
+        self.__path = path
+        self.__fd = os.open(path, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+        self.__size = os.fstat(self.__fd).st_size
+        self.__mmap = None
+        self.__lock = Lock()
+
+    @property
+    def path(self):
+        return self.__path
+
+    @property
+    def size(self):
+        """
+        The size of the file (in bytes) when it has been opened
+        """
+        return self.__size
+
+    @property
+    def buffer(self):
+        """
+        A read-only memory map of the file (or an empty bytes object if the
+        file is empty)
+        """
+        if self.__mmap is None:
+            with self.__lock:
+                if self.__mmap is None:
+                    if self.__size == 0:
+                        self.__mmap = b''
+                    else:
+                        self.__mmap = mmap.mmap(self.__fd, self.__size,
+                                                access=mmap.ACCESS_READ)
+        return self.__mmap
+
+    def pread(self, offset, size):
+        """
+        Read *size* bytes starting from *offset*; less bytes are returned
+        only if the file ends before.
+
+        Args:
+            - *offset*: the position of the first byte to read
+            - *size*: the number of bytes to read
+
+        Returns:
+            A bytes object
+        """
+        if not hasattr(os, 'pread'):
+            return bytes(self.buffer[offset:offset + size])
+
+        chunks = []
+        missing = size
+        while missing > 0:
+            chunk = os.pread(self.__fd, missing, offset)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            offset += len(chunk)
+            missing -= len(chunk)
+        return b''.join(chunks)
+
+    def preadv(self, ranges):
+        """
+        Read several ranges of bytes
+
+        Args:
+            - *ranges*: a list of couples (offset, size)
+
+        Returns:
+            A list of bytes objects
+        """
+        return [self.pread(offset, size) for offset, size in ranges]
+
+    def close(self):
+        """
+        Close the file. The memory map is released only when no array uses
+        it anymore.
+        """
+        if self.__fd is None:
+            return
+        if self.__mmap is not None and not isinstance(self.__mmap, bytes):
+            try:
+                self.__mmap.close()
+            except BufferError:
+                pass
+        os.close(self.__fd)
+        self.__fd = None
+
+    def __del__(self):
+        try:
+            self.close()
+        except (AttributeError, OSError):
+            pass
+
+
+class StorageReader(object):
+    """
+    A read-only file object that reads its data from a storage (an object
+    with a size property and a pread method), so that the functions that
+    read from a file can be used on any storage.
+
+    Args:
+        - *storage*: the storage (like a HttpRangeStorage)
+    """
+    def __init__(self, storage):
+        self.__storage = storage
+        self.__position = 0
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.__storage.size - self.__position
+        size = max(min(size, self.__storage.size - self.__position), 0)
+        data = self.__storage.pread(self.__position, size)
+        self.__position += len(data)
+        return data
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self.__position
+        elif whence == 2:
+            offset += self.__storage.size
+        self.__position = offset
+        return self.__position
+
+    def tell(self):
+        return self.__position
+
+    def prefetch(self, ranges):
+        """
+        Tell the storage that some ranges (a list of couples (offset,
+        size)) will be read soon, so that it can download them together
+        """
+        preadv = getattr(self.__storage, 'preadv', None)
+        if preadv is not None:
+            preadv(ranges)
+
+
+class HttpRangeStorage(object):
+    """
+    Read-only access to a file published by a web server, that downloads
+    only the parts of the file that are read (with the Range header of
+    HTTP). The file is divided in blocks of block_size bytes; the blocks
+    needed by a read that have not been downloaded yet are requested
+    together, joining in a single request the blocks that are near each
+    other (less than max_gap bytes between them), and the requests are made
+    in parallel on max_connections connections, that are kept open.
+
+    The last blocks downloaded are kept in memory; if cache_dir is not None,
+    every block is also saved inside that directory, so that it is not
+    downloaded again by the other objects (or the other processes) that
+    read the same file. The blocks saved on the disk are associated to the
+    size and to the ETag (or the last modification date) of the file.
+
+    The object can be used by several threads at the same time and it can
+    be pickled (the cache in memory is not transferred).
+
+    Args:
+        - *url*: the URL of the file (http or https)
+        - *block_size*: the size of the blocks
+        - *memory_cache_size*: the memory (in bytes) used to keep the last
+          blocks downloaded
+        - *cache_dir*: a directory where the blocks are saved, or None
+        - *max_connections*: the number of requests made at the same time
+        - *max_gap*: the largest gap (in bytes) between two ranges that are
+          downloaded with a single request
+        - *timeout*: the timeout of the connections (in seconds)
+        - *headers*: a dictionary with other headers sent with every
+          request (for example, for the authentication)
+    """
+    def __init__(self, url, block_size=DEFAULT_HTTP_BLOCK_SIZE,
+                 memory_cache_size=DEFAULT_MEMORY_CACHE_SIZE, cache_dir=None,
+                 max_connections=DEFAULT_MAX_CONNECTIONS,
+                 max_gap=DEFAULT_MAX_GAP, timeout=60., headers=None):
+        self.__url = url
+        self.__block_size = block_size
+        self.__memory_cache_size = memory_cache_size
+        self.__cache_dir = cache_dir
+        self.__max_connections = max(max_connections, 1)
+        self.__max_gap = max_gap
+        self.__timeout = timeout
+        self.__headers = dict(headers) if headers is not None else {}
+        self.__open()
+
+        response, _ = self.__request('HEAD', {})
+        length = response.getheader('Content-Length')
+        version = response.getheader('ETag') or \
+            response.getheader('Last-Modified') or ''
+        if response.status != 200 or length is None:
+            # Ask for the first byte: the size is in the Content-Range
+            response, _ = self.__request('GET', {'Range': 'bytes=0-0'})
+            content_range = response.getheader('Content-Range') or ''
+            if response.status != 206 or '/' not in content_range:
+                raise StorageException('Can not read the size of {} (HTTP '
+                                       'status {})'.format(url,
+                                                           response.status))
+            length = content_range.rsplit('/', 1)[1]
+        self.__size = int(length)
+        self.__cache_key = hashlib.sha1('{} {} {}'.format(
+            url, self.__size, version).encode('utf-8')).hexdigest()
+
+    def __open(self):
+        """
+        Initialize the parts of the state that are not pickled
+        """
+        parts = urlsplit(self.__url)
+        if parts.scheme.lower() == 'https':
+            self.__connection_class = http.client.HTTPSConnection
+        else:
+            self.__connection_class = http.client.HTTPConnection
+        self.__netloc = parts.netloc
+        self.__target = parts.path or '/'
+        if parts.query:
+            self.__target += '?' + parts.query
+        self.__blocks = OrderedDict()
+        self.__lock = Lock()
+        self.__local = local()
+        self.__executor = None
+        self.__executor_pid = None
+        self.__n_of_requests = 0
+        self.__bytes_downloaded = 0
+
+    def __getstate__(self):
+        return {'url': self.__url,
+                'block_size': self.__block_size,
+                'memory_cache_size': self.__memory_cache_size,
+                'cache_dir': self.__cache_dir,
+                'max_connections': self.__max_connections,
+                'max_gap': self.__max_gap,
+                'timeout': self.__timeout,
+                'headers': self.__headers,
+                'size': self.__size,
+                'cache_key': self.__cache_key}
+
+    def __setstate__(self, state):
+        self.__url = state['url']
+        self.__block_size = state['block_size']
+        self.__memory_cache_size = state['memory_cache_size']
+        self.__cache_dir = state['cache_dir']
+        self.__max_connections = state['max_connections']
+        self.__max_gap = state['max_gap']
+        self.__timeout = state['timeout']
+        self.__headers = state['headers']
+        self.__size = state['size']
+        self.__cache_key = state['cache_key']
+        self.__open()
+
+    @property
+    def path(self):
+        """
+        The URL of the file
+        """
+        return self.__url
+
+    @property
+    def size(self):
+        """
+        The size of the file (in bytes) when it has been opened
+        """
+        return self.__size
+
+    @property
+    def n_of_requests(self):
+        """
+        The number of requests made to the server until now
+        """
+        return self.__n_of_requests
+
+    @property
+    def bytes_downloaded(self):
+        """
+        The number of bytes downloaded until now
+        """
+        return self.__bytes_downloaded
+
+    def __request(self, method, headers):
+        """
+        Make a request on the connection of the current thread; if the
+        connection has been closed by the server, open it again
+        """
+        all_headers = dict(self.__headers)
+        all_headers.update(headers)
+        for attempt in range(2):
+            connection = getattr(self.__local, 'connection', None)
+            if connection is None:
+                connection = self.__connection_class(self.__netloc,
+                                                     timeout=self.__timeout)
+                self.__local.connection = connection
+            try:
+                connection.request(method, self.__target,
+                                   headers=all_headers)
+                response = connection.getresponse()
+                body = response.read()
+            except (http.client.HTTPException, OSError):
+                connection.close()
+                self.__local.connection = None
+                if attempt > 0:
+                    raise
+                continue
+            with self.__lock:
+                self.__n_of_requests += 1
+                self.__bytes_downloaded += len(body)
+            return response, body
+
+    def __download(self, first_block, last_block):
+        """
+        Download the blocks from first_block to last_block (included) with
+        a single request; return a list with their content
+        """
+        start = first_block * self.__block_size
+        end = min((last_block + 1) * self.__block_size, self.__size)
+        response, body = self.__request(
+            'GET', {'Range': 'bytes={}-{}'.format(start, end - 1)})
+        if response.status == 206:
+            content_range = response.getheader('Content-Range') or ''
+            if not content_range.startswith('bytes {}-'.format(start)):
+                raise StorageException('Unexpected range from {}: '
+                                       '{}'.format(self.__url, content_range))
+        elif response.status == 200:
+            # The whole file has been sent: reading it block by block would
+            # download it again for every block
+            raise StorageException('The server of {} does not support range '
+                                   'requests'.format(self.__url))
+        else:
+            raise StorageException('Error while reading {}: HTTP status '
+                                   '{}'.format(self.__url, response.status))
+        if len(body) != end - start:
+            raise StorageException('{} bytes received from {} instead of '
+                                   '{}'.format(len(body), self.__url,
+                                               end - start))
+        return [body[i:i + self.__block_size]
+                for i in range(0, len(body), self.__block_size)]
+
+    def __block_path(self, block):
+        return os.path.join(self.__cache_dir, self.__cache_key,
+                            str(block))
+
+    def __cached_block(self, block):
+        """
+        Return a block from the cache (in memory or on the disk) or None
+        """
+        with self.__lock:
+            data = self.__blocks.get(block)
+            if data is not None:
+                self.__blocks.move_to_end(block)
+                return data
+        if self.__cache_dir is None:
+            return None
+        try:
+            with open(self.__block_path(block), 'rb') as block_file:
+                data = block_file.read()
+        except OSError:
+            return None
+        self.__keep_block(block, data)
+        return data
+
+    def __keep_block(self, block, data):
+        with self.__lock:
+            self.__blocks[block] = data
+            self.__blocks.move_to_end(block)
+            max_blocks = max(self.__memory_cache_size // self.__block_size, 1)
+            while len(self.__blocks) > max_blocks:
+                self.__blocks.popitem(last=False)
+
+    def __save_block(self, block, data):
+        directory = os.path.join(self.__cache_dir, self.__cache_key)
+        if not os.path.isdir(directory):
+            os.makedirs(directory, exist_ok=True)
+        path = self.__block_path(block)
+        temp_path = '{}.{}.{}.tmp'.format(path, os.getpid(), id(data))
+        with open(temp_path, 'wb') as block_file:
+            block_file.write(data)
+        os.replace(temp_path, path)
+
+    def __executor_for_downloads(self):
+        with self.__lock:
+            # The threads of the pool do not survive a fork
+            if self.__executor is None or self.__executor_pid != os.getpid():
+                self.__executor = ThreadPoolExecutor(self.__max_connections)
+                self.__executor_pid = os.getpid()
+            return self.__executor
+
+    def __read_blocks(self, blocks):
+        """
+        Return a dictionary with the content of some blocks, downloading
+        the ones that are not in the cache
+        """
+        content = {}
+        missing = []
+        for block in sorted(set(blocks)):
+            data = self.__cached_block(block)
+            if data is None:
+                missing.append(block)
+            else:
+                content[block] = data
+        if len(missing) == 0:
+            return content
+
+        # Join the missing blocks that are near each other; the blocks in
+        # the gaps are downloaded again even if they are in the cache
+        max_gap_blocks = self.__max_gap // self.__block_size
+        runs = [[missing[0], missing[0]]]
+        for block in missing[1:]:
+            if block - runs[-1][1] - 1 <= max_gap_blocks:
+                runs[-1][1] = block
+            else:
+                runs.append([block, block])
+
+        if len(runs) == 1:
+            results = [self.__download(*runs[0])]
+        else:
+            executor = self.__executor_for_downloads()
+            results = list(executor.map(lambda run: self.__download(*run),
+                                        runs))
+        for (first_block, _), run_blocks in zip(runs, results):
+            for block, data in enumerate(run_blocks, first_block):
+                content[block] = data
+                self.__keep_block(block, data)
+                if self.__cache_dir is not None:
+                    self.__save_block(block, data)
+        return content
+
+    def preadv(self, ranges):
+        """
+        Read several ranges of bytes, downloading together all the blocks
+        that are needed
+
+        Args:
+            - *ranges*: a list of couples (offset, size)
+
+        Returns:
+            A list of bytes objects
+        """
+        ranges = [(offset, max(min(size, self.__size - offset), 0))
+                  for offset, size in ranges]
+        blocks = []
+        for offset, size in ranges:
+            if size > 0:
+                blocks.extend(range(offset // self.__block_size,
+                                    (offset + size - 1) // self.__block_size
+                                    + 1))
+        content = self.__read_blocks(blocks)
+
+        result = []
+        for offset, size in ranges:
+            if size == 0:
+                result.append(b'')
+                continue
+            first_block = offset // self.__block_size
+            last_block = (offset + size - 1) // self.__block_size
+            data = b''.join(content[b]
+                            for b in range(first_block, last_block + 1))
+            start = offset - first_block * self.__block_size
+            result.append(data[start:start + size])
+        return result
+
+    def pread(self, offset, size):
+        """
+        Read *size* bytes starting from *offset*; less bytes are returned
+        only if the file ends before.
+
+        Args:
+            - *offset*: the position of the first byte to read
+            - *size*: the number of bytes to read
+
+        Returns:
+            A bytes object
+        """
+        return self.preadv([(offset, size)])[0]
+
+    def close(self):
+        """
+        Close the connection of the current thread and stop the pool of
+        threads that downloads the blocks
+        """
+        connection = getattr(self.__local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self.__local.connection = None
+        with self.__lock:
+            if self.__executor is not None:
+                self.__executor.shutdown(wait=False)
+                self.__executor = None
+            self.__blocks = OrderedDict()
+
+
+def plan_blocks(ranges, block_size=DEFAULT_READAHEAD_BLOCK_SIZE,
+                alignment=DEFAULT_ALIGNMENT, file_size=None):
+    """
+    Group a sequence of byte ranges in blocks that can be read with a
+    single request: consecutive ranges that are near each other (less than
+    *alignment* bytes between them) are read together, as long as the block
+    is not bigger than block_size (a range bigger than block_size gets a
+    block on its own). The blocks begin and end on a multiple of alignment.
+
+    Args:
+        - *ranges*: a list of couples (offset, size)
+        - *block_size*: the maximum size of a block
+        - *alignment*: the alignment of the blocks
+        - *file_size*: if it is not None, no block goes beyond this size
+
+    Returns:
+        A list of couples (offset, size) with the blocks and a list with
+        the index of the block of each range
+    """
+    blocks = []
+    block_of_range = []
+    current_start = current_end = None
+    for offset, size in ranges:
+        start = offset - offset % alignment
+        end = -(-(offset + size) // alignment) * alignment
+        if file_size is not None:
+            end = min(end, max(file_size, offset + size))
+        if current_start is not None and \
+                current_start <= offset <= current_end + alignment and \
+                max(end, current_end) - current_start <= block_size:
+            current_end = max(end, current_end)
+        else:
+            if current_start is not None:
+                blocks.append((current_start, current_end - current_start))
+            current_start, current_end = start, end
+        block_of_range.append(len(blocks))
+    if current_start is not None:
+        blocks.append((current_start, current_end - current_start))
+    return blocks, block_of_range
+
+
+class ReadaheadScheduler(object):
+    """
+    Read a sequence of byte ranges from a storage (an object with a pread
+    method, like a LocalFileStorage) in the background: while a range is
+    being used, the blocks that contain the following ones are already
+    being read by a pool of threads. The ranges are grouped in large
+    aligned blocks (see plan_blocks).
+
+    The ranges must be requested in order (some of them can be skipped).
+
+    Args:
+        - *storage*: the object that reads the data
+        - *ranges*: a list of couples (offset, size)
+        - *depth*: how many blocks are read in advance
+        - *block_size*: the maximum size of a block
+        - *alignment*: the alignment of the blocks
+        - *executor*: the concurrent.futures executor that reads the
+          blocks; if None, a new pool of *depth* threads is used
+    """
+    def __init__(self, storage, ranges, depth=4,
+                 block_size=DEFAULT_READAHEAD_BLOCK_SIZE,
+                 alignment=DEFAULT_ALIGNMENT, executor=None):
+        self.__storage = storage
+        self.__ranges = list(ranges)
+        self.__blocks, self.__block_of_range = plan_blocks(
+            self.__ranges, block_size, alignment,
+            getattr(storage, 'size', None))
+        self.__depth = max(depth, 1)
+        self.__own_executor = executor is None
+        if executor is None:
+            executor = ThreadPoolExecutor(self.__depth)
+        self.__executor = executor
+        self.__futures = {}
+        self.__next_block = 0
+
+    def read(self, k):
+        """
+        Return the data of the k-th range (a bytes object)
+        """
+        block = self.__block_of_range[k]
+
+        # Forget the blocks that will not be used anymore and start reading
+        # the next ones
+        for old_block in [b for b in self.__futures if b < block]:
+            self.__futures.pop(old_block).cancel()
+        self.__next_block = max(self.__next_block, block)
+        while self.__next_block < min(block + self.__depth + 1,
+                                      len(self.__blocks)):
+            offset, size = self.__blocks[self.__next_block]
+            self.__futures[self.__next_block] = self.__executor.submit(
+                self.__storage.pread, offset, size)
+            self.__next_block += 1
+
+        data = self.__futures[block].result()
+        block_offset = self.__blocks[block][0]
+        offset, size = self.__ranges[k]
+        return data[offset - block_offset:offset - block_offset + size]
+
+    def close(self):
+        """
+        Stop reading the blocks that have not been used
+        """
+        for future in self.__futures.values():
+            future.cancel()
+        self.__futures = {}
+        if self.__own_executor:
+            self.__executor.shutdown(wait=False)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
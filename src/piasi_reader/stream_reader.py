@@ -0,0 +1,124 @@
+"""
+Piasi-reader: a library to read and convert the native IASI L1C files
+Copyright (C) 2015  Stefano Piani
+
+This library is free software; you can redistribute it and/or
+modify it under the terms of the GNU Lesser General Public
+License as published by the Free Software Foundation; either
+version 3.0 of the License, or (at your option) any later version.
+
+This library is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with this library; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+from piasi_reader.iasi_l1c_native_file import (Record,
+                                               GiadrScalefactorsNotFoundException)
+from piasi_reader.records.mdr import MDR
+from piasi_reader.sources import SequentialReader
+
+
+class IasiL1cStreamReader(object):
+    """
+    Read a native file from a binary stream (a pipe, a socket, the standard
+    input, ...) one record at a time, interpreting the scan lines as soon as
+    they are received. The size of the stream does not need to be known and
+    the records are not kept in memory after they have been processed.
+
+    The headers of the file (MPHR and GIADR records) are available as soon
+    as they have been read; the GIADR scalefactor record must be received
+    before the first mdr record.
+
+    Args:
+        - *stream*: a binary file object
+    """
+    def __init__(self, stream):
+        self.__stream = SequentialReader(stream)
+        self.__mphr = None
+        self.__giadr_quality = None
+        self.__giadr_scalefactors = None
+        self.__n_of_lines = 0
+        self.__bytes_read = 0
+
+    @property
+    def mphr(self):
+        """
+        The content of the MPHR record, or None if it has not been read yet
+        """
+        return self.__mphr
+
+    @property
+    def giadr_quality(self):
+        """
+        The content of the GIADR quality record, or None if it has not been
+        read yet
+        """
+        return self.__giadr_quality
+
+    @property
+    def giadr_scalefactors(self):
+        """
+        The content of the GIADR scalefactor record, or None if it has not
+        been read yet
+        """
+        return self.__giadr_scalefactors
+
+    @property
+    def n_of_lines(self):
+        """
+        The number of scan lines (mdr records) read until now
+        """
+        return self.__n_of_lines
+
+    @property
+    def bytes_read(self):
+        """
+        The number of bytes read from the stream until now
+        """
+        return self.__bytes_read
+
+    def __iter__(self):
+        """
+        Read the stream until its end, yielding an interpreted MDR object
+        for each scan line as soon as it has been received
+        """
+        while True:
+            rcd = Record.read(self.__stream)
+            if rcd is None:
+                return
+            self.__bytes_read += rcd.size
+
+            if rcd.type == 'MPHR':
+                self.__mphr = rcd.content
+            elif rcd.type == 'GIADR' and rcd.grh.record_subclass == 0:
+                self.__giadr_quality = rcd.content
+            elif rcd.type == 'GIADR' and rcd.grh.record_subclass == 1:
+                self.__giadr_scalefactors = rcd.content
+            elif rcd.type == 'MDR':
+                if self.__giadr_scalefactors is None:
+                    raise GiadrScalefactorsNotFoundException
+                mdr = MDR.read(rcd.content.raw, rcd.grh,
+                               self.__giadr_scalefactors)
+                self.__n_of_lines += 1
+                yield mdr
+
+    def process(self, callback):
+        """
+        Read the stream until its end, calling *callback* on every scan line
+        as soon as it has been received.
+
+        Args:
+            - *callback*: a function that receives the index of the scan line
+              and the interpreted MDR object
+
+        Returns:
+            The number of scan lines read
+        """
+        for i, mdr in enumerate(self):
+            callback(i, mdr)
+        return self.__n_of_lines
@@ -0,0 +1,161 @@
+"""
+Piasi-reader: a library to read and convert the native IASI L1C files
+Copyright (C) 2015  Stefano Piani
+
+This library is free software; you can redistribute it and/or
+modify it under the terms of the GNU Lesser General Public
+License as published by the Free Software Foundation; either
+version 3.0 of the License, or (at your option) any later version.
+
+This library is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with this library; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+from __future__ import division
+
+from collections import OrderedDict
+
+import numpy as np
+
+
+EARTH_RADIUS = 6371.0
+
+
+def grid_boxes(latitudes, longitudes, box_size):
+    """
+    Assign every point to a box of a grid whose boxes have (approximately)
+    the same area: the grid is made of bands of latitude of width box_size
+    and every band is divided in as many boxes as the number of segments
+    of length box_size that fit in its central parallel.
+
+    Args:
+        - *latitudes*: an array with the latitudes of the points (degrees)
+        - *longitudes*: an array with the longitudes of the points (degrees)
+        - *box_size*: the side of the boxes (km)
+
+    Returns:
+        An array of integers with the same shape of latitudes, with the
+        identifier of the box of each point
+    """
+    latitudes = np.asarray(latitudes, dtype=np.float64)
+    longitudes = np.asarray(longitudes, dtype=np.float64)
+
+    box_degrees = np.degrees(box_size / EARTH_RADIUS)
+    n_of_bands = int(np.ceil(180. / box_degrees))
+    max_boxes_per_band = int(np.ceil(360. / box_degrees))
+
+    band = np.floor((latitudes + 90.) / box_degrees).astype(np.int64)
+    band = np.clip(band, 0, n_of_bands - 1)
+    band_centre = -90. + (band + 0.5) * box_degrees
+    boxes_per_band = np.floor(360. * np.cos(np.radians(band_centre)) /
+                              box_degrees).astype(np.int64)
+    boxes_per_band = np.clip(boxes_per_band, 1, max_boxes_per_band)
+
+    column = np.floor((longitudes + 180.) % 360. / 360. *
+                      boxes_per_band).astype(np.int64)
+    column = np.minimum(column, boxes_per_band - 1)
+    return band * max_boxes_per_band + column
+
+
+def best_in_boxes(boxes, score=None):
+    """
+    Choose one point for each box: the one with the lowest score (the NaN
+    values are considered greater than any other value) or, if score is
+    None, the first one.
+
+    Args:
+        - *boxes*: a 1D array with the box of each point
+        - *score*: None or a 1D array with the score of each point
+
+    Returns:
+        A sorted array with the indices of the chosen points
+    """
+    boxes = np.asarray(boxes)
+    if score is None:
+        score = np.zeros(boxes.shape)
+    score = np.where(np.isnan(score), np.inf, score)
+    order = np.lexsort((np.arange(boxes.size), score, boxes))
+    sorted_boxes = boxes[order]
+    first = np.ones(boxes.size, dtype=bool)
+    first[1:] = sorted_boxes[1:] != sorted_boxes[:-1]
+    return np.sort(order[first])
+
+
+class SuperObservations(object):
+    """
+    Accumulate the sum of some fields over the boxes of a grid, a group of
+    observations at a time, to compute the mean value of each field inside
+    every box (a super-observation) without keeping the observations in
+    memory.
+    """
+    def __init__(self):
+        self.__rows = {}
+        self.__boxes = []
+        self.__counts = np.zeros(0, dtype=np.int64)
+        self.__sums = OrderedDict()
+
+    def __grow(self, n_of_rows):
+        capacity = self.__counts.shape[0]
+        if n_of_rows <= capacity:
+            return
+        new_capacity = max(n_of_rows, 2 * capacity, 16)
+        self.__counts = np.concatenate(
+            (self.__counts, np.zeros(new_capacity - capacity, np.int64)))
+        for name, sums in self.__sums.items():
+            padding = np.zeros((new_capacity - capacity,) + sums.shape[1:])
+            self.__sums[name] = np.concatenate((sums, padding))
+
+    def add(self, boxes, values):
+        """
+        Add a group of observations
+
+        Args:
+            - *boxes*: a 1D array with the box of each observation
+            - *values*: a dictionary that associates to the name of each
+              field an array with a row for each observation
+        """
+        boxes = np.asarray(boxes)
+        if boxes.size == 0:
+            return
+        unique_boxes, inverse = np.unique(boxes, return_inverse=True)
+        rows = np.empty(unique_boxes.size, dtype=np.int64)
+        for k, box in enumerate(unique_boxes.tolist()):
+            if box not in self.__rows:
+                self.__rows[box] = len(self.__boxes)
+                self.__boxes.append(box)
+            rows[k] = self.__rows[box]
+        self.__grow(len(self.__boxes))
+
+        # Sum the observations of each box with a single pass, sorting them
+        # by box
+        order = np.argsort(inverse, kind='stable')
+        starts = np.flatnonzero(np.r_[True, np.diff(inverse[order]) != 0])
+        self.__counts[rows] += np.diff(np.r_[starts, boxes.size])
+        for name, value in values.items():
+            value = np.asarray(value, dtype=np.float64)
+            if name not in self.__sums:
+                self.__sums[name] = np.zeros((self.__counts.shape[0],) +
+                                             value.shape[1:])
+            self.__sums[name][rows] += np.add.reduceat(value[order], starts,
+                                                       axis=0)
+
+    def result(self):
+        """
+        Return an OrderedDict with the identifiers of the boxes ("boxes"),
+        the number of observations of each box ("counts") and the mean
+        value of each field inside each box
+        """
+        n_of_boxes = len(self.__boxes)
+        counts = self.__counts[:n_of_boxes]
+        result = OrderedDict([('boxes', np.array(self.__boxes, dtype=np.int64)),
+                              ('counts', counts.copy())])
+        for name, sums in self.__sums.items():
+            divisor = counts.reshape((-1,) + (1,) * (sums.ndim - 1))
+            result[name] = sums[:n_of_boxes] / divisor
+        return result
@@ -19,9 +19,11 @@ Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
 
 from __future__ import division
 
+import os
+from datetime import datetime, timedelta
 from struct import unpack
-from numpy import (fromstring, dtype, int8, uint8, int32, uint32, zeros, array,
-                   meshgrid, argmax, max)
+from numpy import (frombuffer, ascontiguousarray, dtype, int8, uint8, int32,
+                   array, meshgrid, argmax, max)
 
 dui = dtype(uint8)
 dui = dui.newbyteorder('>')
@@ -43,13 +45,21 @@ def where_greater(a, b):
     output += fix_empty_entries
     return output
 
+def decode_vint(as_uint_data):
+    """
+    Decode an array of VInt values. The input is an array of uint8 whose
+    last axis has length 5 (one byte for the scale factor followed by a
+    big endian int32); the output is an array of floats with the shape of
+    the input without the last axis.
+    """
+    scale_factors = as_uint_data[..., 0].view(int8)
+    mantissa = ascontiguousarray(as_uint_data[..., 1:]).view('>i4')[..., 0]
+    return mantissa / 10.0**scale_factors
+
 def read_vint(raw_data):
     n_elements = len(raw_data) // 5
-    as_uint_data = fromstring(raw_data, dtype=dui).reshape(n_elements, 5)
-    mantissa = zeros((n_elements,), dtype = uint32)
-    for i in range(4):
-        mantissa += as_uint_data[:,i+1]*(256**(3-i))
-    return int32(mantissa) / 10.0**int8(as_uint_data[:,0])
+    as_uint_data = frombuffer(raw_data, dtype=dui).reshape(n_elements, 5)
+    return decode_vint(as_uint_data)
 
 def read_short_date(raw_data):
     n_elements = len(raw_data) // 6
@@ -58,3 +68,82 @@ def read_short_date(raw_data):
         format_string += "HI"
     unpacked_data = unpack(format_string, raw_data)
     return array(unpacked_data, dtype=int32).reshape(n_elements,2)
+
+def fbf_file_name(file_name, data_type, shape):
+    """
+    Return the name of a flat binary file that contains an array with
+    the given data type and shape; the name is made by file_name, followed
+    by the data type (like real8 or int4) and by all the dimensions of the
+    array except the first one, separated by dots.
+    """
+    data_type = dtype(data_type)
+    data_size = str(data_type.itemsize)
+    # Remove the unit of datetime64 and timedelta64 types
+    type_name = data_type.name.split('[')[0]
+    i = 0
+    while i < len(type_name) and not type_name[i:].isdigit():
+        i+=1
+    data_name = type_name[:i].replace('float', 'real')
+
+    complete_file_name = file_name + '.' + data_name + data_size
+
+    if len(shape)>1:
+        for i in range(1,len(shape)):
+            complete_file_name += '.' + str(shape[i])
+    return complete_file_name
+
+def grh_time(day, msec):
+    """
+    Convert a time saved in a grh (days and milliseconds since 2000-01-01)
+    into a datetime object
+    """
+    return datetime(2000, 1, 1) + timedelta(days=int(day),
+                                            milliseconds=int(msec))
+
+def copy_file_ranges(source, destination, ranges, block_size=16 * 1024 * 1024):
+    """
+    Copy some byte ranges of a file at the end of another file. Adjacent
+    ranges are merged, and the data are copied by the kernel (with
+    copy_file_range or sendfile) when possible, otherwise with a buffered
+    copy.
+
+    Args:
+        - *source*: a binary file object open for reading
+        - *destination*: a binary file object open for writing
+        - *ranges*: a list of tuples (offset, size)
+        - *block_size*: the maximum number of bytes copied at a time
+    """
+    merged = []
+    for offset, size in ranges:
+        if len(merged) > 0 and merged[-1][0] + merged[-1][1] == offset:
+            merged[-1] = (merged[-1][0], merged[-1][1] + size)
+        else:
+            merged.append((offset, size))
+
+    destination.flush()
+    src_fd = source.fileno()
+    dst_fd = destination.fileno()
+    out_offset = os.lseek(dst_fd, 0, os.SEEK_END)
+
+    for offset, size in merged:
+        while size > 0:
+            to_copy = min(size, block_size)
+            copied = 0
+            try:
+                if hasattr(os, 'copy_file_range'):
+                    copied = os.copy_file_range(src_fd, dst_fd, to_copy,
+                                                offset, out_offset)
+                elif hasattr(os, 'sendfile'):
+                    os.lseek(dst_fd, out_offset, os.SEEK_SET)
+                    copied = os.sendfile(dst_fd, src_fd, offset, to_copy)
+            except OSError:
+                copied = 0
+            if copied == 0:
+                data = os.pread(src_fd, to_copy, offset)
+                if len(data) == 0:
+                    raise EOFError('The source file is shorter than expected')
+                copied = os.pwrite(dst_fd, data, out_offset)
+            offset += copied
+            out_offset += copied
+            size -= copied
+    os.lseek(dst_fd, out_offset, os.SEEK_SET)
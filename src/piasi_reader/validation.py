@@ -0,0 +1,182 @@
+"""
+Piasi-reader: a library to read and convert the native IASI L1C files
+Copyright (C) 2015  Stefano Piani
+
+This library is free software; you can redistribute it and/or
+modify it under the terms of the GNU Lesser General Public
+License as published by the Free Software Foundation; either
+version 3.0 of the License, or (at your option) any later version.
+
+This library is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with this library; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from os.path import getsize
+
+from piasi_reader.iasi_l1c_native_file import Record
+from piasi_reader.records.grh import GRH, InvalidRecordException
+from piasi_reader.records.mdr import mdr_record_size
+from piasi_reader.sources import compression_type, open_native_file
+
+
+class ValidationReport(object):
+    """
+    The result of the validation of a native file.
+
+    Attributes:
+        - *path*: the path of the file
+        - *problems*: a list of strings that describe the problems found
+        - *n_of_records*: the number of records whose grh is valid
+        - *n_of_mdrs*: the number of mdr records whose grh is valid
+        - *size*: the number of bytes of the file (uncompressed)
+    """
+    def __init__(self, path):
+        self.path = path
+        self.problems = []
+        self.n_of_records = 0
+        self.n_of_mdrs = 0
+        self.size = 0
+
+    @property
+    def valid(self):
+        """
+        True if no problem has been found
+        """
+        return len(self.problems) == 0
+
+    @property
+    def status(self):
+        """
+        "OK" if the file is valid, "CORRUPTED" otherwise
+        """
+        return 'OK' if self.valid else 'CORRUPTED'
+
+    def __str__(self):
+        output = '{}: {} ({} records, {} mdr)'.format(self.path,
+                                                      self.status,
+                                                      self.n_of_records,
+                                                      self.n_of_mdrs)
+        for problem in self.problems:
+            output += '\n  - ' + problem
+        return output
+
+
+def validate_file(path):
+    """
+    Check the structure of a native file reading only the headers of its
+    records: the chain of grhs must cover exactly the whole file, the
+    records must have a known class, the MPHR must be readable and
+    consistent with the records of the file, and every mdr record must have
+    the size expected for its subclass version. The content of the mdr
+    records is never read (unless the file is compressed, in which case it
+    must be decompressed anyway).
+
+    Args:
+        - *path*: the path of the file
+
+    Returns:
+        A ValidationReport object
+    """
+    report = ValidationReport(path)
+    try:
+        _check_file(path, report)
+    except (IOError, OSError, EOFError, ValueError) as e:
+        report.problems.append('Error while reading the file: ' + str(e))
+    return report
+
+
+def _check_file(path, report):
+    file_size = getsize(path) if compression_type(path) is None else None
+    mphr = None
+    counts = {}
+
+    with open_native_file(path) as f:
+        offset = 0
+        while file_size is None or offset < file_size:
+            try:
+                grh = GRH.read_grh(f)
+            except InvalidRecordException as e:
+                report.problems.append('Invalid grh at offset {}: {}'.format(
+                    offset, e))
+                break
+            if grh is None:
+                break
+
+            report.n_of_records += 1
+            counts[grh.record_class] = counts.get(grh.record_class, 0) + 1
+
+            if grh.record_class == 'MDR':
+                report.n_of_mdrs += 1
+                expected_size = mdr_record_size(grh.record_subclass_version)
+                if expected_size is None:
+                    report.problems.append(
+                        'Unknown subclass version {} for the MDR at offset '
+                        '{}'.format(grh.record_subclass_version, offset))
+                elif expected_size != grh.record_size:
+                    report.problems.append(
+                        'Invalid size {} for the MDR at offset {} (expected '
+                        '{})'.format(grh.record_size, offset, expected_size))
+
+            if grh.record_class == 'MPHR':
+                try:
+                    mphr = Record.read_content(f, grh).content
+                except InvalidRecordException as e:
+                    report.problems.append('Invalid MPHR: ' + str(e))
+            else:
+                f.seek(offset + grh.record_size)
+
+            offset += grh.record_size
+
+    if file_size is None:
+        report.size = offset
+    else:
+        report.size = file_size
+        if offset > file_size:
+            report.problems.append('The file is truncated: the last record '
+                                   'ends at {} but the file has only {} '
+                                   'bytes'.format(offset, file_size))
+
+    if counts.get('MPHR', 0) == 0:
+        report.problems.append('MPHR not found')
+    elif mphr is not None:
+        if mphr.total_records != report.n_of_records:
+            report.problems.append(
+                'The MPHR reports {} records but the file has {}'.format(
+                    mphr.total_records, report.n_of_records))
+        if mphr.total_mdr != report.n_of_mdrs:
+            report.problems.append(
+                'The MPHR reports {} MDRs but the file has {}'.format(
+                    mphr.total_mdr, report.n_of_mdrs))
+        if mphr.actual_product_size != report.size:
+            report.problems.append(
+                'The MPHR reports a size of {} bytes but the file has {} '
+                'bytes'.format(mphr.actual_product_size, report.size))
+
+
+def validate_files(paths, n_workers=None):
+    """
+    Validate many files in parallel; see validate_file.
+
+    Args:
+        - *paths*: a list of paths
+        - *n_workers*: the number of processes to use (if None, the number
+          of processors of the machine)
+
+    Returns:
+        A generator that yields a ValidationReport for each file, in the
+        same order of paths
+    """
+    if n_workers == 1:
+        for path in paths:
+            yield validate_file(path)
+        return
+    with ProcessPoolExecutor(n_workers) as executor:
+        for report in executor.map(validate_file, paths, chunksize=16):
+            yield report
@@ -0,0 +1,622 @@
+"""
+Piasi-reader: a library to read and convert the native IASI L1C files
+Copyright (C) 2015  Stefano Piani
+
+This library is free software; you can redistribute it and/or
+modify it under the terms of the GNU Lesser General Public
+License as published by the Free Software Foundation; either
+version 3.0 of the License, or (at your option) any later version.
+
+This library is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with this library; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+import ctypes
+import ctypes.util
+import fnmatch
+import json
+import logging
+import os
+import select
+import struct
+import sys
+import time
+from os.path import join
+from queue import Queue, Empty, Full
+from threading import Condition, Event, Lock, Thread
+
+from piasi_reader.iasi_l1c_native_file import (IasiL1cNativeFile, Record,
+                                               FBF_FILE_NAMES)
+from piasi_reader.sources import compression_type
+
+
+logger = logging.getLogger(__name__)
+
+# The events of inotify (see inotify(7)) used by the watcher
+_IN_MODIFY = 0x2
+_IN_CLOSE_WRITE = 0x8
+_IN_MOVED_TO = 0x80
+_IN_CREATE = 0x100
+_INOTIFY_EVENT = struct.Struct('iIII')
+
+
+class _Inotify(object):
+    """
+    The events of the files of a directory, read with the inotify interface
+    of Linux
+
+    Args:
+        - *directory*: the directory to watch
+    """
+    def __init__(self, directory):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.__fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.__fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        mask = _IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE
+        if libc.inotify_add_watch(self.__fd, os.fsencode(directory),
+                                  mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.__fd)
+            raise OSError(errno, 'inotify_add_watch failed', directory)
+        # A pipe used by wake to interrupt read
+        self.__wake_fds = os.pipe()
+        self.__lock = Lock()
+        self.__closed = False
+
+    def wake(self):
+        """
+        Make the current (or the next) call to read return immediately
+        """
+        with self.__lock:
+            if not self.__closed:
+                os.write(self.__wake_fds[1], b'\0')
+
+    def read(self, timeout):
+        """
+        Wait at most timeout seconds for some events; return a list of
+        couples (mask, name of the file)
+        """
+        readable, _, _ = select.select([self.__fd, self.__wake_fds[0]], [],
+                                       [], timeout)
+        if self.__wake_fds[0] in readable:
+            os.read(self.__wake_fds[0], 4096)
+        if self.__fd not in readable:
+            return []
+        try:
+            data = os.read(self.__fd, 65536)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset + _INOTIFY_EVENT.size <= len(data):
+            _, mask, _, length = _INOTIFY_EVENT.unpack_from(data, offset)
+            offset += _INOTIFY_EVENT.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            events.append((mask, os.fsdecode(name)))
+        return events
+
+    def close(self):
+        with self.__lock:
+            self.__closed = True
+            os.close(self.__fd)
+            os.close(self.__wake_fds[0])
+            os.close(self.__wake_fds[1])
+
+
+def _open_inotify(directory):
+    """
+    Return an _Inotify object for the directory, or None if inotify is not
+    available (on the systems that are not Linux)
+    """
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        return _Inotify(directory)
+    except (OSError, AttributeError, TypeError):
+        logger.warning('inotify is not available: the directory %s is '
+                       'polled', directory)
+        return None
+
+
+def _declared_size(path):
+    """
+    Return the size of a native file declared in its MPHR, or None if the
+    MPHR can not be read (for example, because it has not been written yet)
+    """
+    with open(path, 'rb') as f:
+        try:
+            record = Record.read(f)
+        except ValueError:
+            return None
+    if record is None or record.type != 'MPHR':
+        return None
+    return record.content.actual_product_size
+
+
+class ProcessedFiles(object):
+    """
+    The list of the files that have already been processed, saved on a JSON
+    file so that it survives a restart. For every file, it keeps its size
+    and its modification time (a file that changes is processed again), the
+    status of its processing ("running", "done" or "failed") and, for the
+    files processed a group of scan lines at a time, the number of scan
+    lines already processed.
+
+    The JSON file is replaced atomically when the status of a file
+    changes; the progress of a file being processed (the number of scan
+    lines) is saved at most once every save_interval seconds, so after a
+    crash a few groups of scan lines can be processed again.
+
+    Args:
+        - *path*: the path of the JSON file; if None, nothing is saved
+        - *save_interval*: the minimum number of seconds between two saves
+          of the progress of the files
+    """
+    def __init__(self, path=None, save_interval=5.):
+        self.__path = path
+        self.__save_interval = save_interval
+        self.__last_save = 0.
+        self.__unsaved = False
+        self.__lock = Lock()
+        self.__entries = {}
+        if path is not None and os.path.exists(path):
+            with open(path) as f:
+                self.__entries = json.load(f)
+
+    def __save(self):
+        if self.__path is None:
+            return
+        temp_path = self.__path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(self.__entries, f, indent=1, sort_keys=True)
+        os.replace(temp_path, self.__path)
+        self.__last_save = time.time()
+        self.__unsaved = False
+
+    def flush(self):
+        """
+        Save the progress of the files not saved yet
+        """
+        with self.__lock:
+            if self.__unsaved:
+                self.__save()
+
+    def get(self, name):
+        """
+        Return the entry of a file (a dictionary) or None
+        """
+        with self.__lock:
+            entry = self.__entries.get(name)
+            return None if entry is None else dict(entry)
+
+    def is_done(self, name, stat):
+        """
+        True if the file has already been processed (successfully or not)
+        and it has not changed since then
+        """
+        entry = self.get(name)
+        return entry is not None and \
+            entry['status'] in ('done', 'failed') and \
+            entry['size'] == stat.st_size and \
+            entry['mtime_ns'] == stat.st_mtime_ns
+
+    def update(self, name, stat, status, **values):
+        """
+        Save the status of a file
+
+        Args:
+            - *name*: the name of the file
+            - *stat*: the result of os.stat on the file
+            - *status*: "running", "done" or "failed"
+            - *values*: other values to save (like "lines" or "error")
+        """
+        with self.__lock:
+            entry = {'size': stat.st_size,
+                     'mtime_ns': stat.st_mtime_ns,
+                     'status': status}
+            entry.update(values)
+            previous = self.__entries.get(name)
+            self.__entries[name] = entry
+            progress = status == 'running' and previous is not None and \
+                previous['status'] == 'running'
+            if progress and \
+                    time.time() - self.__last_save < self.__save_interval:
+                self.__unsaved = True
+                return
+            self.__save()
+
+
+class DirectoryWatcher(object):
+    """
+    Watch a directory and process every native file that appears inside it
+    on a pool of worker threads.
+
+    The processing can be made in two ways:
+      - with a *handler*, that is called once for every file when it is
+        complete, with the path of the file and a IasiL1cNativeFile
+      - with a *chunk_handler*, that is called for every group of scan lines
+        (see IasiL1cNativeFile.iter_chunks) with the path of the file, the
+        IasiL1cNativeFile and the dictionary of the chunk; the files that
+        are not compressed are processed while they are being written, as
+        soon as their scan lines are complete
+
+    A file is complete when its size is the one declared in its MPHR or, if
+    this is not possible (for example, for the compressed files), when the
+    program that writes it closes it or its size has not changed for
+    settle_time seconds.
+
+    On Linux, the directory is watched with inotify: the files are found
+    (and the workers that follow a file being written receive its new scan
+    lines) as soon as they change, and poll_interval is only the maximum
+    time between two checks. Elsewhere, or if use_inotify is False, the
+    directory is polled every poll_interval seconds, and a compressed file
+    is processed only settle_time seconds after its last change.
+
+    The files ready to be processed wait in a queue of limited size: when it
+    is full, the directory is not scanned until a worker is free. The files
+    already processed are saved in a ProcessedFiles object, so that they are
+    not processed again after a restart; a file processed a group of scan
+    lines at a time restarts from the first group not yet processed.
+
+    Args:
+        - *directory*: the directory to watch
+        - *handler*: a function handler(path, iasi_file)
+        - *chunk_handler*: a function chunk_handler(path, iasi_file, chunk)
+        - *fields*: the fields of the chunks passed to chunk_handler
+        - *lines_per_chunk*: the number of scan lines of each chunk
+        - *patterns*: the patterns (like "*.nat") of the names of the files
+          to process
+        - *state_file*: the JSON file where the processed files are saved
+          (if None, they are not saved)
+        - *n_workers*: the number of worker threads
+        - *queue_size*: the maximum number of files waiting for a worker
+        - *poll_interval*: the number of seconds between two scans of the
+          directory (and between two checks of a file being written)
+        - *settle_time*: the number of seconds after which a file that does
+          not change is considered complete
+        - *use_inotify*: if False, always poll the directory
+    """
+    def __init__(self, directory, handler=None, chunk_handler=None,
+                 fields=(), lines_per_chunk=1, patterns=('*.nat',),
+                 state_file=None, n_workers=2, queue_size=None,
+                 poll_interval=1., settle_time=10., use_inotify=True):
+        if (handler is None) == (chunk_handler is None):
+            raise ValueError('Exactly one between handler and chunk_handler '
+                             'must be specified')
+        self.__directory = directory
+        self.__handler = handler
+        self.__chunk_handler = chunk_handler
+        self.__fields = tuple(fields)
+        self.__lines_per_chunk = lines_per_chunk
+        self.__patterns = tuple(patterns)
+        self.__processed = ProcessedFiles(state_file)
+        self.__n_workers = n_workers
+        if queue_size is None:
+            queue_size = 2 * n_workers
+        self.__queue = Queue(queue_size)
+        self.__poll_interval = poll_interval
+        self.__settle_time = settle_time
+        self.__use_inotify = use_inotify
+
+        self.__lock = Lock()
+        self.__active = set()
+        self.__last_change = {}
+        # The sizes declared in the MPHR of the files not complete yet, and
+        # the files closed by their writer after their last change
+        self.__declared_sizes = {}
+        self.__closed = set()
+        # Notified (and increased) when inotify reports a change
+        self.__changes = Condition()
+        self.__n_of_changes = 0
+        self.__inotify = None
+        self.__stop = Event()
+        self.__threads = []
+
+    @property
+    def processed_files(self):
+        """
+        The ProcessedFiles object with the status of the files
+        """
+        return self.__processed
+
+    def __is_ready(self, path, stat, now):
+        """
+        Decide if a file can be sent to the workers
+        """
+        name = os.path.basename(path)
+        previous = self.__last_change.get(name)
+        if previous is None or previous[0] != (stat.st_size,
+                                               stat.st_mtime_ns):
+            if previous is not None and stat.st_size < previous[0][0]:
+                # The file has been replaced
+                self.__declared_sizes.pop(name, None)
+            self.__last_change[name] = ((stat.st_size, stat.st_mtime_ns), now)
+            changed_since = now
+        else:
+            changed_since = previous[1]
+        settled = now - changed_since >= self.__settle_time
+
+        if stat.st_size == 0:
+            return False
+        if compression_type(path) is not None:
+            with self.__lock:
+                closed = name in self.__closed
+            return settled or closed
+        if self.__chunk_handler is not None:
+            # The file is processed while it is being written
+            return True
+        declared_size = self.__declared_sizes.get(name)
+        if declared_size is None:
+            try:
+                declared_size = _declared_size(path)
+            except OSError:
+                return settled
+            if declared_size is not None:
+                self.__declared_sizes[name] = declared_size
+        return stat.st_size == declared_size or settled
+
+    def scan(self):
+        """
+        Look for the files to process inside the directory and put them in
+        the queue; wait if the queue is full
+
+        Returns:
+            The number of files put in the queue
+        """
+        now = time.time()
+        names = sorted(entry.name for entry in os.scandir(self.__directory)
+                       if entry.is_file() and self.__matches(entry.name))
+        # Forget the files that have disappeared from the directory
+        listed = set(names)
+        for name in [n for n in self.__last_change if n not in listed]:
+            self.__forget(name)
+
+        n_of_queued = 0
+        for name in names:
+            if self.__stop.is_set():
+                break
+            path = join(self.__directory, name)
+            with self.__lock:
+                if name in self.__active:
+                    continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if self.__processed.is_done(name, stat):
+                self.__forget(name)
+                continue
+            if not self.__is_ready(path, stat, now):
+                continue
+            with self.__lock:
+                self.__active.add(name)
+            if not self.__put(name):
+                with self.__lock:
+                    self.__active.discard(name)
+                break
+            self.__forget(name)
+            n_of_queued += 1
+        return n_of_queued
+
+    def __matches(self, name):
+        return any(fnmatch.fnmatch(name, p) for p in self.__patterns)
+
+    def __forget(self, name):
+        """
+        Remove what is known about a file that is not waiting anymore
+        """
+        self.__last_change.pop(name, None)
+        self.__declared_sizes.pop(name, None)
+        with self.__lock:
+            self.__closed.discard(name)
+
+    def __put(self, name):
+        """
+        Put a file in the queue, waiting while the queue is full; return
+        False if the watcher has been stopped in the meantime
+        """
+        while not self.__stop.is_set():
+            try:
+                self.__queue.put(name, timeout=self.__poll_interval)
+                return True
+            except Full:
+                pass
+        return False
+
+    def __process(self, name):
+        """
+        Process a file; return its stat and the values to save, or None if
+        the processing has been interrupted by stop
+        """
+        path = join(self.__directory, name)
+        stat = os.stat(path)
+        if self.__handler is not None:
+            self.__processed.update(name, stat, 'running')
+            self.__handler(path, IasiL1cNativeFile(path))
+            return os.stat(path), {}
+
+        entry = self.__processed.get(name)
+        first_line = 0
+        if entry is not None and entry['status'] != 'failed' and \
+                entry['size'] <= stat.st_size:
+            # Resume from the first group of scan lines not yet processed
+            first_line = entry.get('lines', 0)
+        if compression_type(path) is not None:
+            iasi_file = IasiL1cNativeFile(path)
+        else:
+            iasi_file = IasiL1cNativeFile(path, follow=True)
+
+        last_change = time.time()
+        while True:
+            if self.__stop.is_set():
+                return None
+            n_of_changes = self.__n_of_changes
+            lines = slice(first_line, iasi_file.n_of_lines)
+            for chunk in iasi_file.iter_chunks(self.__fields,
+                                               self.__lines_per_chunk,
+                                               lines=lines):
+                self.__chunk_handler(path, iasi_file, chunk)
+                first_line = chunk['lines'].stop
+                self.__processed.update(name, stat, 'running',
+                                        lines=first_line)
+            if compression_type(path) is not None or iasi_file.complete:
+                break
+            self.__wait_for_changes(n_of_changes)
+            if iasi_file.refresh().stop > first_line:
+                last_change = time.time()
+                stat = os.stat(path)
+            elif time.time() - last_change >= self.__settle_time:
+                break
+        return os.stat(path), {'lines': first_line}
+
+    def __worker(self):
+        while not self.__stop.is_set():
+            try:
+                name = self.__queue.get(timeout=self.__poll_interval)
+            except Empty:
+                continue
+            if name is None:
+                # Sent by stop to wake the worker
+                self.__queue.task_done()
+                continue
+            try:
+                result = self.__process(name)
+                if result is not None:
+                    stat, values = result
+                    self.__processed.update(name, stat, 'done', **values)
+            except Exception as e:
+                logger.exception('Error while processing %s', name)
+                try:
+                    stat = os.stat(join(self.__directory, name))
+                    self.__processed.update(name, stat, 'failed',
+                                            error='{}: {}'.format(
+                                                type(e).__name__, e))
+                except OSError:
+                    pass
+            finally:
+                with self.__lock:
+                    self.__active.discard(name)
+                self.__queue.task_done()
+
+    def __wait_for_changes(self, n_of_changes):
+        """
+        Wait until inotify reports a change after the first n_of_changes
+        (or at most poll_interval seconds)
+        """
+        with self.__changes:
+            if self.__n_of_changes == n_of_changes and \
+                    not self.__stop.is_set():
+                self.__changes.wait(self.__poll_interval)
+
+    def __notify_changes(self):
+        with self.__changes:
+            self.__n_of_changes += 1
+            self.__changes.notify_all()
+
+    def __handle_events(self, events):
+        with self.__lock:
+            for mask, name in events:
+                if not self.__matches(name):
+                    continue
+                if mask & (_IN_CLOSE_WRITE | _IN_MOVED_TO):
+                    self.__closed.add(name)
+                elif mask & (_IN_MODIFY | _IN_CREATE):
+                    self.__closed.discard(name)
+        if events:
+            self.__notify_changes()
+
+    def __scanner(self, inotify):
+        try:
+            while not self.__stop.is_set():
+                self.scan()
+                if inotify is None:
+                    self.__stop.wait(self.__poll_interval)
+                else:
+                    self.__handle_events(inotify.read(self.__poll_interval))
+        finally:
+            if inotify is not None:
+                inotify.close()
+
+    def start(self):
+        """
+        Start the threads of the workers and the thread that scans the
+        directory, and return immediately
+        """
+        self.__stop.clear()
+        self.__threads = [Thread(target=self.__worker, daemon=True)
+                          for _ in range(self.__n_workers)]
+        if self.__use_inotify:
+            self.__inotify = _open_inotify(self.__directory)
+        self.__threads.append(Thread(target=self.__scanner,
+                                     args=(self.__inotify,), daemon=True))
+        for thread in self.__threads:
+            thread.start()
+
+    def stop(self, wait=True):
+        """
+        Stop scanning the directory; the workers end after the current file
+        (a file processed a group of scan lines at a time is stopped after
+        the current group and it is resumed at the next start)
+        """
+        self.__stop.set()
+        self.__notify_changes()
+        if self.__inotify is not None:
+            self.__inotify.wake()
+            self.__inotify = None
+        for _ in range(self.__n_workers):
+            try:
+                self.__queue.put_nowait(None)
+            except Full:
+                # The workers are busy and they will see the stop soon
+                break
+        if wait:
+            for thread in self.__threads:
+                thread.join()
+        self.__threads = []
+        self.__processed.flush()
+
+    def run(self):
+        """
+        Start the watcher and wait until the process is interrupted
+        """
+        self.start()
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+
+def convert_handler(output_dir, fields=tuple(FBF_FILE_NAMES),
+                    data_types=None, lines_per_chunk=1):
+    """
+    Return a handler for a DirectoryWatcher that saves some fields of every
+    file on flat binary files (see IasiL1cNativeFile.save_all), inside a
+    subdirectory of output_dir with the same name of the file
+
+    Args:
+        - *output_dir*: the directory where the subdirectories are created
+        - *fields*: the fields to save
+        - *data_types*: a dictionary with the data types of some fields
+        - *lines_per_chunk*: the number of scan lines read at a time
+
+    Returns:
+        A function
+    """
+    def handler(path, iasi_file):
+        file_output_dir = join(output_dir, os.path.basename(path))
+        if not os.path.isdir(file_output_dir):
+            os.makedirs(file_output_dir)
+        iasi_file.save_all(file_output_dir, fields, data_types,
+                           lines_per_chunk=lines_per_chunk)
+    return handler